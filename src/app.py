@@ -15,10 +15,17 @@ from flask_cors import CORS
 from concurrent.futures import ThreadPoolExecutor
 from app import create_app, start_grading_server, run_startup_scripts
 from app.grading import done_grading
-from app.portServiceChecker import get_logs, waitForService, checkServiceLoop, checkLocalPortLoop
-from app.extensions import globals, logger
+from app.portServiceChecker import get_logs, checkLocalPortLoop
+from app.serviceMonitor import service_monitor
+from app.resolver import resolver
+from app.serviceHistory import service_history
+from app.extensions import globals, logger, notifier
+from app.tokenStore import token_store
+from app.gradingCache import grading_cache
+from app.gradingPlugins import preload_entry_points
 from app.globals import Globals
-from app.databaseHelpers import initialize_db
+from app.databaseHelpers import compact_solve_events, initialize_db
+from app.eventWriter import EventWriter
 
 
 LOG_LEVELS = {
@@ -83,6 +90,7 @@ if __name__ == '__main__':
     parser.add_argument('--debug', action='store_true', help="Enable debug logging. This overrides --log-level.")
     parser.add_argument('--log-level', help="Set the log level to : DEBUG, INFO, WARNING, ERROR, CRITICAL.",
                         default="INFO")
+    parser.add_argument('--compact-db', action='store_true', help="Remove duplicate solve events from an existing challenge.db and exit.")
     args = parser.parse_args()
 
     log_level = valid_log_level(args.log_level)
@@ -92,18 +100,41 @@ if __name__ == '__main__':
 
     configure_logging(log_level)
 
+    if args.compact_db:
+        with app.app_context():
+            compact_solve_events()
+        sys.exit(0)
+
     CORS(app)
-    globals.executor = Executor(app)
-    globals.executor.add_default_done_callback(done_grading)
 
     # Read the configuration
     logger.info(f"Starting up")
     logger.info("Operating in a Workspace" if globals.in_workspace else "Operating in a Gamespace")
     Globals.from_yaml(globals)
 
+    # Grading jobs run on the executor. grading.workers sets how many run at once.
+    app.config['EXECUTOR_MAX_WORKERS'] = globals.grading_workers
+    globals.executor = Executor(app)
+    globals.executor.add_default_done_callback(done_grading)
+    notifier.max_subscribers = globals.max_event_streams
+
+    # Read all tokens once so grading never waits on env/guestinfo/file lookups
+    token_store.prefetch()
+
+    grading_cache.enabled = globals.grading_cache_enabled
+    grading_cache.ttl = globals.grading_cache_ttl
+    grading_cache.max_entries = globals.grading_cache_size
+
+    # Import grading entry points (`module:function`) so errors are found before the site starts
+    preload_entry_points()
+
     # Initialize Database
     initialize_db(app, globals.conf)
 
+    # Start the background writer for EventTracker events
+    globals.event_writer = EventWriter(app, globals.event_queue_size, globals.event_batch_size, globals.event_flush_interval)
+    globals.event_writer.start()
+
     # Initialize xAPI engine
     if globals.xapi_enabled:
         from app.xapi import initialize_xapi_engine, get_current_level, xapi_api
@@ -123,13 +154,12 @@ if __name__ == '__main__':
     grading_server_thread = threading.Thread(target=start_grading_server, name="GradingServer", args=(app,))
     grading_server_thread.start()
 
-    # wait for blocking services to come up
-    logger.debug(f"Waiting for blocking services to become available")
-    globals.blocking_threadpool.map(waitForService, globals.blocking_services)
-    globals.blocking_threadpool.shutdown(wait=True)
-    logger.info(f"All blocking services are available")
+    # hostnames of required services are resolved through one cache shared by every check, and results are kept in a fixed-size history
+    resolver.ttl = globals.service_check_dns_ttl
+    resolver.negative_ttl = globals.service_check_dns_negative_ttl
+    service_history.size = globals.service_check_history
 
-    # run startup scripts
+    # run startup scripts. Each one starts once the services it requires (and all blocking services) are available
     successes, errors = run_startup_scripts()
     if errors:
         logger.error(f"Startup scripts exited with error(s): {list(errors.keys())}")
@@ -147,9 +177,10 @@ if __name__ == '__main__':
         port_checker_thread.start()
 
     if globals.required_services:
-        # run a thread that will periodically check on all required services
-        service_check_pool = ThreadPoolExecutor(thread_name_prefix="ServiceCheck")
-        service_check_pool.map(checkServiceLoop, globals.required_services)
+        # periodically check on all required services from a single event loop thread
+        service_monitor.max_concurrent = globals.service_check_concurrency
+        service_monitor.timeout = globals.service_check_timeout
+        service_monitor.start(globals.required_services)
 
     if globals.services_list:
         # run a thread that will periodically get logs from required services
@@ -9,11 +9,16 @@
 #
 
 
-import threading, subprocess, signal, os, json, datetime, sys
+import threading, signal, os, json, datetime
 from flask import Flask, url_for, redirect, flash, request, Response
-from typing import Tuple
+from typing import Optional, Tuple
 from flaskConfig import FlaskConfig
-from app.cron import run_cron_thread
+from app.cron import schedule_cron_grading
+from app.databaseHelpers import configure_sqlite
+from app.eventWriter import record_event
+from app.residentGrader import stop_resident_graders
+from app.startupScripts import startup_graph
+from app.tokenStore import token_store
 from app.extensions import globals, logger, db
 from app.models import EventTracker
 
@@ -40,6 +45,7 @@ def create_app(config_class: FlaskConfig = FlaskConfig) -> Flask:
     app.register_blueprint(info_blueprint,url_prefix='/info')
 
     db.init_app(app)
+    configure_sqlite(app)
     with app.app_context():
         db.create_all()
 
@@ -49,10 +55,22 @@ def create_app(config_class: FlaskConfig = FlaskConfig) -> Flask:
             """
 
             logger.info(f"Signal Received -- Shutting down site")
+            if globals.event_writer:
+                globals.event_writer.stop()
+            stop_resident_graders()
             os._exit(0)
         signal.signal(signal.SIGTSTP, signal_handler)
         signal.signal(signal.SIGINT, signal_handler)
 
+        def reload_tokens_handler(sig,frame) -> None:
+            """
+            Signal handler for re-reading tokens (SIGHUP)
+            """
+
+            logger.info(f"SIGHUP Received -- Reloading tokens")
+            threading.Thread(target=token_store.refresh, name="TokenRefresh", daemon=True).start()
+        signal.signal(signal.SIGHUP, reload_tokens_handler)
+
         @app.errorhandler(404)
         def page_not_found(e) -> Response:
             """
@@ -81,11 +99,12 @@ def create_app(config_class: FlaskConfig = FlaskConfig) -> Flask:
         def store_req() -> None:
             """
             Log user requests and submissions for analytics/auditing.
-            Excludes JS, CSS, and update endpoint requests.
-            Stores data in the EventTracker model and tracks submission counts.
+            Excludes JS, CSS, update, events and metrics endpoint requests.
+            Events are queued for the background event writer, which stores them in the
+            EventTracker model and tracks submission counts.
             """
 
-            if (not str(request.path).endswith('.js')) and (not str(request.path).endswith('.css')) and (not str(request.path).endswith('update')):
+            if (not str(request.path).endswith('.js')) and (not str(request.path).endswith('.css')) and (not str(request.path).endswith('update')) and (not str(request.path).endswith('events')) and (not str(request.path).endswith('metrics')):
                 with app.app_context():
                     event = (
                         "Request" if request.method == 'GET'
@@ -108,59 +127,30 @@ def create_app(config_class: FlaskConfig = FlaskConfig) -> Flask:
                         "path":f"{str(request.path)}",
                         "recorded_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                     }
-                    new_event = EventTracker(data=json.dumps(event_data))
-                    db.session.add(new_event)
-                    if event == 'Submission':
-                        try:
-                            sub_obj = EventTracker.query.filter_by(id=1).first()
-                            cur_cnt = json.loads(sub_obj.data)
-                            cur_cnt['number_submissions'] = str(int(cur_cnt['number_submissions'])+1)
-                            cur_cnt['recorded_at'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            sub_obj.data = json.dumps(cur_cnt)
-                        except Exception as e:
-                            logger.error(f"Exception trying increment submission counter. Exception: {str(e)}")
-                            sys.exit(1)
-                    db.session.commit()
+                    record_event(event_data)
     return app
 
 
 def run_startup_scripts() -> Tuple[dict[str,str], dict[str,str]]:
     """
-    Runs the startup scripts
+    Runs the startup scripts.
+    Independent scripts run concurrently (up to `startup.max_workers`), each once the services it requires are available; see app.startupScripts.
 
     Returns:
         Tuple[dict[str,str], dict[str,str]]: dictionaries that contain stdout / stderr for successful/failed startup scripts.
     """
 
-    successes = {}
-    errors = {}
+    scripts = globals.startup_scripts
 
     if (not globals.startup_workspace) and globals.in_workspace:
         logger.info("Startup scripts are disabled when running in a workspace. Skipping startup scripts")
-        return successes, errors
+        scripts = []
 
-    if (globals.startup_scripts == []) or (globals.startup_scripts == [None]) or (globals.startup_scripts == None):
+    elif not globals.startup_scripts:
         logger.error("Startup scripts disabled or no startup scripts configured in 'config.yml'.")
-        return successes, errors
-
-    for startup_script in globals.startup_scripts:
-        logger.debug(f"Calling {startup_script}")
-        if not os.path.isfile(f"{globals.custom_script_dir}/{startup_script}"):
-            logger.error(f"Startup script {startup_script} not found in 'custom_scripts' directory.")
-            errors[startup_script] = f"stdout: \tstderr: Starting script {startup_script} not found in 'custom_scripts' directory."
-            continue
-
-        # run the startup script and parse output into a dict
-        ## The output variable has properties output.stdout  and  output.stderr
-        try:
-            output = subprocess.run([f"{globals.custom_script_dir}/{startup_script}"], capture_output=True, check=True).stdout.decode('utf-8').replace("\n", r"\n")
-            logger.info(f"Stdout from Startup Script {startup_script}: {output}")
-            successes[startup_script] = output
-        # Something happened if there was a non-zero exit status. Log this and set fatal_error
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Startup script {startup_script} returned with non-zero exit status {e.returncode}.\tStdout: {e.stdout}\tStderr: {e.stderr}")
-            errors[startup_script] = f"stdout: {e.stdout}\tstderr: {e.stderr}"
-    return successes, errors
+
+    # with no scripts to run, this still waits for the blocking services
+    return startup_graph.run(scripts, globals.startup_max_workers)
 
 
 def start_grading_server(app: Flask):
@@ -175,11 +165,6 @@ def start_grading_server(app: Flask):
         logger.info("Website features not enabled. Will serve disabled page from /.")
     else:
         logger.info(f"Starting grading server website with grading modes {globals.grading_mode}")
-        # if using the cron mode, we need to set the config variables and start/schedule the grading thread
-        if 'cron' in globals.grading_mode:
-            logger.info(f"Waiting {globals.cron_delay} seconds until executing cron-style grading")
-            cron_thread = threading.Timer(globals.cron_delay, run_cron_thread)
-            cron_thread.start()
 
     # Add first entry to DB to indicate that the server has started
     with app.app_context():
@@ -188,23 +173,64 @@ def start_grading_server(app: Flask):
             new_event = EventTracker(id=0, data=json.dumps(challenge_data))
             db.session.add(new_event)
             db.session.commit()
-        if not EventTracker.query.filter_by(id=1).first():
-            cnt_data = {"challenge":globals.challenge_name, "support_code":globals.support_code, "event_type":"Submission Counter","number_submissions":"0","recorded_at":datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            sub_counter = EventTracker(id=1, data=json.dumps(cnt_data))
-            db.session.add(sub_counter)
-            db.session.commit()
 
     globals.scheduler.init_app(app)
     globals.scheduler.start()
 
+    # if using the cron mode, schedule cron-style grading on the scheduler
+    if 'cron' in globals.grading_mode:
+        schedule_cron_grading()
+
     logger.info(f"Starting the Challenge Server.")
     ssl_context = None
     if globals.app_cert and globals.app_key:
         ssl_context = (globals.app_cert, globals.app_key)
 
+    if globals.app_server == 'threaded':
+        serve_threaded(app, ssl_context)
+        return
+
     app.run(
         host=globals.app_host,
         port=globals.app_port,
         debug=False,
         ssl_context=ssl_context
     )
+
+
+def serve_threaded(app: Flask, ssl_context: Optional[Tuple[str,str]] = None) -> None:
+    """
+    Serve the app with a pooled, multi-threaded production WSGI server (cheroot).
+    Everything stays in this process, so the grading state held in memory and the
+    background threads (cron, service checks, service logger) are only ever owned once.
+    Falls back to the Flask development server if cheroot is not installed.
+
+    Args:
+        app (Flask): The Flask app
+        ssl_context (Optional[Tuple[str,str]], optional): TLS (cert, key) paths. Defaults to None.
+    """
+
+    try:
+        from cheroot import wsgi
+    except ImportError:
+        logger.error("The 'threaded' app server requires the cheroot package. Falling back to the development server.")
+        app.run(host=globals.app_host, port=globals.app_port, debug=False, ssl_context=ssl_context)
+        return
+
+    server = wsgi.Server(
+        (globals.app_host, globals.app_port),
+        app,
+        numthreads=globals.app_threads,
+        max=globals.app_threads,
+        request_queue_size=globals.app_queue_size,
+        server_name=globals.challenge_name or "Challenge Server"
+    )
+    if ssl_context:
+        from cheroot.ssl.builtin import BuiltinSSLAdapter
+        server.ssl_adapter = BuiltinSSLAdapter(*ssl_context)
+
+    logger.info(f"Serving with the threaded server on {globals.app_host}:{globals.app_port} using {globals.app_threads} worker threads")
+    try:
+        server.start()
+    finally:
+        server.stop()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import threading, time
+from typing import Any, Iterable, Optional
+
+
+class ChallengeState:
+    """
+    Authoritative in-memory copy of the QuestionTracking and PhaseTracking tables.
+    Loaded once when the database is initialized. All reads are answered from memory and
+    callers (see app.databaseHelpers) write changes through to the database while holding `lock`.
+
+    Attributes:
+        lock (threading.RLock): Guards every read-modify-write of the state.
+        questions (dict[str, dict]): Question label -> response, q_type, solved, time_solved.
+        phases (dict[str, dict]): Phase label -> tasks, solved, time_solved.
+        loaded (bool): True once the state has been loaded from the database.
+        completion_recorded (bool): True once the "Challenge Completed" event has been recorded.
+        version (int): Increases every time results, tokens or phase change. Used to cache /challenge/update.
+        epoch (str): Identifies this server run so versions from before a restart are never reused.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+        self.questions: dict[str, dict[str, Any]] = {}
+        self.phases: dict[str, dict[str, Any]] = {}
+        self.loaded: bool = False
+        self.completion_recorded: bool = False
+        self.version: int = 0
+        self.epoch: str = format(time.time_ns(), 'x')
+
+
+    def load(self, questions: Iterable[Any], phases: Iterable[Any]) -> None:
+        """
+        Replace the state with rows read from the database.
+
+        Args:
+            questions (Iterable[Any]): QuestionTracking rows
+            phases (Iterable[Any]): PhaseTracking rows
+        """
+
+        with self.lock:
+            self.questions = {
+                q.label: {
+                    "response": q.response,
+                    "q_type": q.q_type,
+                    "solved": q.solved,
+                    "time_solved": q.time_solved
+                } for q in questions
+            }
+            self.phases = {
+                p.label: {
+                    "tasks": p.tasks.split(',') if p.tasks else [],
+                    "solved": p.solved,
+                    "time_solved": p.time_solved
+                } for p in phases
+            }
+            self.loaded = True
+
+
+    def question(self, label: str) -> Optional[dict[str, Any]]:
+        """
+        Get the state of a question.
+
+        Args:
+            label (str): Question label
+
+        Returns:
+            Optional[dict[str, Any]]: The question state, or None if the label is unknown.
+        """
+
+        return self.questions.get(label)
+
+
+    def phase(self, label: str) -> Optional[dict[str, Any]]:
+        """
+        Get the state of a phase.
+
+        Args:
+            label (str): Phase label
+
+        Returns:
+            Optional[dict[str, Any]]: The phase state, or None if the label is unknown.
+        """
+
+        return self.phases.get(label)
+
+
+    def all_solved(self) -> bool:
+        """
+        Returns:
+            bool: True if there is at least one question and every question is solved.
+        """
+
+        with self.lock:
+            return bool(self.questions) and all(q['solved'] for q in self.questions.values())
+
+
+    def solved(self) -> dict[str, list[tuple[str, str]]]:
+        """
+        Snapshot of everything that is solved.
+
+        Returns:
+            dict[str, list[tuple[str, str]]]: (label, time_solved) of solved questions and phases,
+                                              keyed by "Question Solved" and "Phase Solved".
+        """
+
+        with self.lock:
+            return {
+                "Question Solved": [(label, q['time_solved']) for label, q in self.questions.items() if q['solved']],
+                "Phase Solved": [(label, p['time_solved']) for label, p in self.phases.items() if p['solved']]
+            }
+
+
+    def bump(self) -> int:
+        """
+        Mark the grading results as changed.
+
+        Returns:
+            int: The new state version.
+        """
+
+        with self.lock:
+            self.version += 1
+            return self.version
@@ -8,143 +8,183 @@
 # DM24-0645
 #
 
-import datetime, os, sys, subprocess
+import datetime, threading
+from typing import Optional
 from app.databaseHelpers import record_solves
-from time import sleep
-from app.env import get_clean_env
-from app.extensions import globals, logger
-from app.grading import post_submission, read_token
+from app.cronProbes import cron_probes
+from app.extensions import challenge_state, globals, logger, notifier
+from app.grading import TOKEN_ERROR, call_grading_entry_point, post_submission, read_token, run_grading_command
+from app.gradingPlugins import is_entry_point
 
+cron_lock = threading.Lock()
+cron_attempts: dict[str, int] = {}
 
-def set_cron_vars(conf: dict) -> None:
-    """
-    Set the value of the cron global vars.
-    Try reading values from environment variables. Fall back to config file, then defaults or error.
 
-    Args:
-        conf (dict): Configuration dict
+def cron_job_id(schedule: dict) -> str:
     """
+    Args:
+        schedule (dict): Cron schedule (see Globals.cron_schedules)
 
-    # set cron grading script. Error if script is not defined or not executable
-    globals.grading_mode.append('cron')
-    globals.cron_grading_script = get_clean_env('CS_CRON_GRADING_SCRIPT') or conf['grading'].get('cron_grading_script')
-    if not globals.cron_grading_script:
-        logger.error(f"Cron grading not script defined.")
-        sys.exit(1)
-    logger.debug(f"Cron grading script: {globals.custom_script_dir}/{globals.cron_grading_script}")
-    try:
-        if not os.access(f"{globals.custom_script_dir}/{globals.cron_grading_script}", os.X_OK):
-            logger.error(f"Cron grading script {globals.custom_script_dir}/{globals.cron_grading_script} is not executable")
-            sys.exit(1)
-    except Exception as e:
-        logger.error(f"Got exception {e} while checking if grading script {globals.custom_script_dir}/{globals.cron_grading_script} is executable.")
-        sys.exit(1)
-
-    globals.cron_interval = int(get_clean_env('CS_CRON_INTERVAL') or conf['grading'].get('cron_interval') or 60)
-    logger.debug(f"cron_interval: {globals.cron_interval}")
-
-    globals.cron_limit = int(get_clean_env('CS_CRON_LIMIT') or conf['grading'].get('cron_limit') or -1)
-    logger.debug(f"cron_limit: {globals.cron_limit}")
-
-    globals.cron_delay = int(get_clean_env('CS_CRON_DELAY') or conf['grading'].get('cron_delay') or 0)
-    logger.debug(f"cron_delay: {globals.cron_delay}")
-
-    globals.cron_at = get_clean_env('CS_CRON_AT') or conf['grading'].get('cron_at') or None
-    logger.debug(f"cron_at: {globals.cron_at}")
-
-    # calculates the total delay by using the cron_at setting and adding it to the cron_delay
-    if globals.cron_at is not None:
-        globals.cron_type = "at"
-        time = globals.cron_at.split(':')
-        current_time = datetime.datetime.now()
-
-        start_time = datetime.datetime(current_time.year, current_time.month, current_time.day, hour=int(time[0]), minute=int(time[1]))
-        logger.debug(f"Cron style grading should begin at {start_time}")
-
-        time_diff = (start_time - current_time).total_seconds()
-    else:
-        globals.cron_type = "every"
-        time_diff = 0
+    Returns:
+        str: ID of the scheduler job for the schedule
+    """
 
-    globals.cron_delay = globals.cron_delay + time_diff
+    return f"Cron_Grading_{schedule['name']}"
 
 
-def do_cron_grade() -> tuple[dict,dict]:
+def first_run_time(schedule: dict, now: Optional[datetime.datetime] = None) -> datetime.datetime:
     """
-    Grading and token reading for cron style grading.
+    Calculate when a cron schedule first runs.
+    With `at` set, this is the next time the clock reads `at` (today if it has not passed yet, otherwise tomorrow).
+    The schedule's delay is added after that.
+
+    Args:
+        schedule (dict): Cron schedule
+        now (Optional[datetime.datetime], optional): Current time. Defaults to datetime.datetime.now().
+
+    Raises:
+        ValueError: If `at` is not in %H:%M format.
 
     Returns:
-        tuple[dict,dict]: Grading results
+        datetime.datetime: Time of the first run
     """
 
-    globals.fatal_error = False
+    now = now or datetime.datetime.now()
+    start = now
+    if schedule['at']:
+        at = datetime.datetime.strptime(str(schedule['at']).strip(), "%H:%M").time()
+        start = datetime.datetime.combine(now.date(), at)
+        if start < now:
+            start += datetime.timedelta(days=1)
+    return start + datetime.timedelta(seconds=schedule['delay'])
+
 
-    try:
-        out = subprocess.run([f"{globals.custom_script_dir}/{globals.cron_grading_script}"], capture_output=True, check=True)
-        logger.info(f"Grading script finished: {out}")
-        output = out.stdout.decode('utf-8')
+def do_cron_grade(schedule: dict) -> tuple[dict,dict,bool,bool]:
+    """
+    Grading and token reading for cron style grading.
+    If every part of the schedule has a probe and no probe fingerprint changed since the last grade, the previous results are reused.
+    Schedules run concurrently (and alongside manual grading), so the error state of this run is returned rather than stored in `globals.fatal_error`.
 
-    # Something happened if there was a non-zero exit status. Log this and set fatal_error
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Grading script {globals.manual_grading_script} returned with non-zero exit status {e.returncode}.\tStdout: {e.stdout}\tStderr: {e.stderr}")
-        globals.fatal_error = True
-        output = ""
+    Args:
+        schedule (dict): Cron schedule whose grading parts are graded
 
-    results = []
-    for sub in output.split('\n'):
-        if ':' in sub:
-            results.append(map(str.strip, sub.split(':', 1)))
+    Returns:
+        tuple[dict,dict,bool,bool]: Grading results, tokens, whether the previous results were reused and whether grading hit a fatal error
+    """
 
-    results = dict(results)
+    fatal_error = False
+    parts = schedule['parts']
+
+    previous, fingerprints = cron_probes.check(parts)
+    if previous is not None:
+        logger.debug(f"Probes for cron schedule {schedule['name']} are unchanged. Reusing previous results.")
+        results = previous
+    elif is_entry_point(schedule['script']):
+        results, fatal_error = call_grading_entry_point(schedule['script'], {})
+    else:
+        results, fatal_error = run_grading_command(schedule['script'], [f"{globals.custom_script_dir}/{schedule['script']}"], [], parts)
 
     # ensure all grading parts have a result
-    for grading_key in globals.grading_parts.keys():
-        if globals.grading_parts[grading_key]['mode'] != 'cron':
-            continue
+    for grading_key in parts:
         if grading_key not in results:
-            logger.info(f"Grading script, {globals.cron_grading_script}, did not yield a result for grading part {grading_key}. Assigning value of 'Failed'")
+            logger.info(f"Grading script, {schedule['script']}, did not yield a result for grading part {grading_key}. Assigning value of 'Failed'")
             results[grading_key] = "Failed"
 
     # for each result that is returned, check if success is in the message.
     # If success is in the message, then read and store the token for that check
-    end_results = results.copy()
+    end_results = {}
     tokens = {}
     for key, value in results.items():
-        if key not in globals.grading_parts.keys():
-            logger.debug(f"Found key in results that is not a grading part. Removing {key} from results dict. ")
-            del end_results[key]
+        if key not in parts:
+            logger.debug(f"Found key in results that is not a grading part of cron schedule {schedule['name']}. Removing {key} from results dict. ")
+            continue
+        end_results[key] = value
         if "success" in value.lower():
             tokens[key] = read_token(key)
         else:
             tokens[key] = "You did not earn a token for this part"
 
+    if previous is None and fingerprints:
+        cron_probes.record(fingerprints if not fatal_error else {}, end_results)
+
+    if globals.grader_post and TOKEN_ERROR in tokens.values():
+        fatal_error = True
+
     logger.debug(f"Grading Results: {end_results}")
     logger.debug(f"Grading tokens: {tokens}")
-    return end_results, tokens
+    return end_results, tokens, previous is not None, fatal_error
 
 
-def run_cron_thread() -> None:
+def run_cron_schedule(name: str) -> None:
     """
-    Run do_cron_grade on a timer via a thread (similar to a cron job)
+    Run one cron grading attempt for a schedule. Called by the scheduler.
     Post submissions if needed.
     Log grading attempts to the database.
+    Removes the schedule's job once its limit is reached.
+
+    Args:
+        name (str): Name of the cron schedule
     """
 
-    limit = globals.cron_limit
-    logger.info(f"Starting cron thread with interval {globals.cron_interval}. Grading is limited to running {limit} times.")
-
-    cron_attempts = 0
-    while globals.cron_limit != 0:
-        cron_attempts += 1
-        globals.cron_limit = globals.cron_limit - 1
-        globals.cron_submit_time = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
-        logger.debug(f"Starting cron grading attempt number {cron_attempts}")
-        globals.cron_results, tokens = do_cron_grade()
-        globals.tokens['cron'] = tokens
-        if globals.grader_post:
-            post_submission(tokens)
-        logger.info(f"Results of cron grading attempt number {cron_attempts}: {globals.cron_results}")
+    schedule = next(schedule for schedule in globals.cron_schedules if schedule['name'] == name)
+    with cron_lock:
+        cron_attempts[name] = attempt = cron_attempts.get(name, 0) + 1
+    submit_time = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+    logger.debug(f"Starting cron grading attempt number {attempt} for schedule {name}")
+    results, tokens, reused, fatal_error = do_cron_grade(schedule)
+
+    # schedules grade different parts, so merge their results into a new dict for readers
+    with cron_lock:
+        globals.cron_submit_time = submit_time
+        globals.cron_results = {**(globals.cron_results or {}), **results}
+        globals.tokens['cron'] = {**globals.tokens['cron'], **tokens}
+    if reused:
+        logger.info(f"Cron grading attempt number {attempt} for schedule {name} skipped because nothing changed: {results}")
+    else:
+        if globals.grader_post and not post_submission(tokens):
+            fatal_error = True
+        logger.info(f"Results of cron grading attempt number {attempt} for schedule {name}: {results}")
         # record solves to the database
-        globals.scheduler.add_job(id="Record_Solves",func=record_solves)
-        sleep(globals.cron_interval)
-    logger.info(f"The number of grading attempts ({limit}) has been exhausted. No more grading will take place.")
+        globals.scheduler.add_job(id="Record_Solves",func=record_solves,replace_existing=True)
+    # the results page shows the error state of the most recent grade
+    globals.fatal_error = fatal_error
+    challenge_state.bump()
+    notifier.publish('cron-result', {"submit_time": submit_time, "attempt": attempt, "schedule": name, "reused": reused, "fatal_error": fatal_error})
+
+    if schedule['limit'] >= 0 and attempt >= schedule['limit']:
+        logger.info(f"The number of grading attempts ({schedule['limit']}) for cron schedule {name} has been exhausted. No more grading will take place for it.")
+        globals.scheduler.remove_job(cron_job_id(schedule))
+
+
+def schedule_cron_grading() -> None:
+    """
+    Add a scheduler job for each cron grading schedule.
+    Runs are timed from the first run, so grading time does not delay later runs. A run is skipped rather
+    than overlapped if the previous one is still going, and runs missed while the server was busy are
+    coalesced into one.
+    """
+
+    for schedule in globals.cron_schedules:
+        if schedule['limit'] == 0:
+            logger.info(f"Cron schedule {schedule['name']} has a limit of 0. It will not run.")
+            continue
+        try:
+            start = first_run_time(schedule)
+        except ValueError:
+            logger.error(f"Invalid cron_at time {schedule['at']} for cron schedule {schedule['name']}. Use the format \"%H:%M\". The schedule will not run.")
+            continue
+        logger.info(f"Cron schedule {schedule['name']} grades {schedule['parts']} every {schedule['interval']} seconds starting at {start}. Grading is limited to running {schedule['limit']} times.")
+        globals.scheduler.add_job(
+            id=cron_job_id(schedule),
+            func=run_cron_schedule,
+            args=[schedule['name']],
+            trigger='interval',
+            seconds=schedule['interval'],
+            start_date=start,
+            next_run_time=start,
+            jitter=schedule['jitter'] or None,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=globals.cron_misfire_grace or schedule['interval'],
+            replace_existing=True
+        )
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import hashlib, os, subprocess, threading, time
+from typing import Optional
+import requests
+from app.extensions import globals, logger
+from app.gradingPlugins import get_entry_point, is_entry_point
+from app.resolver import connect
+from app.scriptRunner import run_script
+
+# Bytes of a web resource hashed by an http probe when the server sends no validators
+HTTP_PROBE_MAX_BODY = 1024 * 1024
+# Seconds after which a probed part is graded even if its fingerprint has not changed
+DEFAULT_PROBE_MAX_AGE = 600
+
+
+def probe_file(path: str) -> str:
+    """
+    Fingerprint a file by its SHA-256 digest.
+    """
+
+    if not os.path.isfile(path):
+        return "missing"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def probe_tcp(address: str, timeout: float) -> str:
+    """
+    Fingerprint a TCP port by whether it accepts connections.
+    The host is resolved through the cached resolver used by service checks.
+    """
+
+    host, port = address.rsplit(':', 1)
+    try:
+        connect(host, int(port), timeout)
+        return "open"
+    except OSError:
+        return "closed"
+
+
+def probe_http(url: str, timeout: float) -> Optional[str]:
+    """
+    Fingerprint a web resource by its status code and validators (ETag, Last-Modified, Content-Length) from a HEAD request.
+    If the server sends neither ETag nor Last-Modified (or does not support HEAD), the SHA-256 of the body from a GET request is used instead.
+    Returns None (always grade) if the body is larger than HTTP_PROBE_MAX_BODY.
+    """
+
+    response = requests.head(url, timeout=timeout, allow_redirects=True)
+    headers = response.headers
+    if response.status_code not in (405, 501) and (headers.get('ETag') or headers.get('Last-Modified')):
+        return f"{response.status_code}|{headers.get('ETag', '')}|{headers.get('Last-Modified', '')}|{headers.get('Content-Length', '')}"
+
+    digest = hashlib.sha256()
+    size = 0
+    with requests.get(url, timeout=timeout, allow_redirects=True, stream=True) as response:
+        for chunk in response.iter_content(chunk_size=65536):
+            size += len(chunk)
+            if size > HTTP_PROBE_MAX_BODY:
+                return None
+            digest.update(chunk)
+    return f"{response.status_code}|sha256:{digest.hexdigest()}"
+
+
+def probe_command(script: str, timeout: float) -> str:
+    """
+    Fingerprint the output of a probe script in the custom_scripts directory or a `module:function` entry point.
+    """
+
+    if is_entry_point(script):
+        return str(get_entry_point(script).load()())
+    output = run_script([os.path.join(globals.custom_script_dir, script)], timeout=timeout,
+                        max_output=globals.script_output_limit).stdout
+    return hashlib.sha256(output).hexdigest()
+
+
+def probe_fingerprint(part: str) -> Optional[str]:
+    """
+    Take the fingerprint of a cron grading part using its `probe` setting.
+
+    Args:
+        part (str): Grading part
+
+    Returns:
+        Optional[str]: The fingerprint, or None if the part has no probe or the probe failed.
+    """
+
+    part_conf = globals.grading_parts[part]
+    probe = part_conf.get('probe')
+    timeout = part_conf.get('probe_timeout', 10)
+    try:
+        if isinstance(probe, str):
+            return probe_command(probe, timeout)
+        if isinstance(probe, dict):
+            if 'file' in probe:
+                return probe_file(probe['file'])
+            if 'tcp' in probe:
+                return probe_tcp(probe['tcp'], timeout)
+            if 'http' in probe:
+                return probe_http(probe['http'], timeout)
+            if 'command' in probe:
+                return probe_command(probe['command'], timeout)
+    except (OSError, ValueError, subprocess.SubprocessError, requests.RequestException) as e:
+        logger.warning(f"Probe for grading part {part} failed. The part will be graded. Exception: {e!r}")
+    except Exception as e:
+        logger.error(f"Probe for grading part {part} raised an exception. The part will be graded. Exception: {e!r}")
+    return None
+
+
+class CronProbes:
+    """
+    Remembers the probe fingerprints and results of the last cron grade so a cron schedule
+    can skip its grading script when none of its parts' fingerprints have changed.
+    """
+
+    def __init__(self) -> None:
+        self.fingerprints: dict[str, str] = {}
+        self.results: dict[str, str] = {}
+        self.graded_at: dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.graded = 0
+        self.skipped = 0
+
+
+    def check(self, parts: list[str]) -> tuple[Optional[dict], dict]:
+        """
+        Probe the parts and compare against the last grade.
+        A schedule is only skipped if every part has a probe, every fingerprint is unchanged and
+        no part is older than its `probe_max_age`.
+
+        Args:
+            parts (list[str]): Grading parts of a cron schedule
+
+        Returns:
+            tuple[Optional[dict], dict]: The previous results if grading can be skipped (otherwise None) and the new fingerprints
+        """
+
+        if not parts or any(not globals.grading_parts[part].get('probe') for part in parts):
+            return None, {}
+        fingerprints = {part: probe_fingerprint(part) for part in parts}
+        now = time.monotonic()
+        with self.lock:
+            for part in parts:
+                max_age = globals.grading_parts[part].get('probe_max_age', DEFAULT_PROBE_MAX_AGE)
+                if (fingerprints[part] is None or part not in self.results
+                        or self.fingerprints.get(part) != fingerprints[part]
+                        or (max_age and now - self.graded_at[part] >= max_age)):
+                    self.graded += 1
+                    return None, fingerprints
+            self.skipped += 1
+            return {part: self.results[part] for part in parts}, fingerprints
+
+
+    def record(self, fingerprints: dict, results: dict) -> None:
+        """
+        Remember the fingerprints taken before a grade along with the grade's results.
+        Parts without a fingerprint are forgotten so they are graded next time.
+
+        Args:
+            fingerprints (dict): Grading part -> fingerprint from check()
+            results (dict): Grading part -> result
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            for part, result in results.items():
+                if fingerprints.get(part) is None:
+                    self.fingerprints.pop(part, None)
+                    self.results.pop(part, None)
+                    continue
+                self.fingerprints[part] = fingerprints[part]
+                self.results[part] = result
+                self.graded_at[part] = now
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of probed cron runs that were graded and skipped
+        """
+
+        return {
+            "graded": self.graded,
+            "skipped": self.skipped
+        }
+
+
+cron_probes = CronProbes()
@@ -10,15 +10,91 @@
 
 
 import datetime, json, sys
-from typing import Any
+from typing import Any, Optional
 from flask import current_app, Flask
-from app.extensions import db, globals, record_solves_lock, logger
-from app.models import EventTracker, PhaseTracking, QuestionTracking
+from sqlalchemy import event, text
+from app.eventWriter import record_event
+from app.extensions import challenge_state, db, globals, notifier, record_solves_lock, logger
+from app.models import EventTracker, PhaseTracking, QuestionTracking, SolveRecord
+
+
+# (kind, label) of every solve that already has a recorded event. Loaded from SolveRecords on first use.
+recorded_solves: Optional[set[tuple[str,str]]] = None
+
+
+def configure_sqlite(app: Flask) -> None:
+    """
+    Register the listener that applies the SQLite storage profile to every new database connection.
+
+    Args:
+        app (Flask): The Flask app
+    """
+
+    with app.app_context():
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
+
+
+def apply_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    Apply the configured SQLite pragmas to a new DBAPI connection.
+    Called by SQLAlchemy each time the pool opens a connection.
+
+    Args:
+        dbapi_connection (Any): The raw sqlite3 connection
+        connection_record (Any): SQLAlchemy pool connection record (unused)
+    """
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={globals.db_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={globals.db_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(globals.db_busy_timeout)}")
+        cursor.execute(f"PRAGMA mmap_size={int(globals.db_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(globals.db_cache_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def log_sqlite_pragmas() -> dict:
+    """
+    Startup self-check. Log the pragmas that are actually in effect on a pooled connection
+    and warn if they differ from the configured storage profile.
+    Must be called inside an app context.
+
+    Returns:
+        dict: Effective pragma values
+    """
+
+    synchronous_levels = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+    effective = {}
+    with db.engine.connect() as conn:
+        for pragma in ['journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size']:
+            effective[pragma] = conn.execute(text(f"PRAGMA {pragma}")).scalar()
+    effective['journal_mode'] = str(effective['journal_mode']).upper()
+    effective['synchronous'] = synchronous_levels.get(effective['synchronous'], effective['synchronous'])
+    logger.info(f"Database storage profile in effect: {effective}")
+
+    expected = {
+        'journal_mode': globals.db_journal_mode,
+        'synchronous': globals.db_synchronous,
+        'busy_timeout': globals.db_busy_timeout,
+        'mmap_size': globals.db_mmap_size,
+        'cache_size': globals.db_cache_size
+    }
+    for pragma, value in expected.items():
+        if effective[pragma] != value:
+            logger.warning(f"Database pragma {pragma} is {effective[pragma]} but {value} was configured.")
+    return effective
 
 
 def initialize_db(app: Flask, conf: dict) -> None:
             # Initialize phases & add to DB
         with app.app_context():
+            # Reconnect so every pooled connection uses the configured storage profile
+            db.engine.dispose()
+            log_sqlite_pragmas()
+
             if conf['grading'].get('phases'):
                 globals.phases_enabled = True
                 if ( not conf['grading'].get('phase_info') or (len(conf['grading']['phase_info']) == 0)):
@@ -29,11 +105,6 @@ def initialize_db(app: Flask, conf: dict) -> None:
                 if 'mini_challenge' in globals.phase_order:
                     tmp = globals.phase_order.pop(0)
                     globals.phase_order.append(tmp)
-                try:
-                    globals.current_phase = get_current_phase()
-                except KeyError as e:
-                    globals.current_phase = globals.phase_order[0]
-
                 p_restart = False
                 try:
                     p_chk = PhaseTracking.query.all()
@@ -72,32 +143,96 @@ def initialize_db(app: Flask, conf: dict) -> None:
                     logger.error(f"Unable to add question {key} to DB. Exception:{e}.\nExiting.")
                     sys.exit(1)
 
+            ## Load the in-memory question/phase state. All later reads are served from it.
+            challenge_state.load(QuestionTracking.query.all(), PhaseTracking.query.all() if globals.phases_enabled else [])
+            if globals.phases_enabled:
+                try:
+                    globals.current_phase = get_current_phase()
+                except KeyError as e:
+                    globals.current_phase = globals.phase_order[0]
+
 
 def record_solves() -> None:
     """
-    Record completed question data to the database.
+    Record newly solved questions and phases to the database.
+    Only questions/phases that do not have a SolveRecord yet are recorded, so each solve
+    produces exactly one "Question Solved"/"Phase Solved" event no matter how often this runs.
     """
 
+    global recorded_solves
     with record_solves_lock:
         with globals.scheduler.app.app_context():
-            objs = {
-                "Question Solved": QuestionTracking.query.all(),
-                "Phase Solved":PhaseTracking.query.all()
-            }
-            for k,v in objs.items():
-                for q in v:
-                    if q.solved == True:
-                        cur_data = {
-                            "challenge":globals.challenge_name,
-                            "support_code":globals.support_code,
-                            "event_type":k,
-                            k: q.label,
-                            "solved_at": q.time_solved,
-                            "recorded_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        }
-                        new_event = EventTracker(data=json.dumps(cur_data))
-                        db.session.add(new_event)
-            db.session.commit()
+            if recorded_solves is None:
+                recorded_solves = {(r.kind, r.label) for r in SolveRecord.query.all()}
+            new_solves = set()
+            for k,v in challenge_state.solved().items():
+                for label, time_solved in v:
+                    if (k, label) in recorded_solves:
+                        continue
+                    recorded_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    cur_data = {
+                        "challenge":globals.challenge_name,
+                        "support_code":globals.support_code,
+                        "event_type":k,
+                        k: label,
+                        "solved_at": time_solved,
+                        "recorded_at": recorded_at
+                    }
+                    db.session.add(EventTracker(data=json.dumps(cur_data)))
+                    db.session.add(SolveRecord(kind=k, label=label, solved_at=time_solved, recorded_at=recorded_at))
+                    new_solves.add((k, label))
+            if not new_solves:
+                return
+            try:
+                db.session.commit()
+                recorded_solves |= new_solves
+                logger.debug(f"Recorded {len(new_solves)} new solve(s): {sorted(new_solves)}")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Exception recording solves. Exception: {e}")
+
+
+def compact_solve_events() -> dict[str,int]:
+    """
+    One-shot compaction for databases written before solves were recorded incrementally.
+    Keeps only the earliest "Question Solved"/"Phase Solved" event for each question/phase,
+    deletes the duplicates, backfills SolveRecords and vacuums the database.
+    Must be called inside an app context.
+
+    Returns:
+        dict[str,int]: Number of solve events kept and removed
+    """
+
+    kept = {}
+    duplicates = []
+    candidates = EventTracker.query.filter(EventTracker.data.like('%Solved%')).order_by(EventTracker.id).all()
+    for row in candidates:
+        try:
+            data = json.loads(row.data)
+        except ValueError:
+            continue
+        kind = data.get('event_type')
+        if kind not in ("Question Solved", "Phase Solved"):
+            continue
+        key = (kind, data.get(kind))
+        if key in kept:
+            duplicates.append(row.id)
+        else:
+            kept[key] = data
+
+    for i in range(0, len(duplicates), 500):
+        EventTracker.query.filter(EventTracker.id.in_(duplicates[i:i+500])).delete(synchronize_session=False)
+    existing = {(r.kind, r.label) for r in SolveRecord.query.all()}
+    for (kind, label), data in kept.items():
+        if (kind, label) not in existing:
+            db.session.add(SolveRecord(kind=kind, label=label, solved_at=data.get('solved_at', '---'), recorded_at=data.get('recorded_at', '---')))
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+    logger.info(f"Compacted solve events. Kept {len(kept)}. Removed {len(duplicates)} duplicate(s).")
+    return {"kept": len(kept), "removed": len(duplicates)}
 
 
 def check_db(label: str) -> bool:
@@ -111,16 +246,16 @@ def check_db(label: str) -> bool:
         bool: Solved status.
     """
 
-    with current_app.app_context():
-        cur_question = QuestionTracking.query.filter_by(label=label).first()
-        if cur_question == None:
-            logger.error("Check Database: No entry found in DB while attempting to mark question completed. Exiting")
-            sys.exit(1)
-        return cur_question.solved
+    cur_question = challenge_state.question(label)
+    if cur_question == None:
+        logger.error("Check Database: No entry found in DB while attempting to mark question completed. Exiting")
+        sys.exit(1)
+    return cur_question['solved']
 
 
 def update_db(type_q: str, label: str = '', val: str = '') -> Any:
-    """Update database with question or phase status.
+    """Update question or phase status.
+    The in-memory state is updated and changes are written through to the database.
 
     Args:
         type_q (str): 'q' for question or 'p' for phase update
@@ -131,114 +266,123 @@ def update_db(type_q: str, label: str = '', val: str = '') -> Any:
         Any
     """
 
-    with current_app.app_context():
+    # xAPI statements are sent after the state lock is released, so readers never wait on the LRS
+    xapi_statement = None
+    with challenge_state.lock:
         if type_q == 'q':
             try:
-                cur_question = QuestionTracking.query.filter_by(label=label).first()
+                cur_question = challenge_state.question(label)
                 if cur_question == None:
                     logger.error("Update Database: No entry found in DB while attempting to mark question completed. Exiting")
                     sys.exit(1)
+                changes = {}
+                user_answer = ''
                 if '--' in val:
                     user_response, user_answer = val.split('--', 1)
-                    cur_question.response = user_response
-                if (val and '--' not in val) and (cur_question.response == ''):
-                    cur_question.response = "N/A"
-                was_solved = cur_question.solved
-
-                part_info = globals.grading_parts.get(label, {})
-                question_text = part_info.get('text', '')
-                question_mode = part_info.get('mode', '')
-                question_opts = {}
-                if question_mode == 'mc':
-                    question_opts = part_info.get('opts', {})
-                user_response = cur_question.response
+                    changes['response'] = user_response
+                if (val and '--' not in val) and (cur_question['response'] == ''):
+                    changes['response'] = "N/A"
+                was_solved = cur_question['solved']
 
                 if "success" in val.lower():
-                    cur_question.solved = True
-                    cur_question.time_solved = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+                    if not was_solved:
+                        changes['solved'] = True
+                        changes['time_solved'] = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
                     # xAPI: If newly solved, send statement with success set to True
                     if not was_solved and globals.xapi_enabled:
-                        from app.xapi import send_xapi_statement
-                        question_config = globals.grading_parts.get(label, {})
-                        send_xapi_statement(label, question_config, user_answer, True)
+                        xapi_statement = (label, globals.grading_parts.get(label, {}), user_answer, True)
                 else:
                     # xAPI: If newly failed, send statement with success set to False
                     if not was_solved and globals.xapi_enabled:
-                        from app.xapi import send_xapi_statement
-                        question_config = globals.grading_parts.get(label, {})
-                        send_xapi_statement(label, question_config, user_answer, False)
-                db.session.commit()
+                        xapi_statement = (label, globals.grading_parts.get(label, {}), user_answer, False)
+
+                changes = {k: v for k, v in changes.items() if cur_question[k] != v}
+                if changes:
+                    with current_app.app_context():
+                        QuestionTracking.query.filter_by(label=label).update(changes)
+                        db.session.commit()
+                    cur_question.update(changes)
+                    challenge_state.bump()
             except Exception as e:
                 logger.error(f"Exception updating DB with completed question. Exception: {e}. Exiting.")
                 sys.exit(1)
 
         else:
             for p in globals.phase_order:
-                phase = PhaseTracking.query.filter_by(label=p).first()
+                phase = challenge_state.phase(p)
                 if phase == None:
                     logger.error("No entry found in DB while attempting to find current phase during DB update. Exiting")
                     sys.exit(1)
-                if phase.solved == False:
-                    q_list = phase.tasks.split(',')
-                    num_q = len(q_list)
-                    for q in q_list:
-                        cur_q = QuestionTracking.query.filter_by(label=q).first()
+                if phase['solved'] == False:
+                    num_q = len(phase['tasks'])
+                    for q in phase['tasks']:
+                        cur_q = challenge_state.question(q)
                         if cur_q == None:
                             logger.error("No entry found in DB while attempting to update phase DB. Exiting")
                             sys.exit(1)
-                        if cur_q.solved == True:
+                        if cur_q['solved'] == True:
                             num_q -= 1
                     if num_q == 0:
-                        phase.solved = True
-                        phase.time_solved = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-                        db.session.commit()
+                        changes = {"solved": True, "time_solved": datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")}
+                        with current_app.app_context():
+                            PhaseTracking.query.filter_by(label=p).update(changes)
+                            db.session.commit()
+                        phase.update(changes)
+                        challenge_state.bump()
+                        notifier.publish('phase-advanced', {"phase": p})
                     else:
-                        globals.current_phase = phase.label
+                        if globals.current_phase != p:
+                            globals.current_phase = p
+                            challenge_state.bump()
                         return
 
+    if xapi_statement is not None:
+        from app.xapi import send_xapi_statement
+        send_xapi_statement(*xapi_statement)
+
 
 def get_current_phase() -> str:
     """Get the currently active phase.
 
     Raises:
-        KeyError: If PhaseTracking database table is empty or the current phase key does not exist.
+        KeyError: If there are no phases or the current phase key does not exist.
 
     Returns:
         str: The current phase or "completed"
     """
 
-    with current_app.app_context():
-        if not PhaseTracking.query.filter_by().all():
+    with challenge_state.lock:
+        if not challenge_state.phases:
             logger.info(f"PhaseTracking table is empty.")
             raise KeyError
         for phase in globals.phase_order:
-            cur_phase = PhaseTracking.query.filter_by(label=phase).first()
+            cur_phase = challenge_state.phase(phase)
             if cur_phase == None:
                 logger.error(f"Queried for phase key that does not exist. key: {phase}.")
                 raise KeyError
-            if cur_phase.solved == False:
-                globals.current_phase = cur_phase.label
-                return cur_phase.label
-        globals.challenge_completed == True
-        globals.challenge_completion_time = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+            if cur_phase['solved'] == False:
+                if globals.current_phase != phase:
+                    globals.current_phase = phase
+                    challenge_state.bump()
+                return phase
+        if not globals.challenge_completed:
+            globals.challenge_completed = True
+            globals.challenge_completion_time = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
         return "completed"
 
 
 def check_questions() -> None:
     """
-    Check all questions in the database to determine if the challenge is completed.
+    Check all questions to determine if the challenge is completed.
+    The "Challenge Completed" event is recorded once, when the challenge first becomes completed.
     """
 
-    with current_app.app_context():
-        solved_tracker = 0
-        questions = QuestionTracking.query.all()
-        expected = len(questions)
-        for q in questions:
-            if q.solved == True:
-                solved_tracker+= 1
-        if solved_tracker == expected:
-            globals.challenge_completed == True
-            globals.challenge_completion_time = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-            new_event = EventTracker(data=json.dumps({"challenge":globals.challenge_name, "support_code":globals.support_code, "event_type":"Challenge Completed","recorded_at":globals.challenge_completion_time}))
-            db.session.add(new_event)
-            db.session.commit()
+    if not challenge_state.all_solved():
+        return
+    with challenge_state.lock:
+        if challenge_state.completion_recorded:
+            return
+        challenge_state.completion_recorded = True
+        globals.challenge_completed = True
+        globals.challenge_completion_time = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+    record_event({"challenge":globals.challenge_name, "support_code":globals.support_code, "event_type":"Challenge Completed","recorded_at":globals.challenge_completion_time})
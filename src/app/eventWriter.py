@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import atexit, json, queue, threading, time
+from collections import Counter
+from typing import Optional
+from flask import Flask
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.extensions import db, globals, logger
+from app.models import EventTracker, SubmissionCounter
+
+
+def write_events(events: list[dict]) -> None:
+    """
+    Write a batch of events to the EventTracker table in a single transaction.
+    Must be called inside an app context.
+
+    Args:
+        events (list[dict]): Event data dicts to store
+    """
+
+    db.session.add_all([EventTracker(data=json.dumps(event)) for event in events])
+    db.session.commit()
+
+
+def count_submission(event: dict) -> None:
+    """
+    Add a submission event to the submission counters in its own short transaction.
+    Counting does not go through the event queue, so submissions are counted even if their event is dropped or its batch fails.
+    Must be called inside an app context.
+
+    Args:
+        event (dict): Submission event data
+    """
+
+    counts = Counter(total=1)
+    form_data = event.get('submitted_form_data')
+    if isinstance(form_data, dict):
+        for key, value in form_data.items():
+            if globals.grading_parts and key in globals.grading_parts and value != '':
+                counts[key] += 1
+    try:
+        increment_counters(counts)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to count submission: {e!r}")
+
+
+def increment_counters(counts: dict[str,int]) -> None:
+    """
+    Add to the submission counters using one atomic upsert per counter (`count = count + n`).
+    The caller is responsible for committing.
+
+    Args:
+        counts (dict[str,int]): Counter name to amount to add
+    """
+
+    for name, amount in counts.items():
+        if not amount:
+            continue
+        stmt = sqlite_insert(SubmissionCounter).values(name=name, count=amount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SubmissionCounter.name],
+            set_={"count": SubmissionCounter.count + amount}
+        )
+        db.session.execute(stmt)
+
+
+def get_submission_counts() -> dict:
+    """
+    Read the submission counters.
+    Must be called inside an app context.
+
+    Returns:
+        dict: Total number of submissions and the number of submissions for each grading part
+    """
+
+    counters = {c.name: c.count for c in SubmissionCounter.query.all()}
+    per_part = {part: counters.get(part, 0) for part in (globals.grading_parts or {})}
+    return {
+        "total": counters.get('total', 0),
+        "parts": per_part
+    }
+
+
+def record_event(event_data: dict) -> None:
+    """
+    Record an event to the EventTracker table.
+    Events are queued for the background writer when it is running.
+    Otherwise they are written immediately.
+    Submission events are counted immediately either way (see count_submission).
+
+    Args:
+        event_data (dict): Event data to store
+    """
+
+    if event_data.get('event_type') == 'Submission':
+        count_submission(event_data)
+    if globals.event_writer and globals.event_writer.running:
+        globals.event_writer.put(event_data)
+        return
+    write_events([event_data])
+
+
+class EventWriter:
+    """
+    Writes EventTracker rows from a background thread so requests never wait on a database commit.
+    Events are placed on a bounded in-memory queue and flushed in one transaction every
+    `flush_interval` milliseconds or as soon as `batch_size` events are waiting.
+    Events that arrive while the queue is full are dropped and counted.
+    """
+
+    def __init__(self, app: Flask, queue_size: int = 10000, batch_size: int = 100, flush_interval: int = 500) -> None:
+        """
+        Args:
+            app (Flask): The Flask app (used for the database app context)
+            queue_size (int, optional): Maximum number of queued events. Defaults to 10000.
+            batch_size (int, optional): Maximum number of events per transaction. Defaults to 100.
+            flush_interval (int, optional): Milliseconds to wait before flushing a partial batch. Defaults to 500.
+        """
+
+        self.app = app
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0, flush_interval) / 1000
+        self.running = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+
+    def start(self) -> None:
+        """
+        Start the writer thread.
+        """
+
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="EventWriter", daemon=True)
+        self._thread.start()
+        self.running = True
+        atexit.register(self.stop)
+        logger.info(f"Event writer started (queue size {self.queue.maxsize}, batch size {self.batch_size}, flush interval {int(self.flush_interval * 1000)}ms)")
+
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the writer thread and flush any events still in the queue.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the writer thread to finish. Defaults to 5.
+        """
+
+        if not self.running:
+            return
+        self.running = False
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        while not self.queue.empty():
+            self._flush(self._drain(self.batch_size))
+        logger.info(f"Event writer stopped. Events written: {self.written}. Events dropped: {self.dropped + self.failed}")
+
+
+    def put(self, event_data: dict) -> bool:
+        """
+        Queue an event without blocking.
+
+        Args:
+            event_data (dict): Event data to store
+
+        Returns:
+            bool: True if the event was queued. False if the queue was full and the event was dropped.
+        """
+
+        try:
+            self.queue.put_nowait(event_data)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"Event queue is full. {self.dropped} event(s) dropped so far.")
+            return False
+
+
+    def stats(self) -> dict:
+        """
+        Current writer metrics.
+
+        Returns:
+            dict: Queue depth, capacity and written/dropped/failed counters
+        """
+
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes
+        }
+
+
+    def _drain(self, limit: int) -> list[dict]:
+        """
+        Take up to `limit` events from the queue without blocking.
+        """
+
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+    def _run(self) -> None:
+        """
+        Writer loop. Waits for the first event, then collects a batch until it is full or the flush interval passes.
+        """
+
+        while not self._stop.is_set():
+            try:
+                batch = [self.queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+
+    def _flush(self, batch: list[dict]) -> None:
+        """
+        Write a batch of events in one transaction.
+        """
+
+        if not batch:
+            return
+        with self._flush_lock:
+            with self.app.app_context():
+                try:
+                    write_events(batch)
+                    self.written += len(batch)
+                    self.flushes += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.failed += len(batch)
+                    logger.error(f"Failed to write {len(batch)} event(s) to the database. Exception: {e}")
+                finally:
+                    db.session.remove()
@@ -15,12 +15,20 @@
 import logging
 from flask_sqlalchemy import SQLAlchemy
 from threading import Lock
+from app.challengeState import ChallengeState
 from app.globals import Globals
+from app.notifier import EventBroker
 
 # Create database object
 db = SQLAlchemy()
 record_solves_lock = Lock()
 
+# In-memory question/phase state (write-through to QuestionTracking/PhaseTracking)
+challenge_state = ChallengeState()
+
+# Pushes grading events to connected browsers (/challenge/events)
+notifier = EventBroker()
+
 # Instantiate globals object
 globals = Globals()
 
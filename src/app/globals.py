@@ -9,13 +9,16 @@
 #
 
 
-import os, sys, yaml, socket, logging
+import os, re, sys, yaml, socket, logging
 from flask_apscheduler import APScheduler
 from datetime import timedelta, time
 from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Set, Union
 from app.env import get_clean_env
 
+# Grading scripts given as `module:function` are Python entry points (see app.gradingPlugins)
+ENTRY_POINT_PATTERN = re.compile(r'^[A-Za-z_][\w.]*:[A-Za-z_]\w*$')
+
 class Globals:
     """
     Defines globally accessible variables and resolves them via environment -> config -> default.
@@ -28,6 +31,10 @@ class Globals:
         self.VALID_TOKEN_LOCATIONS: List[str] = ['env', 'guestinfo', 'file']
         self.VALID_SUBMISSION_METHODS: List[str] = ['display', 'grader_post']
         self.VALID_SERVICE_TYPES: List[str] = ['ping', 'socket', 'web']
+        self.VALID_APP_SERVERS: List[str] = ['development', 'threaded']
+        self.VALID_JOURNAL_MODES: List[str] = ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF']
+        self.VALID_SYNCHRONOUS_LEVELS: List[str] = ['OFF', 'NORMAL', 'FULL', 'EXTRA']
+        self.VALID_PROBE_TYPES: List[str] = ['file', 'tcp', 'http', 'command']
 
         # Directories
         self.basedir: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -42,6 +49,11 @@ class Globals:
         self.app_port: int = 8888
         self.app_cert: Optional[str] = None
         self.app_key: Optional[str] = None
+        self.app_server: str = "development"
+        self.app_threads: int = 16
+        self.app_queue_size: int = 128
+        self.max_event_streams: int = 8
+        self.event_stream_timeout: int = 300
         self.challenge_name: str = ""
         self.port_checker: bool = False
         self.grading_enabled: bool = False
@@ -58,15 +70,35 @@ class Globals:
         self.in_workspace: bool = "workspace" in self.challenge_code
 
         self.startup_workspace: bool = False
-        self.startup_scripts: List[str] = []
+        self.startup_scripts: List[dict] = []
+        self.startup_parallel: bool = False
+        self.startup_max_workers: int = 4
         self.required_services: List[dict] = []
         self.blocking_services: List[dict] = []
         self.blocking_threadpool = ThreadPoolExecutor(thread_name_prefix="BlockingServices")
+        self.service_check_concurrency: int = 64
+        self.service_check_timeout: int = 5
+        self.service_check_dns_ttl: int = 60
+        self.service_check_dns_negative_ttl: int = 10
+        self.service_check_history: int = 1440
 
         self.grading_mode: List[str] = []
         self.manual_grading_script: Optional[str] = None
         self.cron_grading_script: Optional[str] = None
         self.grading_rateLimit: timedelta = timedelta(seconds=0)
+        self.script_timeout: int = 300
+        self.script_cpu_limit: int = 0
+        self.script_memory_limit: int = 0
+        self.script_output_limit: int = 1048576
+        self.startup_timeout: int = 0
+        self.resident_grading: bool = False
+        self.resident_timeout: int = 60
+        self.grading_workers: int = 1
+        self.part_workers: int = 4
+        self.part_grading_pool: Optional[ThreadPoolExecutor] = None
+        self.grading_cache_enabled: bool = False
+        self.grading_cache_ttl: int = 300
+        self.grading_cache_size: int = 1024
         self.grading_parts: Optional[dict] = None
         self.question_order: List[str] = []
         self.token_location: str = "env"
@@ -87,6 +119,9 @@ class Globals:
         self.cron_delay: Optional[int] = None
         self.cron_at: Optional[str] = None
         self.cron_type: Optional[str] = None
+        self.cron_jitter: int = 0
+        self.cron_misfire_grace: int = 0
+        self.cron_schedules: List[dict] = []
 
         # Runtime values
         now = time().strftime("%m/%d/%Y %H:%M:%S")
@@ -105,9 +140,9 @@ class Globals:
 
         # Server state
         self.fatal_error: bool = False
-        self.task: Optional[str] = None
         self.server_ready: bool = False
         self.executor = None
+        self.event_writer = None
         self.scheduler: APScheduler = APScheduler()
 
         # xAPI Configuration
@@ -133,6 +168,16 @@ class Globals:
         # Grading uploads
         self.grading_uploads: Dict = {}
 
+        # Database / event tracking
+        self.event_queue_size: int = 10000
+        self.event_batch_size: int = 100
+        self.event_flush_interval: int = 500
+        self.db_journal_mode: str = "WAL"
+        self.db_synchronous: str = "NORMAL"
+        self.db_busy_timeout: int = 5000
+        self.db_mmap_size: int = 67108864
+        self.db_cache_size: int = -16000
+
 
     def __repr__(self) -> str:
         """
@@ -322,6 +367,14 @@ class Globals:
         self.app_port = self.resolve_port('CS_APP_PORT', conf.get('app', {}).get('port'), 8888)
         self.app_cert = self.resolve('CS_APP_CERT', conf.get('app', {}).get('tls_cert'))
         self.app_key = self.resolve('CS_APP_KEY', conf.get('app', {}).get('tls_key'))
+        self.app_server = self.resolve('CS_APP_SERVER', conf.get('app', {}).get('server'), 'development').lower()
+        if self.app_server not in self.VALID_APP_SERVERS:
+            logging.warning(f"Invalid app server '{self.app_server}'. Valid servers are {self.VALID_APP_SERVERS}. Defaulting to 'development'")
+            self.app_server = 'development'
+        self.app_threads = self.resolve_int('CS_APP_THREADS', conf.get('app', {}).get('threads'), 16)
+        self.app_queue_size = self.resolve_int('CS_APP_QUEUE_SIZE', conf.get('app', {}).get('queue_size'), 128)
+        self.max_event_streams = self.resolve_int('CS_MAX_EVENT_STREAMS', conf.get('app', {}).get('max_event_streams'), max(1, self.app_threads // 2))
+        self.event_stream_timeout = self.resolve_int('CS_EVENT_STREAM_TIMEOUT', conf.get('app', {}).get('event_stream_timeout'), 300)
         self.challenge_name = self.resolve('CS_CHALLENGE_NAME', conf.get('challenge_name'), "Challenge Server")
         self.port_checker = self.resolve_bool('CS_PORT_CHECKER', conf.get('port_checker'), False)
         self.grading_enabled = self.resolve_bool('CS_GRADING_ENABLED', conf.get('grading').get('enabled'), False)
@@ -331,10 +384,49 @@ class Globals:
         if (self.grading_enabled) and (conf.get('grading').get('cron_grading', False)):
             self.cron_grading_script = self.resolve('CS_CRON_GRADING',conf.get('grading').get('cron_grading_script'))
             self.grading_mode.append('cron')
+        self.cron_interval = max(1, self.resolve_int('CS_CRON_INTERVAL', conf.get('grading').get('cron_interval'), 60))
+        self.cron_limit = self.resolve_int('CS_CRON_LIMIT', conf.get('grading').get('cron_limit'), -1)
+        self.cron_delay = self.resolve_int('CS_CRON_DELAY', conf.get('grading').get('cron_delay'), 0)
+        self.cron_at = self.resolve('CS_CRON_AT', conf.get('grading').get('cron_at'), None)
+        self.cron_type = "at" if self.cron_at else "every"
+        self.cron_jitter = self.resolve_int('CS_CRON_JITTER', conf.get('grading').get('cron_jitter'), 0)
+        self.cron_misfire_grace = self.resolve_int('CS_CRON_MISFIRE_GRACE', conf.get('grading').get('cron_misfire_grace'), 0)
+        self.script_timeout = self.resolve_int('CS_GRADING_SCRIPT_TIMEOUT', conf.get('grading').get('script_timeout'), 300)
+        self.script_cpu_limit = self.resolve_int('CS_GRADING_SCRIPT_CPU_LIMIT', conf.get('grading').get('script_cpu_limit'), 0)
+        self.script_memory_limit = self.resolve_int('CS_GRADING_SCRIPT_MEMORY_LIMIT', conf.get('grading').get('script_memory_limit'), 0)
+        self.script_output_limit = self.resolve_int('CS_GRADING_SCRIPT_OUTPUT_LIMIT', conf.get('grading').get('script_output_limit'), 1048576)
+        self.resident_grading = self.resolve_bool('CS_GRADING_RESIDENT', conf.get('grading').get('resident'), False)
+        self.resident_timeout = self.resolve_int('CS_GRADING_RESIDENT_TIMEOUT', conf.get('grading').get('resident_timeout'), 60)
+        self.grading_workers = max(1, self.resolve_int('CS_GRADING_WORKERS', conf.get('grading').get('workers'), 1))
+        self.part_workers = max(1, self.resolve_int('CS_GRADING_PART_WORKERS', conf.get('grading').get('part_workers'), 4))
+        # one pool for the part scripts of every grading job, so concurrent jobs share the part_workers limit
+        self.part_grading_pool = ThreadPoolExecutor(max_workers=self.part_workers, thread_name_prefix="PartGrading")
+        cache_conf = conf.get('grading').get('cache') or {}
+        self.grading_cache_enabled = self.resolve_bool('CS_GRADING_CACHE', cache_conf, False)
+        self.grading_cache_ttl = self.resolve_int('CS_GRADING_CACHE_TTL', cache_conf.get('ttl') if isinstance(cache_conf, dict) else None, 300)
+        self.grading_cache_size = self.resolve_int('CS_GRADING_CACHE_SIZE', cache_conf.get('max_entries') if isinstance(cache_conf, dict) else None, 1024)
         self.startup_workspace = conf.get('startup', {}).get('runInWorkspace',False)
-        self.startup_scripts = conf.get('startup', {}).get('scripts',[])
+        self.startup_parallel = self.resolve_bool('CS_STARTUP_PARALLEL', conf.get('startup', {}).get('parallel'), False)
+        self.startup_max_workers = max(1, self.resolve_int('CS_STARTUP_MAX_WORKERS', conf.get('startup', {}).get('max_workers'), 4))
+        self.startup_scripts = self._load_startup_scripts(conf.get('startup', {}).get('scripts') or [])
+        self.startup_timeout = self.resolve_int('CS_STARTUP_TIMEOUT', conf.get('startup', {}).get('timeout'), 0)
         self.manual_grading_script = self.resolve('CS_MANUAL_GRADING_SCRIPT', conf.get('grading').get('manual_grading_script'))
         self.hosted_files_enabled = self.resolve_bool('CS_HOSTED_FILES', conf.get('hosted_files'), False)
+        database_conf = conf.get('database', {}) or {}
+        self.event_queue_size = self.resolve_int('CS_EVENT_QUEUE_SIZE', database_conf.get('event_queue_size'), 10000)
+        self.event_batch_size = self.resolve_int('CS_EVENT_BATCH_SIZE', database_conf.get('event_batch_size'), 100)
+        self.event_flush_interval = self.resolve_int('CS_EVENT_FLUSH_INTERVAL', database_conf.get('event_flush_interval'), 500)
+        self.db_journal_mode = str(self.resolve('CS_DB_JOURNAL_MODE', database_conf.get('journal_mode'), 'WAL')).upper()
+        if self.db_journal_mode not in self.VALID_JOURNAL_MODES:
+            logging.warning(f"Invalid database journal_mode '{self.db_journal_mode}'. Valid modes are {self.VALID_JOURNAL_MODES}. Defaulting to 'WAL'")
+            self.db_journal_mode = 'WAL'
+        self.db_synchronous = str(self.resolve('CS_DB_SYNCHRONOUS', database_conf.get('synchronous'), 'NORMAL')).upper()
+        if self.db_synchronous not in self.VALID_SYNCHRONOUS_LEVELS:
+            logging.warning(f"Invalid database synchronous level '{self.db_synchronous}'. Valid levels are {self.VALID_SYNCHRONOUS_LEVELS}. Defaulting to 'NORMAL'")
+            self.db_synchronous = 'NORMAL'
+        self.db_busy_timeout = self.resolve_int('CS_DB_BUSY_TIMEOUT', database_conf.get('busy_timeout'), 5000)
+        self.db_mmap_size = self.resolve_int('CS_DB_MMAP_SIZE', database_conf.get('mmap_size'), 67108864)
+        self.db_cache_size = self.resolve_int('CS_DB_CACHE_SIZE', database_conf.get('cache_size'), -16000)
         self.info_home_enabled = self.resolve_bool('CS_INFO_HOME_ENABLED', conf.get('info_and_services'), False)
         self.services_home_enabled = self.resolve_bool('CS_SERVICES_HOME_ENABLED', conf.get('info_and_services'), False)
 
@@ -392,10 +484,15 @@ class Globals:
             self.xapi_context_received = bool(self.xapi_actor)
 
         self.grading_parts = conf['grading']['parts']
+        self.token_location = str(self.resolve('CS_TOKEN_LOCATION', conf.get('grading').get('token_location'), 'env')).lower()
+        if self.token_location not in self.VALID_TOKEN_LOCATIONS:
+            logging.error(f"Invalid token_location '{self.token_location}'. Valid locations are {self.VALID_TOKEN_LOCATIONS}.")
+            sys.exit(1)
         # self.bookmarks = self.resolve_dict("CS_BOOKMARKS",conf.get('info_and_services', {}).get('bookmarks', None)
         self.bookmarks = conf.get('info_and_services').get('bookmarks', None)
         # Check execution permission on configured grading scripts
-        if 'manual' in self.grading_mode:
+        # (`module:function` entry points are checked when they are loaded)
+        if 'manual' in self.grading_mode and not ENTRY_POINT_PATTERN.match(self.manual_grading_script or ''):
             try:
                 if not os.access(os.path.join(self.custom_script_dir,self.manual_grading_script), os.X_OK):
                     logging.error(f"Manual grading script {self.manual_grading_script} is not executable.")
@@ -403,7 +500,7 @@ class Globals:
             except Exception as e:
                 logging.error(f"Got exception {e} while checking if manual grading script {self.manual_grading_script} is executable.")
                 sys.exit(1)
-        if 'cron' in self.grading_mode:
+        if 'cron' in self.grading_mode and not ENTRY_POINT_PATTERN.match(self.cron_grading_script or ''):
             try:
                 if not os.access(os.path.join(self.custom_script_dir,self.cron_grading_script), os.X_OK):
                     logging.error(f"Cron grading script {self.cron_grading_script} is not executable.")
@@ -411,6 +508,26 @@ class Globals:
             except Exception as e:
                 logging.error(f"Got exception {e} while checking if cron grading script {self.cron_grading_script} is executable.")
                 sys.exit(1)
+        if 'cron' in self.grading_mode:
+            self.cron_schedules = self._load_cron_schedules(conf.get('grading').get('cron_schedules') or [])
+        # Check execution permission on grading scripts configured for individual parts
+        for part, part_conf in (self.grading_parts or {}).items():
+            probe = part_conf.get('probe') if isinstance(part_conf, dict) else None
+            if isinstance(probe, dict) and (len(probe) != 1 or next(iter(probe)) not in self.VALID_PROBE_TYPES):
+                logging.error(f"Invalid probe for part {part}: {probe}. A probe has exactly one of {self.VALID_PROBE_TYPES}.")
+                sys.exit(1)
+            part_script = part_conf.get('script') if isinstance(part_conf, dict) else None
+            if not part_script or ENTRY_POINT_PATTERN.match(part_script):
+                continue
+            if not os.access(os.path.join(self.custom_script_dir, part_script), os.X_OK):
+                logging.error(f"Grading script {part_script} for part {part} is not executable.")
+                sys.exit(1)
+        service_checks_conf = conf.get('service_checks', {}) or {}
+        self.service_check_concurrency = max(1, self.resolve_int('CS_SERVICE_CHECK_CONCURRENCY', service_checks_conf.get('max_concurrent'), 64))
+        self.service_check_timeout = max(1, self.resolve_int('CS_SERVICE_CHECK_TIMEOUT', service_checks_conf.get('timeout'), 5))
+        self.service_check_dns_ttl = max(0, self.resolve_int('CS_SERVICE_CHECK_DNS_TTL', service_checks_conf.get('dns_ttl'), 60))
+        self.service_check_dns_negative_ttl = max(0, self.resolve_int('CS_SERVICE_CHECK_DNS_NEGATIVE_TTL', service_checks_conf.get('dns_negative_ttl'), 10))
+        self.service_check_history = max(1, self.resolve_int('CS_SERVICE_CHECK_HISTORY', service_checks_conf.get('history'), 1440))
         self.required_services = conf.get('required_services', [])
         if (self.required_services == []) or (self.required_services == None):
             logging.info("No required services configured.")
@@ -434,12 +551,48 @@ class Globals:
                     sys.exit(1)
                 # ensure web options are set/defaulted
                 if service['type'] == 'web':
+                    service['scheme'] = str(service.get('scheme', 'http')).lower()
+                    service['method'] = str(service.get('method', 'GET')).upper()
+                    if service['scheme'] not in ('http', 'https') or service['method'] not in ('GET', 'HEAD'):
+                        logging.error(f"Invalid web scheme or method in required service: {service}. Scheme must be http or https and method must be GET or HEAD.")
+                        sys.exit(1)
+                    status = service.get('status', [200])
+                    service['status'] = [int(code) for code in (status if isinstance(status, list) else [status])]
+                    if service.get('body_regex') is not None:
+                        service['body_regex'] = str(service['body_regex'])
+                        try:
+                            re.compile(service['body_regex'])
+                        except re.error as e:
+                            logging.error(f"Invalid body_regex in required service: {service}. {e}")
+                            sys.exit(1)
                     if 'port' not in service:
-                        logging.info(f"Missing web port definition in required service: {service}. Defaulting to 80")
-                        service['port'] = 80
+                        default_port = 443 if service['scheme'] == 'https' else 80
+                        logging.info(f"Missing web port definition in required service: {service}. Defaulting to {default_port}")
+                        service['port'] = default_port
                     if 'path' not in service:
                         logging.info(f"Missing web path definition in required service: {service}. Defaulting to /")
                         service['path'] = '/'
+                # name used by startup scripts that require this service. Defaults to host (ping) or host:port,
+                # followed by the type if another service already has that name
+                if 'name' not in service:
+                    default_name = service['host'] if service['type'] == 'ping' else f"{service['host']}:{service['port']}"
+                    taken = [other.get('name') for other in self.required_services if other is not service]
+                    service['name'] = default_name if default_name not in taken else f"{default_name} ({service['type']})"
+                service['name'] = str(service['name'])
+                # seconds to wait for the service before startup scripts that need it fail. 0 waits forever
+                service['wait_timeout'] = int(service.get('wait_timeout') or 0)
+                service['wait_interval'] = int(service.get('wait_interval') or 2)
+                # seconds between periodic checks and seconds a single check may take
+                service['interval'] = int(service.get('interval') or 30)
+                service['timeout'] = int(service.get('timeout') or self.service_check_timeout)
+                # check scheduling (see CheckSchedule): slower polling while stable, exponential backoff while unavailable
+                service['stable_interval'] = int(service.get('stable_interval') or service['interval'] * 2)
+                service['stable_after'] = int(service.get('stable_after') or 10)
+                service['max_interval'] = int(service.get('max_interval') or service['interval'])
+                service['backoff'] = float(service.get('backoff') or 2)
+                if min(service['interval'], service['stable_interval'], service['wait_interval'], service['max_interval']) <= 0 or service['backoff'] < 1:
+                    logging.error(f"Invalid check intervals in required service: {service}. Intervals must be positive and backoff must be at least 1.")
+                    sys.exit(1)
                 # ensure block startup scripts is defined. Default to False if not
                 if 'block_startup_scripts' not in service:
                     logging.info(f"Missing block startup script definition in service: {service}. Defaulting to False")
@@ -450,9 +603,141 @@ class Globals:
                 # add to blocking services if needed
                 if service['block_startup_scripts']:
                     self.blocking_services.append(service)
+        # service names identify services to startup scripts, the service monitor and the services page, so they must be unique
+        service_names = [service['name'] for service in (self.required_services or [])]
+        duplicates = sorted({name for name in service_names if service_names.count(name) > 1})
+        if duplicates:
+            logging.error(f"More than one required service is named {duplicates}. Give required services a unique `name`.")
+            sys.exit(1)
+        # ensure startup scripts only require configured services
+        for script in self.startup_scripts:
+            for name in script['requires']:
+                if name not in service_names:
+                    logging.error(f"Startup script {script['name']} requires service {name}, which is not a configured required service.")
+                    sys.exit(1)
         logging.debug(f"Final Config: {self}")
 
 
+    def _load_startup_scripts(self, scripts_conf: List[Union[str, dict]]) -> List[dict]:
+        """
+        Build the startup script dependency graph.
+        An entry is a script name, or a dict with `script` and optional `name`, `depends_on` and `parallel`.
+        `requires` names the required services (see `required_services`) that must be available before the script starts.
+        Without `depends_on`, an entry runs after the entry before it (whether or not that one succeeded) unless it (or `startup.parallel`) is parallel.
+
+        Args:
+            scripts_conf (List[Union[str, dict]]): The `startup.scripts` setting
+
+        Returns:
+            List[dict]: Startup scripts with `name`, `script`, `depends_on`, `after` and `requires` resolved
+        """
+
+        scripts = []
+        names = set()
+        for entry in scripts_conf:
+            if entry is None:
+                continue
+            entry = {"script": entry} if isinstance(entry, str) else dict(entry)
+            if not entry.get('script'):
+                logging.error(f"Startup script entry {entry} is missing `script`.")
+                sys.exit(1)
+            name = str(entry.get('name') or entry['script'])
+            if name in names:
+                name = f"{name} ({sum(1 for s in scripts if s['script'] == entry['script']) + 1})"
+            depends_on = entry.get('depends_on') or []
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+            requires = entry.get('requires') or []
+            if isinstance(requires, str):
+                requires = [requires]
+            after = []
+            if 'depends_on' not in entry and not entry.get('parallel', self.startup_parallel) and scripts:
+                after = [scripts[-1]['name']]
+            names.add(name)
+            scripts.append({"name": name, "script": entry['script'], "depends_on": list(depends_on), "after": after, "requires": list(requires)})
+
+        for script in scripts:
+            unknown = [dep for dep in script['depends_on'] if dep not in names]
+            if unknown:
+                logging.error(f"Startup script {script['name']} depends on unknown startup scripts {unknown}.")
+                sys.exit(1)
+
+        # reject cycles (depth-first search)
+        graph = {script['name']: script['depends_on'] + script['after'] for script in scripts}
+        visited, visiting = set(), set()
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                logging.error(f"Startup scripts have a circular dependency involving {name}.")
+                sys.exit(1)
+            visiting.add(name)
+            for dep in graph[name]:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+        for name in graph:
+            visit(name)
+        return scripts
+
+
+    def _load_cron_schedules(self, schedules_conf: List[dict]) -> List[dict]:
+        """
+        Build the cron grading schedules.
+        Each entry in `cron_schedules` grades its own group of cron parts on its own schedule.
+        Cron parts that are not in any group are graded by a `default` schedule that uses the top-level cron settings.
+
+        Args:
+            schedules_conf (List[dict]): The `grading.cron_schedules` setting
+
+        Returns:
+            List[dict]: Schedules with every setting resolved
+        """
+
+        cron_parts = [part for part, part_conf in (self.grading_parts or {}).items() if part_conf.get('mode') == 'cron']
+        schedules = []
+        assigned = set()
+        for index, schedule_conf in enumerate(schedules_conf):
+            name = str(schedule_conf.get('name') or f"schedule{index + 1}")
+            parts = schedule_conf.get('parts') or []
+            unknown = [part for part in parts if part not in cron_parts]
+            if not parts or unknown:
+                logging.error(f"Cron schedule {name} must list one or more grading parts with mode cron. Invalid parts: {unknown or parts}")
+                sys.exit(1)
+            duplicates = assigned.intersection(parts)
+            if duplicates:
+                logging.error(f"Grading parts {sorted(duplicates)} are listed in more than one cron schedule.")
+                sys.exit(1)
+            assigned.update(parts)
+            script = schedule_conf.get('script') or self.cron_grading_script
+            if not ENTRY_POINT_PATTERN.match(script or '') and not os.access(os.path.join(self.custom_script_dir, script or ''), os.X_OK):
+                logging.error(f"Cron grading script {script} for schedule {name} is not executable.")
+                sys.exit(1)
+            schedules.append({
+                "name": name,
+                "parts": list(parts),
+                "script": script,
+                "interval": max(1, int(schedule_conf.get('interval') or self.cron_interval)),
+                "at": schedule_conf.get('at', self.cron_at),
+                "delay": int(schedule_conf.get('delay', self.cron_delay) or 0),
+                "limit": int(schedule_conf['limit']) if schedule_conf.get('limit') is not None else self.cron_limit,
+                "jitter": int(schedule_conf.get('jitter', self.cron_jitter) or 0)
+            })
+        remaining = [part for part in cron_parts if part not in assigned]
+        if remaining or not schedules:
+            schedules.insert(0, {
+                "name": "default",
+                "parts": remaining,
+                "script": self.cron_grading_script,
+                "interval": self.cron_interval,
+                "at": self.cron_at,
+                "delay": self.cron_delay,
+                "limit": self.cron_limit,
+                "jitter": self.cron_jitter
+            })
+        return schedules
+
+
     @classmethod
     def from_yaml(cls, instance: Optional["Globals"] = None) -> "Globals":
         instance = instance or cls()
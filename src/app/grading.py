@@ -8,30 +8,39 @@
 # DM24-0645
 #
 
-from concurrent.futures import Future
+from concurrent.futures import Future, as_completed
 import datetime, json, os, subprocess, sys, requests
+from functools import partial
 from time import sleep
-from typing import Any
+from typing import Optional
 from app.databaseHelpers import check_db, get_current_phase, record_solves, update_db
-from app.env import get_clean_env
-from app.extensions import db, globals, logger
+from app.eventWriter import record_event
+from app.extensions import challenge_state, db, globals, logger, notifier
 from app.fileUploads import get_most_recent_file
+from app.gradingCache import grading_cache
+from app.gradingPlugins import get_entry_point, is_entry_point
 from app.models import EventTracker
+from app.residentGrader import run_grading_script
+from app.scriptRunner import TIMEOUT_RESULT
+from app.tokenStore import token_store
 from flask import current_app
 
+# Token text shown when a part's token cannot be read
+TOKEN_ERROR = "Unexpected error encountered. Contact an administrator."
 
-def do_grade(args: dict) -> tuple[dict,dict]:
+
+def do_grade(args: dict) -> tuple[dict,dict,bool]:
     """
     Grading and token reading for all manual questions
+    Grading jobs can run at the same time, so the error state of this grade is returned rather than stored in `globals.fatal_error`.
 
     Args:
         args (dict): Arguments to the grading script (passed via JSON on the command line when grading script is called).
 
     Returns:
-        tuple[dict,dict]: Grading results
+        tuple[dict,dict,bool]: Grading results, tokens and whether grading hit a fatal error
     """
 
-    globals.fatal_error = False
     manual_grading_list = list()
     for ques,ans in args.items():
         if (ques not in globals.grading_parts.keys()) or (globals.grading_parts[ques]['mode'] not in globals.VALID_CONFIG_MODES):
@@ -46,52 +55,37 @@ def do_grade(args: dict) -> tuple[dict,dict]:
             manual_grading_list.insert(index,{ques:saved_archive})
 
 
-    script_path = os.path.join(globals.custom_script_dir, globals.manual_grading_script)
-    _, ext = os.path.splitext(script_path)
-    # Start building the command
-    if ext == ".py":
-        grade_cmd = [sys.executable, script_path]  # Use venv's Python if python script
-    else:
-        grade_cmd = [script_path]
-
     # Add JSON-encoded arguments if present
     grade_args = {}
+    script_args = []
     if manual_grading_list:
         for entry in manual_grading_list:
             grade_args[list(entry.keys())[0]] = list(entry.values())[0]
-        grade_cmd.append(json.dumps(grade_args))
+        script_args.append(json.dumps(grade_args))
 
     # Handle phase logic
+    current_phase = None
     if globals.phases_enabled:
         current_phase = get_current_phase()
         if current_phase != 'completed':
-            grade_cmd.append(current_phase)
+            script_args.append(current_phase)
         else:
             tmp = [f'{grade_key} : Success' for grade_key in globals.grading_parts.keys()]
             results = dict(tmp)
-            return get_results(results)
-
-    try:
-        logger.debug(f"Grading command is: {grade_cmd}")
-        out = subprocess.run(grade_cmd, capture_output=True, check=True)
-        logger.info(f"Grading script finished: {out}")
-        output = out.stdout.decode('utf-8')
-        if (output == "") or (output == None):
-            logger.error("Grading script finished without returning any output.")
-            globals.fatal_error = True
-    # Something happened if there was a non-zero exit status. Log this and set fatal_error
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Grading script {globals.manual_grading_script} returned with non-zero exit status {e.returncode}.\tStdout: {e.stdout}\tStderr: {e.stderr}")
-        globals.fatal_error = True
-        output = ""
-
-    results = []
-    for sub in output.split('\n'):
-        if ':' in sub:
-            results.append(map(str.strip, sub.split(':', 1)))
-    results = dict(results)
+            return (*get_results(results), False)
+
+    part_scripts = get_part_scripts(current_phase)
+    if part_scripts:
+        results, cached, fatal_error = grade_parts(part_scripts, grade_args, current_phase)
+    elif is_entry_point(globals.manual_grading_script):
+        results, cached, fatal_error = grading_cache.grade(get_manual_parts(current_phase), grade_args, current_phase,
+                                              partial(call_grading_entry_point, globals.manual_grading_script, grade_args, current_phase))
+    else:
+        results, cached, fatal_error = grading_cache.grade(get_manual_parts(current_phase), grade_args, current_phase,
+                                              partial(run_grading_command, globals.manual_grading_script, build_grade_cmd(globals.manual_grading_script), script_args, get_manual_parts(current_phase)))
 
-    with current_app.app_context():
+    # identical resubmissions answered from the grading cache are not recorded again
+    if not cached:
         event_data = {
             "challenge":globals.challenge_name,
             "support_code":globals.support_code,
@@ -99,9 +93,9 @@ def do_grade(args: dict) -> tuple[dict,dict]:
             "output":results,
             "recorded_at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
-        new_event = EventTracker(data=json.dumps(event_data))
-        db.session.add(new_event)
-        db.session.commit()
+        record_event(event_data)
+    else:
+        logger.info(f"Grading results served from the grading cache: {results}")
 
     # ensure all grading parts have a result
     for grading_key in globals.grading_parts.keys():
@@ -116,7 +110,210 @@ def do_grade(args: dict) -> tuple[dict,dict]:
         user_input = grade_args.get(k, "")
         update_db('q', k, f"{v}--{user_input}")
 
-    return get_results(results)
+    end_results, tokens = get_results(results)
+    if globals.grader_post and TOKEN_ERROR in tokens.values():
+        fatal_error = True
+    return end_results, tokens, fatal_error
+
+
+def build_grade_cmd(script: str) -> list[str]:
+    """
+    Build the command that runs a grading script from the custom_scripts directory.
+
+    Args:
+        script (str): Grading script name
+
+    Returns:
+        list[str]: Command without grading arguments
+    """
+
+    script_path = os.path.join(globals.custom_script_dir, script)
+    _, ext = os.path.splitext(script_path)
+    if ext == ".py":
+        return [sys.executable, script_path]  # Use venv's Python if python script
+    return [script_path]
+
+
+def get_manual_parts(current_phase: Optional[str] = None) -> list[str]:
+    """
+    Get the manual grading parts that are graded now.
+    When phases are enabled, only parts in the current phase are returned.
+
+    Args:
+        current_phase (Optional[str], optional): Phase being graded. Defaults to None.
+
+    Returns:
+        list[str]: Grading parts
+    """
+
+    phase_parts = globals.phases.get(current_phase, []) if (globals.phases_enabled and globals.phases) else None
+    return [
+        part for part, config in globals.grading_parts.items()
+        if config.get('mode') in globals.MANUAL_MODE and (phase_parts is None or part in phase_parts)
+    ]
+
+
+def get_part_scripts(current_phase: Optional[str] = None) -> dict[str,str]:
+    """
+    Get the manual grading parts that have their own `script` configured.
+    When phases are enabled, only parts in the current phase are returned.
+
+    Args:
+        current_phase (Optional[str], optional): Phase being graded. Defaults to None.
+
+    Returns:
+        dict[str,str]: Grading part -> script or entry point
+    """
+
+    return {
+        part: globals.grading_parts[part]['script'] for part in get_manual_parts(current_phase)
+        if globals.grading_parts[part].get('script')
+    }
+
+
+def run_part_grader(script: str, parts: list[str], grade_args: dict, phase: Optional[str] = None) -> tuple[dict,bool]:
+    """
+    Grade some grading parts with one script or entry point.
+
+    Args:
+        script (str): Grading script or `module:function` entry point
+        parts (list[str]): Grading parts this script is responsible for
+        grade_args (dict): Submitted answers keyed by grading part
+        phase (Optional[str], optional): Current phase when phases are enabled. Defaults to None.
+
+    Returns:
+        tuple[dict,bool]: Grading part -> result (limited to `parts`), and whether grading hit a fatal error
+    """
+
+    submission = {part: grade_args[part] for part in parts if part in grade_args}
+    if is_entry_point(script):
+        results, fatal_error = call_grading_entry_point(script, submission, phase)
+    else:
+        script_args = [json.dumps(submission)] if submission else []
+        if phase:
+            script_args.append(phase)
+        timeout = globals.grading_parts[parts[0]].get('timeout') if len(parts) == 1 else None
+        results, fatal_error = run_grading_command(script, build_grade_cmd(script), script_args, parts, timeout)
+    return {part: result for part, result in results.items() if part in parts}, fatal_error
+
+
+def grade_parts(part_scripts: dict[str,str], grade_args: dict, phase: Optional[str] = None) -> tuple[dict,bool,bool]:
+    """
+    Grade each part that has its own script concurrently, together with one run of
+    `manual_grading_script` for the remaining parts.
+    Scripts run on `globals.part_grading_pool`, which is shared by all grading jobs.
+    `globals.manual_results` is updated as each script finishes so /challenge/update shows partial progress.
+
+    Args:
+        part_scripts (dict[str,str]): Grading part -> script or entry point
+        grade_args (dict): Submitted answers keyed by grading part
+        phase (Optional[str], optional): Current phase when phases are enabled. Defaults to None.
+
+    Returns:
+        tuple[dict,bool,bool]: Grading part -> result, whether every result came from the grading cache, and whether any script hit a fatal error
+    """
+
+    jobs = [(script, [part]) for part, script in part_scripts.items()]
+    shared_parts = [part for part in get_manual_parts(phase) if part not in part_scripts]
+    if shared_parts and globals.manual_grading_script:
+        jobs.append((globals.manual_grading_script, shared_parts))
+
+    results = {}
+    all_cached = True
+    fatal_error = False
+    progress = dict(globals.manual_results or {})
+    progress.update({part: "Grading" for _, parts in jobs for part in parts})
+    globals.manual_results = dict(progress)
+    challenge_state.bump()
+
+    futures = {
+        globals.part_grading_pool.submit(grading_cache.grade, parts, grade_args, phase, partial(run_part_grader, script, parts, grade_args, phase)): (script, parts)
+        for script, parts in jobs
+    }
+    for future in as_completed(futures):
+        script, parts = futures[future]
+        try:
+            part_results, cached, part_error = future.result()
+        except Exception as e:
+            logger.error(f"Grading {parts} with {script} raised an exception: {e!r}")
+            part_results, cached, part_error = {}, False, True
+        fatal_error = fatal_error or part_error
+        all_cached = all_cached and cached
+        logger.debug(f"Grading {parts} with {script} finished: {part_results}")
+        results.update(part_results)
+        progress.update(part_results)
+        globals.manual_results = dict(progress)
+        challenge_state.bump()
+        notifier.publish('grading-progress', {"parts": list(part_results.keys())})
+    return results, all_cached, fatal_error
+
+
+def run_grading_command(script: str, grade_cmd: list[str], script_args: list[str], parts: Optional[list[str]] = None, timeout: Optional[int] = None) -> tuple[dict,bool]:
+    """
+    Run a grading script and parse the `key : value` lines it prints.
+    Reports a fatal error if the script fails or prints nothing.
+    If the script times out, each of `parts` gets a "timed out" failure result instead.
+
+    Args:
+        script (str): Grading script name (for logging)
+        grade_cmd (list[str]): Command that runs the grading script
+        script_args (list[str]): Arguments for the grading script
+        parts (Optional[list[str]], optional): Grading parts the script is responsible for. Defaults to None.
+        timeout (Optional[int], optional): Seconds before the script is killed. Defaults to `grading.script_timeout`.
+
+    Returns:
+        tuple[dict,bool]: Grading part -> result, and whether the script hit a fatal error
+    """
+
+    fatal_error = False
+    try:
+        logger.debug(f"Grading command is: {grade_cmd + script_args}")
+        out = run_grading_script(grade_cmd, script_args, timeout)
+        logger.info(f"Grading script finished: {out}")
+        output = out.stdout.decode('utf-8', errors='replace')
+        if (output == "") or (output == None):
+            logger.error("Grading script finished without returning any output.")
+            fatal_error = True
+    # Something happened if there was a non-zero exit status. Log this and set fatal_error
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Grading script {script} returned with non-zero exit status {e.returncode}.\tStdout: {e.stdout}\tStderr: {e.stderr}")
+        fatal_error = True
+        output = ""
+    except subprocess.TimeoutExpired as e:
+        logger.error(f"Grading script {script} did not finish within {e.timeout} seconds.")
+        return {part: f"{TIMEOUT_RESULT} after {int(e.timeout)} seconds" for part in (parts or [])}, not parts
+
+    results = []
+    for sub in output.split('\n'):
+        if ':' in sub:
+            results.append(map(str.strip, sub.split(':', 1)))
+    return dict(results), fatal_error
+
+
+def call_grading_entry_point(spec: str, submission: dict, phase: Optional[str] = None) -> tuple[dict,bool]:
+    """
+    Grade in-process with a Python entry point (`module:function`).
+    Reports a fatal error if the function raises or returns nothing.
+
+    Args:
+        spec (str): Entry point in the form `module:function`
+        submission (dict): Submitted answers keyed by grading part
+        phase (Optional[str], optional): Current phase when phases are enabled. Defaults to None.
+
+    Returns:
+        tuple[dict,bool]: Grading part -> result, and whether the entry point hit a fatal error
+    """
+
+    try:
+        results = get_entry_point(spec)(submission, phase)
+        logger.info(f"Grading entry point {spec} finished: {results}")
+    except Exception as e:
+        logger.error(f"Grading entry point {spec} raised an exception: {e!r}")
+        return {}, True
+    if not results:
+        logger.error(f"Grading entry point {spec} finished without returning any results.")
+        return {}, True
+    return results, False
 
 
 def get_results(results: dict) -> tuple[dict,dict]:
@@ -150,7 +347,7 @@ def get_results(results: dict) -> tuple[dict,dict]:
     return end_results, tokens
 
 
-def post_submission(tokens: dict) -> Any:
+def post_submission(tokens: dict) -> bool:
     """
     Send a POST to the grader for automatic grading.
     Method will try 4 times (sleep 1 second between each failed attempt).
@@ -158,6 +355,9 @@ def post_submission(tokens: dict) -> Any:
 
     Args:
         tokens (dict): GradingCheck:token to submit
+
+    Returns:
+        bool: True if the grader accepted the submission
     """
 
     token_values = tokens.values()
@@ -186,8 +386,7 @@ def post_submission(tokens: dict) -> Any:
                 r = requests.post(globals.grader_url, data=payload, headers=headers)
                 if r.status_code == 200:
                     logger.info(f"Got 200 from {globals.grader_url} after POST")
-                    globals.fatal_error = False
-                    return
+                    return True
                 elif r.status_code == 405:
                     logger.info(f"Got 405 from {globals.grader_url} after POST. Changing to PUT.")
                     globals.grading_verb = "POST"
@@ -197,8 +396,7 @@ def post_submission(tokens: dict) -> Any:
                 r = requests.put(globals.grader_url, data=payload, headers=headers)
                 if r.status_code == 200:
                     logger.info(f"Got 200 from {globals.grader_url} after PUT")
-                    globals.fatal_error = False
-                    return
+                    return True
                 else:
                     logger.error(f"Got {r.status_code} from {globals.grader_url} attempting to PUT. Message: {r.content}")
         except Exception as e:
@@ -209,12 +407,13 @@ def post_submission(tokens: dict) -> Any:
 
 
     logger.error(f"All attempts to submit results to grader failed.\tURL: {globals.grader_url}\tVerb: {globals.grading_verb}\tHeaders: {headers}\tPayload: {payload}")
-    globals.fatal_error = True
+    return False
 
 
 def done_grading(future: Future) -> None:
     """
     Callback function for do_grade.
+    Runs once per grading job, with that job's results and error state.
     Checks to see if the results need to be PUT to the grading server
     Saves solves to the database
 
@@ -222,7 +421,7 @@ def done_grading(future: Future) -> None:
         future (Future): Grading results future (populated when grading is finished)
     """
 
-    results, tokens = future.result()
+    results, tokens, fatal_error = future.result()
     logger.debug(f"Server sees {globals.manual_grading_script} results as: {results}")
     logger.debug(f"Server sees tokens as: {tokens}")
 
@@ -231,21 +430,27 @@ def done_grading(future: Future) -> None:
     globals.tokens['manual'] = tokens
 
     # record solves to the database
-    globals.scheduler.add_job(id="Record_Solves",func=record_solves)
+    globals.scheduler.add_job(id="Record_Solves",func=record_solves,replace_existing=True)
+
+    if globals.grader_post and not post_submission(tokens):
+        fatal_error = True
 
-    if globals.grader_post:
-        post_submission(tokens)
+    # the results page shows the error state of the most recent grade
+    globals.fatal_error = fatal_error
+    challenge_state.bump()
+    notifier.publish('grading-finished', {"submit_time": globals.manual_submit_time, "fatal_error": fatal_error})
 
 
 def read_token(part_name: str) -> str:
     """
     Read the token for the named grading check.
+    Tokens are served from the token store, which reads each token from its location once.
 
     Args:
         part_name (str): Name of the grading check
 
     Returns:
-        str: Token value
+        str: Token value, or TOKEN_ERROR if the part or its token is missing. Callers treat TOKEN_ERROR as a fatal error.
     """
 
     # get the token name for this part
@@ -253,44 +458,9 @@ def read_token(part_name: str) -> str:
         value = globals.grading_parts[part_name]['token_name']
     except KeyError:
         logger.error(f"There is no match for {part_name} in the config file. Valid part names from config file are: {globals.grading_parts.keys()}")
-        if globals.grader_post:
-            globals.fatal_error = True
-        return "Unexpected error encountered. Contact an administrator."
-
-    # read tokens from env var
-    if globals.token_location == 'env':
-        token = get_clean_env(value)
-        if not token:
-            logger.error(f"Environment variable for token {value} is empty.")
-            if globals.grader_post:
-                globals.fatal_error = True
-            return "Unexpected error encountered. Contact an administrator."
-        else:
-            return token
+        return TOKEN_ERROR
 
-    # read tokens from guestinfo
-    elif globals.token_location == 'guestinfo':
-        try:
-            output = subprocess.run(f"vmtoolsd --cmd 'info-get guestinfo.{value}'", shell=True, capture_output=True)
-            if 'no value' in output.stderr.decode('utf-8').lower():
-                logger.error(f"No value found when querying guestinfo variables for guestinfo.{value}")
-                if globals.grader_post:
-                    globals.fatal_error = True
-                return "Unexpected error encountered. Contact an administrator."
-            return output.stdout.decode('utf-8').strip()
-        except:
-            logger.error("Error when trying to get token from guestinfo vars")
-            if globals.grader_post:
-                globals.fatal_error = True
-            return "Unexpected error encountered. Contact an administrator."
-
-    # read token from file
-    elif globals.token_location == 'file':
-        try:
-            with open(f"{globals.basedir}/app/tokens/{value}", 'r') as f:
-                return f.readline()
-        except:
-            logger.error(f"Error opening file {value} when trying to read token for check {part_name}")
-            if globals.grader_post:
-                globals.fatal_error = True
-            return "Unexpected error encountered. Contact an administrator."
+    token = token_store.get(value)
+    if token is None:
+        return TOKEN_ERROR
+    return token
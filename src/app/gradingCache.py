@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import hashlib, os, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+from app.extensions import globals
+from app.scriptRunner import TIMEOUT_RESULT
+
+
+def answer_fingerprint(part: str, answer: Any) -> str:
+    """
+    Fingerprint of a submitted answer for the grading cache.
+    Uploads are identified by the SHA-256 of the uploaded file; other answers by their stripped text.
+
+    Args:
+        part (str): Grading part
+        answer (Any): Submitted answer (or uploaded file path for upload parts)
+
+    Returns:
+        str: Fingerprint
+    """
+
+    if globals.grading_parts[part].get('mode') == 'upload' and answer and os.path.isfile(answer):
+        digest = hashlib.sha256()
+        with open(answer, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
+    return f"text:{str(answer if answer is not None else '').strip()}"
+
+
+def is_cacheable(part: str) -> bool:
+    """
+    Check if results for a grading part may be cached.
+    `button` and `cron` parts check live environment state, so they are not cached unless the part sets `cache: true`.
+    Any part can opt out with `cache: false`.
+
+    Args:
+        part (str): Grading part
+
+    Returns:
+        bool: True if the part's results may be cached.
+    """
+
+    part_conf = globals.grading_parts.get(part, {})
+    if 'cache' in part_conf:
+        return bool(part_conf['cache'])
+    return part_conf.get('mode') not in ('button', 'cron')
+
+
+class GradingCache:
+    """
+    LRU cache of grading results keyed on (grading part, answer fingerprint, phase).
+    Entries expire `ttl` seconds after they are stored.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 300) -> None:
+        """
+        Args:
+            max_entries (int, optional): Maximum number of cached results. Defaults to 1024.
+            ttl (int, optional): Seconds a result stays valid. Defaults to 300.
+        """
+
+        self.enabled = False
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key: tuple) -> Optional[str]:
+        """
+        Look up a cached result.
+
+        Args:
+            key (tuple): Cache key
+
+        Returns:
+            Optional[str]: The cached result, or None if it is missing or expired.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+
+    def put(self, key: tuple, result: str) -> None:
+        """
+        Store a result, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (tuple): Cache key
+            result (str): Grading result
+        """
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self) -> None:
+        """
+        Drop all cached results.
+        """
+
+        with self.lock:
+            self.entries.clear()
+
+
+    def grade(self, parts: list[str], grade_args: dict, phase: Optional[str], run: Callable[[], tuple[dict, bool]]) -> tuple[dict, bool, bool]:
+        """
+        Return cached results for `parts` if every part is cached, otherwise call `run` and cache what it returns.
+        Results of a run that hit a fatal error are not cached.
+
+        Args:
+            parts (list[str]): Grading parts graded by `run`
+            grade_args (dict): Submitted answers keyed by grading part
+            phase (Optional[str]): Current phase when phases are enabled
+            run (Callable[[], tuple[dict, bool]]): Grades the parts and returns part -> result and whether it hit a fatal error
+
+        Returns:
+            tuple[dict, bool, bool]: Grading results, whether they came from the cache and whether grading hit a fatal error
+        """
+
+        if not self.enabled:
+            results, fatal_error = run()
+            return results, False, fatal_error
+        keys = {part: (part, answer_fingerprint(part, grade_args.get(part)), phase) for part in parts if is_cacheable(part)}
+        if parts and len(keys) == len(parts):
+            cached = {part: self.get(key) for part, key in keys.items()}
+            if all(result is not None for result in cached.values()):
+                self.hits += 1
+                return cached, True, False
+        self.misses += 1
+        results, fatal_error = run()
+        if not fatal_error:
+            for part, key in keys.items():
+                if part in results and not results[part].startswith(TIMEOUT_RESULT):
+                    self.put(key, results[part])
+        return results, False, fatal_error
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Cache size and hit/miss/eviction counters
+        """
+
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+grading_cache = GradingCache()
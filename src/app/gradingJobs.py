@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import datetime, json, threading, uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+from flask import request
+from app.extensions import globals, logger
+from app.grading import do_grade
+
+
+def client_key() -> str:
+    """
+    Identify the client making the current request.
+    Uses the X-Real-IP header set by the reverse proxy, falling back to the connection address.
+
+    Returns:
+        str: Client identifier
+    """
+
+    return request.headers.get("X-Real-IP") or request.remote_addr or "unknown"
+
+
+class GradingJob:
+    """
+    One manual grading request and the clients waiting for it.
+    """
+
+    def __init__(self, args: dict, key: str) -> None:
+        self.id: str = uuid.uuid4().hex[:12]
+        self.args = args
+        self.key = key
+        self.clients: set[str] = set()
+        self.submitted_at: str = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.future: Optional[Future] = None
+        self.results: Optional[dict] = None
+        self.error: bool = False
+
+
+    @property
+    def status(self) -> str:
+        if self.future is None or (self.started_at is None and not self.future.done()):
+            return "queued"
+        if not self.future.done():
+            return "running"
+        return "failed" if self.error else "done"
+
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "results": self.results,
+            "fatal_error": self.error
+        }
+
+
+class GradingQueue:
+    """
+    Manual grading jobs submitted to the grading executor.
+    Each client has at most one job it is waiting on. A submission identical to a job that is
+    still queued or running is attached to that job instead of being graded again.
+    """
+
+    def __init__(self, history: int = 256) -> None:
+        """
+        Args:
+            history (int, optional): Number of finished jobs kept for the status endpoint. Defaults to 256.
+        """
+
+        self.history = history
+        self.jobs: OrderedDict[str, GradingJob] = OrderedDict()
+        self.by_client: dict[str, str] = {}
+        self.in_flight: dict[str, str] = {}
+        self.last_submit: dict[str, datetime.datetime] = {}
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.coalesced = 0
+
+
+    def get(self, job_id: str) -> Optional[GradingJob]:
+        """
+        Args:
+            job_id (str): Job ID
+
+        Returns:
+            Optional[GradingJob]: The job, or None if it is unknown or expired from the history.
+        """
+
+        return self.jobs.get(job_id)
+
+
+    def for_client(self, client: str) -> Optional[GradingJob]:
+        """
+        Args:
+            client (str): Client identifier
+
+        Returns:
+            Optional[GradingJob]: The job the client is waiting on, if any.
+        """
+
+        with self.lock:
+            job_id = self.by_client.get(client)
+            return self.jobs.get(job_id) if job_id else None
+
+
+    def release(self, client: str) -> None:
+        """
+        Stop tracking the client's job once the client has seen its results.
+
+        Args:
+            client (str): Client identifier
+        """
+
+        with self.lock:
+            self.by_client.pop(client, None)
+
+
+    def retry_after(self, client: str) -> int:
+        """
+        Seconds until the client may submit again under `grading.rate_limit`.
+
+        Args:
+            client (str): Client identifier
+
+        Returns:
+            int: Seconds to wait, 0 if the client may submit now.
+        """
+
+        last = self.last_submit.get(client)
+        if last is None:
+            return 0
+        remaining = (last + globals.grading_rateLimit - datetime.datetime.now()).total_seconds()
+        return max(0, int(remaining))
+
+
+    def submit(self, client: str, args: dict) -> tuple[GradingJob, bool]:
+        """
+        Queue a grading job for a client, or attach the client to an identical job that is already in flight.
+
+        Args:
+            client (str): Client identifier
+            args (dict): Arguments for do_grade
+
+        Returns:
+            tuple[GradingJob, bool]: The job and whether it was coalesced with an existing job
+        """
+
+        key = json.dumps(args, sort_keys=True)
+        with self.lock:
+            self.last_submit[client] = datetime.datetime.now()
+            existing = self.jobs.get(self.in_flight.get(key, ''))
+            if existing is not None and not existing.done:
+                existing.clients.add(client)
+                self.by_client[client] = existing.id
+                self.coalesced += 1
+                logger.info(f"Grading request from {client} attached to in-flight job {existing.id}")
+                return existing, True
+
+            job = GradingJob(args, key)
+            job.clients.add(client)
+            self.jobs[job.id] = job
+            self.by_client[client] = job.id
+            self.in_flight[key] = job.id
+            self.submitted += 1
+            self._trim()
+            job.future = globals.executor.submit(self._run, job)
+        job.future.add_done_callback(lambda future: self._finished(job, future))
+        logger.info(f"Queued grading job {job.id} for {client}")
+        return job, False
+
+
+    def _run(self, job: GradingJob) -> tuple[dict,dict,bool]:
+        """
+        Executor entry point. Returns do_grade's results so the executor's done callback (done_grading) still applies.
+        """
+
+        job.started_at = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+        return do_grade(job.args)
+
+
+    def _finished(self, job: GradingJob, future: Future) -> None:
+        """
+        Record the outcome of a job.
+        """
+
+        job.finished_at = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+        try:
+            job.results, _, job.error = future.result()
+        except Exception as e:
+            logger.error(f"Grading job {job.id} raised an exception: {e!r}")
+            job.error = True
+        with self.lock:
+            if self.in_flight.get(job.key) == job.id:
+                del self.in_flight[job.key]
+
+
+    def _trim(self) -> None:
+        """
+        Forget the oldest finished jobs beyond the history limit. Caller holds the lock.
+        """
+
+        waiting = set(self.by_client.values())
+        for job_id in list(self.jobs.keys()):
+            if len(self.jobs) <= self.history:
+                break
+            job = self.jobs[job_id]
+            if job.done and job_id not in waiting:
+                del self.jobs[job_id]
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Queue counters
+        """
+
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return {
+            "workers": globals.grading_workers,
+            "queued": sum(1 for job in jobs if job.status == "queued"),
+            "running": sum(1 for job in jobs if job.status == "running"),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced
+        }
+
+
+grading_jobs = GradingQueue()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import importlib, os, sys, threading
+from typing import Callable, Optional
+from app.extensions import globals, logger
+from app.globals import ENTRY_POINT_PATTERN
+
+
+def is_entry_point(script: Optional[str]) -> bool:
+    """
+    Check if a grading script setting is a Python entry point (`module:function`) instead of a script file.
+
+    Args:
+        script (Optional[str]): manual_grading_script or cron_grading_script setting
+
+    Returns:
+        bool: True if the setting is an entry point.
+    """
+
+    return bool(script) and bool(ENTRY_POINT_PATTERN.match(script))
+
+
+class EntryPoint:
+    """
+    A grading function loaded from a Python module.
+    The module is imported once and reloaded when its file changes.
+    """
+
+    def __init__(self, spec: str) -> None:
+        """
+        Args:
+            spec (str): Entry point in the form `module:function` (e.g., `custom_scripts.manualGradingExample:grade`)
+        """
+
+        self.spec = spec
+        self.module_name, self.function_name = spec.split(':', 1)
+        self.module = None
+        self.mtime: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+    def _module_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.module.__file__).st_mtime
+        except (AttributeError, TypeError, OSError):
+            return None
+
+
+    def load(self) -> Callable:
+        """
+        Import the module (or reload it if its file changed) and return the grading function.
+
+        Raises:
+            ImportError: If the module cannot be imported.
+            AttributeError: If the module has no such function.
+
+        Returns:
+            Callable: The grading function
+        """
+
+        with self.lock:
+            if self.module is None:
+                # grading modules can import their siblings just like grading scripts can
+                if globals.custom_script_dir not in sys.path:
+                    sys.path.append(globals.custom_script_dir)
+                self.module = importlib.import_module(self.module_name)
+                self.mtime = self._module_mtime()
+                logger.info(f"Loaded grading entry point {self.spec}")
+            else:
+                mtime = self._module_mtime()
+                if mtime != self.mtime:
+                    self.module = importlib.reload(self.module)
+                    self.mtime = mtime
+                    logger.info(f"Reloaded grading entry point {self.spec} after its file changed")
+            function = getattr(self.module, self.function_name)
+        if not callable(function):
+            raise AttributeError(f"{self.spec} is not callable")
+        return function
+
+
+    def __call__(self, submission: dict, phase: Optional[str] = None) -> dict:
+        """
+        Call the grading function.
+
+        Args:
+            submission (dict): Submitted answers keyed by grading part
+            phase (Optional[str], optional): Current phase, passed as a second argument when phases are enabled. Defaults to None.
+
+        Returns:
+            dict: Grading part -> result (e.g., "Success -- message")
+        """
+
+        function = self.load()
+        results = function(submission) if phase is None else function(submission, phase)
+        if not isinstance(results, dict):
+            raise TypeError(f"{self.spec} returned {type(results).__name__}, expected dict")
+        return {str(key).strip(): str(value).strip() for key, value in results.items()}
+
+
+entry_points: dict[str, EntryPoint] = {}
+entry_points_lock = threading.Lock()
+
+
+def get_entry_point(spec: str) -> EntryPoint:
+    """
+    Get the cached entry point for a `module:function` setting.
+
+    Args:
+        spec (str): Entry point in the form `module:function`
+
+    Returns:
+        EntryPoint: The entry point
+    """
+
+    with entry_points_lock:
+        entry_point = entry_points.get(spec)
+        if entry_point is None:
+            entry_point = entry_points[spec] = EntryPoint(spec)
+        return entry_point
+
+
+def preload_entry_points() -> None:
+    """
+    Import the configured grading entry points so configuration errors are found at startup.
+    Exits if an entry point cannot be loaded.
+    """
+
+    scripts = []
+    if 'manual' in globals.grading_mode:
+        scripts.append(globals.manual_grading_script)
+    if 'cron' in globals.grading_mode:
+        scripts.append(globals.cron_grading_script)
+    scripts.extend(part.get('script') for part in (globals.grading_parts or {}).values() if isinstance(part, dict))
+    for script in scripts:
+        if not is_entry_point(script):
+            continue
+        try:
+            get_entry_point(script).load()
+        except Exception as e:
+            logger.error(f"Could not load grading entry point {script}. Exception: {e!r}")
+            sys.exit(1)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import asyncio, random, socket, struct, threading, time
+from typing import Optional
+from app.resolver import resolver
+
+# ICMP echo request/reply types for IPv4 and IPv6
+ECHO_TYPES = {socket.AF_INET: (8, 0), socket.AF_INET6: (128, 129)}
+ICMP_HEADER = struct.Struct('!BBHHH')
+PAYLOAD = b'challenge-server'
+
+
+def checksum(data: bytes) -> int:
+    """
+    Internet checksum (RFC 1071) of an ICMP packet.
+    """
+
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def open_icmp_socket(family: int) -> tuple[socket.socket, bool]:
+    """
+    Open a non-blocking ICMP socket.
+    An unprivileged datagram socket is preferred (allowed by net.ipv4.ping_group_range); a raw socket is used if that fails.
+
+    Args:
+        family (int): socket.AF_INET or socket.AF_INET6
+
+    Raises:
+        PermissionError: If neither kind of ICMP socket can be opened.
+
+    Returns:
+        tuple[socket.socket, bool]: The socket and whether it is a raw socket
+    """
+
+    proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(family, kind, proto)
+        except OSError:
+            continue
+        sock.setblocking(False)
+        return sock, kind == socket.SOCK_RAW
+    raise PermissionError(f"Could not open an ICMP socket for address family {family}")
+
+
+class PingResult:
+    """
+    Outcome of pinging one host.
+    """
+
+    def __init__(self, host: str, sent: int, rtts: list[float], address: Optional[str] = None) -> None:
+        self.host = host
+        self.address = address
+        self.sent = sent
+        self.rtts = rtts
+
+
+    @property
+    def received(self) -> int:
+        return len(self.rtts)
+
+
+    @property
+    def available(self) -> bool:
+        return self.received > 0
+
+
+    @property
+    def loss(self) -> float:
+        return 1.0 - self.received / self.sent if self.sent else 1.0
+
+
+    @property
+    def rtt_avg(self) -> Optional[float]:
+        return sum(self.rtts) / len(self.rtts) if self.rtts else None
+
+
+    def to_dict(self) -> dict:
+        return {
+            "host": self.host,
+            "address": self.address,
+            "sent": self.sent,
+            "received": self.received,
+            "loss": round(self.loss, 3),
+            "rtt_min_ms": round(min(self.rtts) * 1000, 3) if self.rtts else None,
+            "rtt_avg_ms": round(self.rtt_avg * 1000, 3) if self.rtts else None,
+            "rtt_max_ms": round(max(self.rtts) * 1000, 3) if self.rtts else None
+        }
+
+
+class AsyncPinger:
+    """
+    Sends ICMP echo requests from one socket per address family on the running event loop.
+    Any number of pings can be in flight at once; replies are matched to requests by sequence
+    number (and identifier, on raw sockets) and source address.
+    Raw sockets receive every echo reply sent to the host, so each pinger in the process uses its own identifier.
+    Datagram ICMP sockets only receive replies to their own requests (the kernel sets the identifier).
+    """
+
+    idents: set[int] = set()
+    idents_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self.sockets: dict[int, tuple[socket.socket, bool]] = {}
+        with AsyncPinger.idents_lock:
+            self.ident = random.getrandbits(16)
+            while self.ident in AsyncPinger.idents:
+                self.ident = random.getrandbits(16)
+            AsyncPinger.idents.add(self.ident)
+        self.sequence = random.getrandbits(16)
+        self.waiters: dict[tuple[int, int], tuple[asyncio.Future, str, float]] = {}
+
+
+    def _socket(self, family: int) -> tuple[socket.socket, bool]:
+        if family not in self.sockets:
+            sock, raw = open_icmp_socket(family)
+            self.sockets[family] = (sock, raw)
+            asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable, family)
+        return self.sockets[family]
+
+
+    def _on_readable(self, family: int) -> None:
+        """
+        Read every waiting reply and resolve the matching pings.
+        """
+
+        sock, raw = self.sockets[family]
+        while True:
+            try:
+                data, address = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received = time.monotonic()
+            # raw IPv4 sockets receive the IP header too
+            if raw and family == socket.AF_INET:
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < ICMP_HEADER.size:
+                continue
+            icmp_type, _, _, ident, sequence = ICMP_HEADER.unpack_from(data)
+            if icmp_type != ECHO_TYPES[family][1] or (raw and ident != self.ident):
+                continue
+            waiter = self.waiters.get((family, sequence))
+            if waiter is None or waiter[1] != address[0] or waiter[0].done():
+                continue
+            waiter[0].set_result(received - waiter[2])
+
+
+    async def ping(self, host: str, count: int = 1, timeout: float = 1.0) -> PingResult:
+        """
+        Ping a host.
+
+        Args:
+            host (str): Hostname or IP address
+            count (int, optional): Number of echo requests. Defaults to 1.
+            timeout (float, optional): Seconds to wait for replies after sending. Defaults to 1.0.
+
+        Raises:
+            PermissionError: If no ICMP socket can be opened.
+
+        Returns:
+            PingResult: Replies received and their round trip times
+        """
+
+        loop = asyncio.get_running_loop()
+        try:
+            info = await asyncio.wait_for(resolver.resolve_async(host), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return PingResult(host, count, [])
+        family, _, _, _, sockaddr = info[0]
+        sock, raw = self._socket(family)
+        request_type = ECHO_TYPES[family][0]
+
+        futures = []
+        for _ in range(count):
+            self.sequence = (self.sequence + 1) & 0xffff
+            sequence = self.sequence
+            packet = ICMP_HEADER.pack(request_type, 0, 0, self.ident, sequence) + PAYLOAD
+            if family == socket.AF_INET:
+                # the kernel fills in ICMPv6 checksums
+                packet = packet[:2] + struct.pack('!H', checksum(packet)) + packet[4:]
+            future = loop.create_future()
+            self.waiters[(family, sequence)] = (future, sockaddr[0], time.monotonic())
+            futures.append((sequence, future))
+            try:
+                sock.sendto(packet, sockaddr)
+            except OSError:
+                # e.g., network unreachable: counted as lost
+                future.cancel()
+
+        await asyncio.wait([future for _, future in futures], timeout=timeout)
+        rtts = []
+        for sequence, future in futures:
+            self.waiters.pop((family, sequence), None)
+            if future.done() and not future.cancelled():
+                rtts.append(future.result())
+            else:
+                future.cancel()
+        return PingResult(host, count, rtts, sockaddr[0])
+
+
+    def close(self) -> None:
+        """
+        Close the ICMP sockets.
+        """
+
+        for sock, _ in self.sockets.values():
+            try:
+                asyncio.get_running_loop().remove_reader(sock.fileno())
+            except RuntimeError:
+                pass
+            sock.close()
+        self.sockets.clear()
+        with AsyncPinger.idents_lock:
+            AsyncPinger.idents.discard(self.ident)
+
+
+def ping_many(hosts: list[str], count: int = 1, timeout: float = 1.0) -> dict[str, PingResult]:
+    """
+    Ping several hosts at once from the calling thread (which must not be running an event loop).
+
+    Args:
+        hosts (list[str]): Hostnames or IP addresses
+        count (int, optional): Echo requests per host. Defaults to 1.
+        timeout (float, optional): Seconds to wait for replies. Defaults to 1.0.
+
+    Raises:
+        PermissionError: If no ICMP socket can be opened.
+
+    Returns:
+        dict[str, PingResult]: Result for each host
+    """
+
+    async def run() -> list[PingResult]:
+        pinger = AsyncPinger()
+        try:
+            return await asyncio.gather(*(pinger.ping(host, count, timeout) for host in hosts))
+        finally:
+            pinger.close()
+
+    return {result.host: result for result in asyncio.run(run())}
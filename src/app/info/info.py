@@ -9,8 +9,10 @@
 #
 
 
-from flask import Blueprint, render_template, redirect, url_for, g, Response
+from flask import Blueprint, render_template, redirect, request, url_for, g, jsonify, Response
 from app.extensions import globals
+from app.serviceHistory import service_history
+from app.serviceMonitor import service_monitor
 
 info = Blueprint("info",__name__, template_folder=f'templates', static_folder=f'static')     # add path to templates/static if error
 
@@ -49,9 +51,38 @@ def services() -> Response:
 
     if not globals.services_home_enabled:
         return redirect(url_for("main.home"))
-    elif globals.services_list == None:
-        return render_template('services.html',services=None)
-    return render_template('services.html',services=len(globals.services_list),status=globals.services_status, num_status = len(globals.services_status))
+    return render_template('services.html')
+
+
+@info.route('/services.json', methods=['GET'])
+def services_json() -> Response:
+    """
+    Status of required services (with uptime and latency percentiles from their check history) and of logged services.
+    `?points=N` includes the newest N check results of each required service (defaults to 60).
+
+    Returns:
+        Response: JSON response or a redirect response.
+    """
+
+    if not globals.services_home_enabled:
+        return redirect(url_for("main.home"))
+    points = max(0, min(request.args.get('points', 60, type=int), globals.service_check_history))
+    monitored = service_monitor.stats()['services']
+    required = []
+    for service in globals.required_services or []:
+        status = monitored.get(service['name'], {})
+        required.append({
+            "name": service['name'],
+            "host": service['host'],
+            "type": service['type'],
+            "available": status.get('available'),
+            "checked_at": status.get('checked_at'),
+            **(service_history.summary(service['name'], points) or {"checks": 0, "uptime": None, "latency": {}, "history": []})
+        })
+    logged = None
+    if globals.services_list is not None:
+        logged = [{"service": name, "host": value[0], "status": value[1]} for name, value in list(globals.services_status.items())]
+    return jsonify({"required_services": required, "logged_services": logged, "history_size": globals.service_check_history})
 
 
 @info.route('/bookmarks', methods=['GET'])
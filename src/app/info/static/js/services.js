@@ -0,0 +1,123 @@
+/*
+ * Challenge Sever
+ * Copyright 2024 Carnegie Mellon University.
+ * NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+ * Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+ * [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+ * DM24-0645
+ */
+
+
+/*
+ * Renders /info/services from /info/services.json and refreshes it every 10s.
+ */
+
+document.addEventListener("DOMContentLoaded", () => {
+    const POLL_INTERVAL  = 10000;
+    const FIELDSET_WIDTH = "70%";
+
+    const servicesDiv = document.getElementById("services");
+    if (!servicesDiv) return;
+
+    function cell(row, text, className) {
+      const td = document.createElement("td");
+      td.className = className || "service2";
+      td.textContent = text;
+      row.appendChild(td);
+      return td;
+    }
+
+    function ms(seconds) {
+      return seconds == null ? "-" : `${Math.round(seconds * 1000)} ms`;
+    }
+
+    function table(title, headers, rows) {
+      const fieldset = document.createElement("fieldset");
+      fieldset.style.width = FIELDSET_WIDTH;
+      const legend = document.createElement("legend");
+      legend.align = "center";
+      legend.textContent = title;
+      fieldset.appendChild(legend);
+
+      const tbl = document.createElement("table");
+      tbl.className = "res-table";
+      const thead = document.createElement("thead");
+      thead.className = "res-thead";
+      headers.forEach((txt, i) => {
+        const th = document.createElement("th");
+        th.className = i === 0 ? "service1" : "service2";
+        th.textContent = txt;
+        thead.appendChild(th);
+      });
+      tbl.appendChild(thead);
+      rows.forEach((row) => tbl.appendChild(row));
+      fieldset.appendChild(tbl);
+      return fieldset;
+    }
+
+    function requiredRow(service) {
+      const tr = document.createElement("tr");
+      tr.className = "bodypost";
+      cell(tr, service.name, "service1");
+      cell(tr, service.type);
+      cell(tr, service.available == null ? "Not checked yet" : (service.available ? "Available" : "Unavailable"));
+      cell(tr, service.uptime == null ? "-" : `${service.uptime}% of ${service.checks} checks`);
+      const latency = service.latency || {};
+      cell(tr, `${ms(latency.p50)} / ${ms(latency.p90)} / ${ms(latency.p99)}`);
+
+      // newest checks, oldest first: one green (up) or red (down) mark each
+      const recent = cell(tr, "");
+      (service.history || []).forEach(([timestamp, up, seconds]) => {
+        const mark = document.createElement("span");
+        mark.textContent = "▍";
+        mark.style.color = up ? "green" : "red";
+        mark.title = `${new Date(timestamp * 1000).toLocaleString()}: ${up ? "up" : "down"} (${ms(seconds)})`;
+        recent.appendChild(mark);
+      });
+      return tr;
+    }
+
+    function loggedRow(service) {
+      const tr = document.createElement("tr");
+      tr.className = "bodypost";
+      cell(tr, service.host, "service1");
+      cell(tr, service.service);
+      cell(tr, service.status);
+      return tr;
+    }
+
+    async function fetchAndRender() {
+      try {
+        const resp = await fetch("/info/services.json");
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        const res = await resp.json();
+
+        servicesDiv.innerHTML = "";
+        if (!res.required_services.length && res.logged_services == null) {
+          const h2 = document.createElement("h2");
+          h2.textContent = "No services configured for checking";
+          servicesDiv.appendChild(h2);
+          return;
+        }
+        if (res.required_services.length) {
+          servicesDiv.appendChild(table("Required Services",
+            ["Service", "Type", "Status", "Uptime", "Latency p50 / p90 / p99", "Recent Checks"],
+            res.required_services.map(requiredRow)));
+        }
+        if (res.logged_services != null) {
+          if (!res.logged_services.length) {
+            const h2 = document.createElement("h2");
+            h2.textContent = "Logged services have not been checked yet.";
+            servicesDiv.appendChild(h2);
+          } else {
+            servicesDiv.appendChild(table("Logged Services", ["Host", "Service", "Status"], res.logged_services.map(loggedRow)));
+          }
+        }
+      } catch (e) {
+        console.error("Fetch error:", e);
+      }
+    }
+
+    fetchAndRender();
+    setInterval(fetchAndRender, POLL_INTERVAL);
+  });
@@ -9,18 +9,28 @@
 #
 
 
-import datetime, copy, os
+import datetime, copy, json, os, queue, threading, time
 from flask import Blueprint, render_template, request, redirect, url_for, send_from_directory, jsonify, flash, g, Response
 from typing import Any
 from app.databaseHelpers import check_questions
-from app.grading import do_grade
-from app.extensions import logger, globals
+from app.eventWriter import get_submission_counts
+from app.extensions import challenge_state, logger, globals, notifier
 from app.grading import read_token
+from app.tokenStore import token_store
+from app.startupScripts import startup_graph
+from app.serviceMonitor import service_monitor
+from app.resolver import resolver
+from app.cronProbes import cron_probes
+from app.gradingCache import grading_cache
+from app.gradingJobs import client_key, grading_jobs
 from app.fileUploads import save_uploaded_file, get_most_recent_uploads
-from app.models import QuestionTracking
 
 main = Blueprint("main",__name__, template_folder='templates', static_folder='static')
 
+# Serialized /challenge/update payload for the current challenge_state.version
+update_cache = {"version": None, "etag": None, "body": None}
+update_cache_lock = threading.Lock()
+
 
 @main.before_request
 def pass_globals() -> None:
@@ -102,6 +112,8 @@ def upload() -> Response:
 def grade() -> Response:
     """
     Handle grading requests, with rate limiting and task management.
+    Each client (by X-Real-IP) waits on its own grading job. Identical submissions that are
+    already being graded share that job. See /challenge/grade/<job_id> for job status.
 
     Returns:
         Response: Render grading or results page, or redirect appropriately.
@@ -118,24 +130,22 @@ def grade() -> Response:
         logger.info("Tried to perform grading before server was marked as ready.")
         return redirect(url_for("info.main"))
 
-    # if there is no current grading task, then create one
-    if not globals.task:
-        now_time = datetime.datetime.now()
-        now_string = now_time.strftime("%m/%d/%Y %H:%M:%S")
-        submit_time_time = datetime.datetime.strptime(globals.manual_submit_time, "%m/%d/%Y %H:%M:%S")
+    client = client_key()
+    job = grading_jobs.for_client(client)
 
+    # if this client is not waiting on a grading job, then create one
+    if job is None:
         # rate limiting grading attempts - display graded and let user know how long to wait
-        if submit_time_time + globals.grading_rateLimit > now_time:
-            try_again = (globals.grading_rateLimit - (now_time - submit_time_time)).total_seconds().__int__()
+        try_again = grading_jobs.retry_after(client)
+        if try_again > 0:
             logger.info(f"Hit rate limit. Telling user to try again in {try_again} seconds")
             return redirect(url_for("main.tasks"))
 
-        globals.manual_submit_time = now_string
-        logger.info(f"Submitting a grading task at {globals.manual_submit_time}. Request method is {request.method}")
+        logger.info(f"Submitting a grading task for {client}. Request method is {request.method}")
         if request.method == "GET":
-            # GET requests should call do_grade without any arguments
-            globals.task = globals.executor.submit(do_grade)
-        if request.method == "POST":
+            # GET requests call do_grade without any submitted answers
+            grade_args = {}
+        else:
             req_data = request.form.to_dict()
             # POST requests will several form fields to pass to the grading script
             # Arguments to do_grade are the values from the form fields submitted
@@ -143,21 +153,42 @@ def grade() -> Response:
 
             # Make sure the grading script gets all grading check keys even if the user didn't enter anything.
             user_did_not_submit = {check_name: '' for check_name in globals.grading_parts}
+            grade_args = user_did_not_submit | req_data
+
+        job, coalesced = grading_jobs.submit(client, grade_args)
+        if not coalesced:
+            globals.manual_submit_time = job.submitted_at
+            challenge_state.bump()
+            notifier.publish('grading-started', {"submit_time": job.submitted_at, "job_id": job.id})
+        return render_template('grading.html', submit_time=job.submitted_at, job_id=job.id)
+
+    # if the client's grading job is done, collect and display the results
+    if job.done:
+        grading_jobs.release(client)
+        logger.debug(f"Rendering graded results html page for user. Fatal error is {job.error}")
+        return redirect(url_for('main.results'))
 
-            globals.task = globals.executor.submit(do_grade, user_did_not_submit | req_data)
+    # if the client's grading job is still queued or running, show the grading page with its submit time
+    logger.debug(f"Grading job {job.id} is {job.status}")
+    return render_template('grading.html', submit_time=job.submitted_at, job_id=job.id)
 
-        return render_template('grading.html', submit_time=globals.manual_submit_time)
 
-    # if the current grading task is done, collect and display the results
-    if globals.task.done():
-        globals.task = None
-        logger.debug(f"Rendering graded results html page for user. Fatal error is {globals.fatal_error}")
-        return redirect(url_for('main.results'))
+@main.route('/grade/<job_id>', methods=['GET'])
+def grade_status(job_id: str) -> Response:
+    """
+    Status of a grading job.
+
+    Args:
+        job_id (str): Job ID returned when the grading job was submitted
 
-    # if the current grading task is still running, show the grading page with the last submit time
-    if globals.task.running():
-        logger.debug("Grading task is still running")
-        return render_template('grading.html', submit_time=globals.manual_submit_time)
+    Returns:
+        Response: JSON job status, or 404 if the job is unknown.
+    """
+
+    job = grading_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown grading job {job_id}"}), 404
+    return jsonify(job.to_dict())
 
 
 @main.route('/results',methods=['GET'])
@@ -176,11 +207,35 @@ def results() -> str:
 def updated_results() -> Response:
     """
     Fetch updated grading results and tokens as JSON.
+    The payload is serialized once per state version and served with an ETag,
+    so repeat requests with a matching If-None-Match get 304 Not Modified.
 
     Returns:
         Response: JSON response containing grading results.
     """
 
+    version = challenge_state.version
+    with update_cache_lock:
+        if update_cache['version'] != version:
+            update_cache['body'] = json.dumps(build_update_payload()).encode('utf-8')
+            update_cache['etag'] = f"{challenge_state.epoch}-{version}"
+            update_cache['version'] = version
+        body, etag = update_cache['body'], update_cache['etag']
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def build_update_payload() -> dict:
+    """
+    Build the /challenge/update payload from the current grading state.
+
+    Returns:
+        dict: Grading results, tokens and submission times.
+    """
+
     new_cron_results = copy.deepcopy(globals.cron_results) if globals.cron_results != None else dict()
     new_manual_results = copy.deepcopy(globals.manual_results) if globals.manual_results != None else dict()
 
@@ -190,21 +245,21 @@ def updated_results() -> Response:
         for phase in globals.phase_order:
             try:
                 for question in globals.phases[phase]:
-                    que_chk = QuestionTracking.query.filter_by(label=question).first()
+                    que_chk = challenge_state.question(question)
 
-                    if que_chk.q_type == 'cron':
-                        if que_chk.solved == True:
-                            globals.tokens['cron'][que_chk.label] = read_token(que_chk.label)
-                            new_cron_results[que_chk.label] = f"Success -- {que_chk.response}" if (que_chk.response != "" and que_chk.response != "N/A"  ) else "Success"
+                    if que_chk['q_type'] == 'cron':
+                        if que_chk['solved'] == True:
+                            globals.tokens['cron'][question] = read_token(question)
+                            new_cron_results[question] = f"Success -- {que_chk['response']}" if (que_chk['response'] != "" and que_chk['response'] != "N/A"  ) else "Success"
                         else:
-                            new_cron_results[que_chk.label] = f"Failure" if que_chk.response == "N/A" else (f"Failure -- {que_chk.response}" if que_chk.response != "" else "Failure -- Has not been graded yet.")
+                            new_cron_results[question] = f"Failure" if que_chk['response'] == "N/A" else (f"Failure -- {que_chk['response']}" if que_chk['response'] != "" else "Failure -- Has not been graded yet.")
                         continue
-                    if que_chk.q_type in globals.MANUAL_MODE:
-                        if que_chk.solved == True:
-                            globals.tokens['manual'][que_chk.label] = read_token(que_chk.label)
-                            new_manual_results[que_chk.label] = f"Success -- {que_chk.response}" if (que_chk.response != "" and que_chk.response != "N/A"  ) else "Success"
+                    if que_chk['q_type'] in globals.MANUAL_MODE:
+                        if que_chk['solved'] == True:
+                            globals.tokens['manual'][question] = read_token(question)
+                            new_manual_results[question] = f"Success -- {que_chk['response']}" if (que_chk['response'] != "" and que_chk['response'] != "N/A"  ) else "Success"
                         else:
-                            new_manual_results[que_chk.label] = "Failure" if que_chk.response == "N/A" else (f"Failure -- {que_chk.response}" if que_chk.response != "" else "Failure -- Has not been graded yet.")
+                            new_manual_results[question] = "Failure" if que_chk['response'] == "N/A" else (f"Failure -- {que_chk['response']}" if que_chk['response'] != "" else "Failure -- Has not been graded yet.")
                         continue
 
                 if phase == globals.current_phase:
@@ -241,7 +296,95 @@ def updated_results() -> Response:
             "tokens":globals.tokens,
             "fatal_error":globals.fatal_error
             }
-    return jsonify(tmp_globals)
+    return tmp_globals
+
+
+@main.route('/events',methods=['GET'])
+def events() -> Response:
+    """
+    Server-Sent Events stream of grading events (grading-started, grading-progress, grading-finished, cron-result, phase-advanced).
+    The stream closes after `event_stream_timeout` seconds and the browser reconnects automatically.
+    Returns 503 when the stream limit is reached so clients fall back to polling /challenge/update.
+
+    Returns:
+        Response: A text/event-stream response.
+    """
+
+    subscription = notifier.subscribe()
+    if subscription is None:
+        return Response("Too many event streams. Poll /challenge/update instead.", status=503, headers={"Retry-After": "5"})
+
+    job = grading_jobs.for_client(client_key())
+    grading = job is not None and not job.done
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            yield f"event: state\ndata: {json.dumps({'grading': grading})}\n\n"
+            deadline = time.monotonic() + globals.event_stream_timeout
+            while time.monotonic() < deadline:
+                try:
+                    event, data = subscription.get(timeout=15)
+                    yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            notifier.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def is_local_request() -> bool:
+    """
+    Returns:
+        bool: True if the request came from the local host and not through the reverse proxy.
+    """
+
+    return request.remote_addr in ('127.0.0.1', '::1') and not request.headers.get("X-Real-IP")
+
+
+@main.route('/metrics',methods=['GET'])
+def metrics() -> Response:
+    """
+    Report internal server metrics as JSON.
+    Only accepted from the local host (not through the reverse proxy).
+
+    Returns:
+        Response: JSON response containing server metrics.
+    """
+
+    if not is_local_request():
+        return jsonify({"error": "Metrics are only available from the local host"}), 403
+    writer = globals.event_writer.stats() if globals.event_writer else {"running": False}
+    return jsonify({"event_writer": writer, "event_streams": notifier.stats(), "tokens": token_store.stats(), "grading_cache": grading_cache.stats(), "grading_jobs": grading_jobs.stats(), "cron_probes": cron_probes.stats(), "startup": startup_graph.stats(), "services": service_monitor.stats(), "resolver": resolver.stats()})
+
+
+@main.route('/tokens/refresh',methods=['POST'])
+def refresh_tokens() -> Response:
+    """
+    Drop the cached tokens and read them again.
+    Only accepted from the local host (not through the reverse proxy).
+
+    Returns:
+        Response: JSON response with token cache stats.
+    """
+
+    if not is_local_request():
+        return jsonify({"error": "Token refresh is only allowed from the local host"}), 403
+    token_store.refresh()
+    return jsonify(token_store.stats())
+
+
+@main.route('/submissions',methods=['GET'])
+def submissions() -> Response:
+    """
+    Report the number of submissions (total and per grading part) as JSON.
+
+    Returns:
+        Response: JSON response containing submission counts.
+    """
+
+    return jsonify(get_submission_counts())
 
 
 @main.route("/files", defaults={'folder':''})
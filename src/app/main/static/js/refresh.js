@@ -7,6 +7,30 @@
  * DM24-0645
  */
 
-setTimeout(function(){
-    window.location.href = "/challenge/grade"
-}, 5000);
+/*
+ * Reloads /challenge/grade once grading has finished.
+ * Listens on /challenge/events and falls back to reloading every 5s when the stream is unavailable.
+ */
+
+(function() {
+    const FALLBACK_INTERVAL = 5000;
+
+    function reload() {
+        window.location.href = "/challenge/grade";
+    }
+
+    if (!window.EventSource) {
+        setTimeout(reload, FALLBACK_INTERVAL);
+        return;
+    }
+
+    const source = new EventSource("/challenge/events");
+    source.addEventListener("grading-finished", reload);
+    source.addEventListener("state", (e) => {
+        // grading finished before the stream connected
+        if (!JSON.parse(e.data).grading) reload();
+    });
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) setTimeout(reload, FALLBACK_INTERVAL);
+    };
+})();
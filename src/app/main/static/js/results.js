@@ -8,7 +8,8 @@
  */
 
 /*
- * Polls /challenge/update immediately on load, then every 5s,
+ * Fetches /challenge/update on load and again whenever /challenge/events reports new results.
+ * Falls back to polling every 5s when the event stream is unavailable.
  */
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -137,7 +138,22 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     }
 
-    // fire once now, then every 5s
+    let pollTimer = null;
+    function startPolling() {
+      if (pollTimer === null) pollTimer = setInterval(fetchAndRender, POLL_INTERVAL);
+    }
+
+    // fire once now, then whenever results change
     fetchAndRender();
-    setInterval(fetchAndRender, POLL_INTERVAL);
+    if (!window.EventSource) {
+      startPolling();
+      return;
+    }
+    const source = new EventSource("/challenge/events");
+    ["grading-progress", "grading-finished", "cron-result", "phase-advanced"].forEach((name) => {
+      source.addEventListener(name, fetchAndRender);
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) startPolling();
+    };
   });
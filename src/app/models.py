@@ -102,6 +102,61 @@ class EventTracker(db.Model):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
 
+class SolveRecord(db.Model):
+    """
+    SQLAlchemy model used as a high-water mark for recorded solves.
+    A row exists for every question/phase that already has its "Solved" event in the EventTracker,
+    so each solve is only ever recorded once (including across restarts).
+
+    Attributes:
+        kind (str): Event type of the solve ('Question Solved' or 'Phase Solved').
+        label (str): Label of the solved question or phase.
+        solved_at (str): Timestamp string of when the question or phase was solved.
+        recorded_at (str): Timestamp string of when the solve event was recorded.
+    """
+
+    __tablename__ = 'SolveRecords'
+    kind = db.Column(db.String, primary_key=True)
+    label = db.Column(db.String, primary_key=True)
+    solved_at = db.Column(db.String, nullable=False)
+    recorded_at = db.Column(db.String, nullable=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Serialize the SolveRecord instance into a dictionary.
+
+        Returns:
+            Dict[str, Any]: A dictionary representation of the model's columns and values.
+        """
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class SubmissionCounter(db.Model):
+    """
+    SQLAlchemy model for counting submissions. Counters are only ever changed with a single
+    atomic `count = count + n` statement so concurrent writers never lose an update.
+
+    Attributes:
+        name (str): Counter name. 'total' for all submissions, otherwise the grading part label (e.g., 'GradingCheck1').
+        count (int): Number of submissions recorded.
+    """
+
+    __tablename__ = 'SubmissionCounters'
+    name = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Serialize the SubmissionCounter instance into a dictionary.
+
+        Returns:
+            Dict[str, Any]: A dictionary representation of the model's columns and values.
+        """
+
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
 class FileUpload(db.Model):
     """
     SQLAlchemy model for storing metadata about uploaded files.
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import queue, threading
+from typing import Optional
+
+
+class EventBroker:
+    """
+    Publish/subscribe hub for pushing grading events to browsers (see /challenge/events).
+    Each subscriber gets its own bounded queue. Publishing never blocks: a subscriber that
+    is not keeping up simply misses events and will re-sync on its next fetch.
+    """
+
+    def __init__(self, queue_size: int = 100) -> None:
+        """
+        Args:
+            queue_size (int, optional): Maximum number of undelivered events per subscriber. Defaults to 100.
+        """
+
+        self.queue_size = queue_size
+        self.max_subscribers = 0
+        self.published = 0
+        self.rejected = 0
+        self._subscribers: set[queue.Queue] = set()
+        self._lock = threading.Lock()
+
+
+    def subscribe(self) -> Optional[queue.Queue]:
+        """
+        Register a new subscriber.
+
+        Returns:
+            Optional[queue.Queue]: Queue that receives (event, data) tuples, or None if the subscriber limit is reached.
+        """
+
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscription: queue.Queue = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(subscription)
+            return subscription
+
+
+    def unsubscribe(self, subscription: queue.Queue) -> None:
+        """
+        Remove a subscriber.
+
+        Args:
+            subscription (queue.Queue): Queue returned by subscribe()
+        """
+
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+    def publish(self, event: str, data: Optional[dict] = None) -> None:
+        """
+        Send an event to every subscriber.
+
+        Args:
+            event (str): Event name (e.g., 'grading-finished')
+            data (Optional[dict], optional): JSON-serializable event payload. Defaults to None.
+        """
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait((event, data or {}))
+            except queue.Full:
+                pass
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of connected subscribers, the subscriber limit and publish/reject counters
+        """
+
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+                "rejected": self.rejected
+            }
@@ -9,10 +9,14 @@
 #
 
 
-import subprocess, re, socket, requests
+import subprocess, re, socket, threading, requests
 from datetime import datetime
-from time import sleep
+from time import monotonic, sleep
+from typing import Optional
 from app.extensions import globals, logger
+from app.icmp import ping_many
+from app.resolver import connect, ip_version, resolver
+from app.serviceHistory import service_history
 
 
 def checkLocalPorts() -> str:
@@ -57,41 +61,23 @@ def isIPv4(host: str) -> bool:
     Checks the IP version of a given address
     Returns True if the address is IPv4
     Returns False if the address is IPv6
-    If host is a hostname/FQDN, attempts to resolve as IPv4
-    If unsuccessful, assumes address is IPv6
+    If host is a hostname/FQDN, returns True if it resolves to an IPv4 address (through the cached resolver)
 
     Args:
         host (str): Hostname or IP Address
 
     Returns:
-        bool: True if address is IPv4. False if address is IPv6
+        bool: True if address is IPv4. False if address is IPv6 (or a hostname with no IPv4 address)
     """
 
-    if isValidIPv4(host):
-        logger.debug(f"Regex matched {host} as a valid IPv4 address")
-        return True
-    elif isValidIPv6(host):
-        logger.debug(f"Regex matched {host} as a valid IPv6 address")
+    version = ip_version(host)
+    if version is not None:
+        return version == 4
+    try:
+        return any(info[0] == socket.AF_INET for info in resolver.resolve(host))
+    except OSError as e:
+        logger.error(f"Failed to resolve {host} - Check DNS Entry. Exception: {e}")
         return False
-    else:
-        try:
-            ipAddr = socket.gethostbyname(str(host))
-            logger.debug(f"Resolved IPv4 address of {host} is {ipAddr}")
-            return True
-        except socket.gaierror as e:
-            errNum = e.errno
-            if errNum == int(-5):
-                logger.info(f"Treating {host} as an IPv6 address")
-                return False
-            elif errNum == int(-3):
-                logger.error(f"Failed to resolve {host} - Check DNS Entry. Assuming IPv4 in the meantime")
-                return True
-            else:
-                logger.error(f"Socket Error in isIPv4 Function - {e}. Assuming IPv4 in the meantime")
-                return True
-        except Exception as e:
-            logger.error(f"Exception in isIPv4 Function - {e}. Assuming IPv4 in the meantime")
-            return True
 
 
 def isValidIPv4(host: str) -> bool:
@@ -105,15 +91,12 @@ def isValidIPv4(host: str) -> bool:
         bool: Returns True if the given host is a valid IPv4 address.
     """
 
-    ipv4_re = re.compile(
-        (r'((25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.)'
-         r'{3,3}(25[0-5]|(2[0-4]|1{0,1}[0-9]){0,1}[0-9])'))
-    return bool(ipv4_re.match(host))
+    return ip_version(host) == 4
 
 
 def isValidIPv6(host: str) -> bool:
     """
-    Returns True if the given host is a valid IPv6 address.
+    Returns True if the given host is a valid IPv6 address (with or without a %scope suffix).
 
     Args:
         host (str): IP Address
@@ -122,33 +105,18 @@ def isValidIPv6(host: str) -> bool:
         bool: Returns True if the given host is a valid IPv6 address.
     """
 
-    ipv6_re = re.compile(
-        (r'([0-9a-fA-F]{1,4}:){7,7}[0-9a-fA-F]{1,4}|'
-         r'([0-9a-fA-F]{1,4}:){1,7}:|'
-         r'([0-9a-fA-F]{1,4}:){1,6}:[0-9a-fA-F]{1,4}|'
-         r'([0-9a-fA-F]{1,4}:){1,5}(:[0-9a-fA-F]{1,4}){1,2}|'
-         r'([0-9a-fA-F]{1,4}:){1,4}(:[0-9a-fA-F]{1,4}){1,3}|'
-         r'([0-9a-fA-F]{1,4}:){1,3}(:[0-9a-fA-F]{1,4}){1,4}|'
-         r'([0-9a-fA-F]{1,4}:){1,2}(:[0-9a-fA-F]{1,4}){1,5}|'
-         r'[0-9a-fA-F]{1,4}:((:[0-9a-fA-F]{1,4}){1,6})|'
-         r':((:[0-9a-fA-F]{1,4}){1,7}|:)|'
-         r'fe80:(:[0-9a-fA-F]{0,4}){0,4}%[0-9a-zA-Z]{1,}|'
-         r'::(ffff(:0{1,4}){0,1}:){0,1}((25[0-5]|'
-         r'(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|'
-         r'(2[0-4]|1{0,1}[0-9]){0,1}[0-9])|'
-         r'([0-9a-fA-F]{1,4}:){1,4}:((25[0-5]|'
-         r'(2[0-4]|1{0,1}[0-9]){0,1}[0-9])\.){3,3}(25[0-5]|'
-         r'(2[0-4]|1{0,1}[0-9]){0,1}[0-9])'))
-    return bool(ipv6_re.match(host))
-
-
-def checkPing(host: str, count: int = 1) -> bool:
+    return ip_version(host) == 6
+
+
+def checkPing(host: str, count: int = 1, timeout: float = 1) -> bool:
     """
     Checks to see if a host is able to be reached via ping
+    Pings are sent in-process over an ICMP socket (see app.icmp). The ping binary is only used if no ICMP socket can be opened.
 
     Args:
         host (str): Hostname/IP address to ping
         count (int, optional): Number of pings to attempt. Defaults to 1.
+        timeout (float, optional): Seconds to wait for the replies. Defaults to 1.
 
     Returns:
         bool:     Returns True if the host can be pinged. Returns False if the host cannot be pinged.
@@ -156,7 +124,32 @@ def checkPing(host: str, count: int = 1) -> bool:
 
     logger.debug(f"Pinging host {host}")
     try:
-        results = subprocess.run(f"ping {host} -W 1 -c {count}", shell=True, capture_output=True)
+        result = ping_many([host], count, timeout)[host]
+    except PermissionError as e:
+        logger.warning(f"Could not open an ICMP socket ({e}). Falling back to the ping command.")
+        return checkPingCommand(host, count, timeout)
+    if result.available:
+        logger.info(f"Successful ping to host {host} - {result.to_dict()}")
+        return True
+    logger.error(f"Failed to ping host {host} - {result.to_dict()}")
+    return False
+
+
+def checkPingCommand(host: str, count: int = 1, timeout: float = 1) -> bool:
+    """
+    Checks to see if a host is able to be reached by running the ping command
+
+    Args:
+        host (str): Hostname/IP address to ping
+        count (int, optional): Number of pings to attempt. Defaults to 1.
+        timeout (float, optional): Seconds to wait for each reply. Defaults to 1.
+
+    Returns:
+        bool:     Returns True if the host can be pinged. Returns False if the host cannot be pinged.
+    """
+
+    try:
+        results = subprocess.run(["ping", host, "-W", str(max(1, int(timeout))), "-c", str(count)], capture_output=True)
         exit_code = results.returncode
         stdout_string = " \\n ".join(line.strip() for line in results.stdout.decode("UTF-8").splitlines())
         stderr_string = " \\n ".join(line.strip() for line in results.stderr.decode("UTF-8").splitlines())
@@ -171,13 +164,15 @@ def checkPing(host: str, count: int = 1) -> bool:
         return False
 
 
-def checkSocket(host: str, port: str|int) -> bool:
+def checkSocket(host: str, port: str|int, timeout: float = 2) -> bool:
     """
     Checks to see if a remote socket (host/port pair) is reachable
+    Hostnames are resolved through the cached resolver and every address is tried in turn, alternating IPv6 and IPv4.
 
     Args:
         host (str): Hostname or IP Address
         port (str|int): Port number
+        timeout (float, optional): Seconds to wait for a connection. Defaults to 2.
 
     Returns:
         bool: Returns True if socket connection is successful (port is reachable)
@@ -186,57 +181,114 @@ def checkSocket(host: str, port: str|int) -> bool:
     """
 
     logger.debug(f"Attempting to connect to socket {host}:{port}")
-    success = False
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM) if isIPv4(host) else socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-        s.settimeout(2)
-        s.connect((host, int(port)))
-        s.shutdown(socket.SHUT_RDWR)
+        connect(host, int(port), timeout)
         logger.info(f"Successful connection to socket {host}:{port}")
-        success = True
+        return True
     except socket.gaierror as e:
         logger.error(f"Failed connection to socket {host}:{port}. Get Address Info (DNS) error prevented socket connection. Exception: {e}")
-    except TimeoutError as e:
+    except TimeoutError:
         logger.error(f"Failed connection to socket {host}:{port}. Connection timeout.")
     except Exception as e:
         logger.error(f"Failed connection to connect to socket {host}:{port}. Exception {e}")
-    finally:
-        s.close()
-    return success
+    return False
+
 
+web_sessions: dict[tuple, requests.Session] = {}
+web_sessions_lock = threading.Lock()
 
-def checkWeb(host: str, port: str|int = 80, path:str = '/') -> bool:
+
+def webSession(scheme: str, host: str, port: str|int) -> requests.Session:
+    """
+    Get the pooled session for a web check target, so repeated checks reuse kept-alive connections.
+
+    Args:
+        scheme (str): http or https
+        host (str): Hostname or IP Address of web server
+        port (str|int): Website port
+
+    Returns:
+        requests.Session: Session for the target
+    """
+
+    with web_sessions_lock:
+        session = web_sessions.get((scheme, host, port))
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount(f"{scheme}://", adapter)
+            web_sessions[(scheme, host, port)] = session
+        return session
+
+
+def webCheckOptions(service: dict) -> dict:
+    """
+    Keyword arguments for checkWeb from a web service's settings.
+
+    Args:
+        service (dict): Required service with type web
+
+    Returns:
+        dict: checkWeb keyword arguments
+    """
+
+    return {
+        "timeout": service.get('timeout', 10),
+        "method": service.get('method', 'GET'),
+        "scheme": service.get('scheme', 'http'),
+        "status": service.get('status', [200]),
+        "body_regex": service.get('body_regex'),
+        "max_body": service.get('max_body', 65536),
+        "verify": service.get('verify', True)
+    }
+
+
+def checkWeb(host: str, port: str|int = 80, path:str = '/', timeout: float = 10, method: str = 'GET', scheme: str = 'http',
+             status: Optional[list[int]] = None, body_regex: Optional[str] = None, max_body: int = 65536, verify: bool = True) -> bool:
     """
     Checks connection to a web URL
+    Requests go through a pooled keep-alive session for the target. At most `max_body` bytes of the response are read.
 
     Args:
         host (str): Hostname or IP Address of web server
         port (str, optional): Website port. Defaults to 80.
         path (str, optional): URI path. Defaults to '/'.
+        timeout (float, optional): Seconds to wait to connect and for each read. Defaults to 10.
+        method (str, optional): GET or HEAD. Defaults to 'GET'.
+        scheme (str, optional): http or https. Defaults to 'http'.
+        status (Optional[list[int]], optional): Status codes that count as available. Defaults to [200].
+        body_regex (Optional[str], optional): If set, the response body must also match this regular expression. Defaults to None.
+        max_body (int, optional): Bytes of the body to read. Defaults to 65536.
+        verify (bool, optional): Verify the TLS certificate for https. Defaults to True.
 
     Returns:
-        bool: Returns True if the web request returns a 200
-              Returns False if the web request returns anything but a 200
+        bool: Returns True if the web request returns an accepted status (and the body matches `body_regex`)
+              Returns False otherwise
     """
 
-    fqdn = re.compile(r'(?=^.{4,253}$)(^((?!-)[a-zA-Z0-9-]{1,63}(?<!-)\.)+[a-zA-Z]{2,63}\.?$)')
-    if fqdn.search(host):  # Check if host is FQDN. If True, IP version does not matter.
-        url = f"http://{host}:{port}{path}"
-        logger.debug("checkWeb is using FQDN")
-
-    #  If host is an IP address, IP version is checked as IPv6 requires [ ] brackets
-    elif isIPv4(host):
-        url = f"http://{host}:{port}{path}"
-        logger.debug("checkWeb is using IPv4")
-    else:
-        url = f"http://[{host}]:{port}{path}"
-        logger.debug("checkWeb is using IPv6")
+    if ip_version(host) == 6:  # IPv6 requires [ ] brackets
+        url = f"{scheme}://[{host.strip('[]')}]:{port}{path}"
+    else:  # FQDNs, hostnames and IPv4 addresses are used as-is
+        url = f"{scheme}://{host}:{port}{path}"
 
     logger.debug(f"Attempting to reach {url}")
     try:
-        result = requests.get(url=url)
-        logger.info(f"Web request returned {result.status_code}: {result.content}")
-        return result.status_code == 200
+        result = webSession(scheme, host, port).request(method, url, timeout=(timeout, timeout), stream=True, verify=verify, allow_redirects=False)
+        body = b""
+        if method == 'HEAD':
+            result.content  # marks the (empty) body read so the connection goes back to the pool
+        else:
+            # a fully read body returns the connection to the pool; a body cut off at max_body closes it
+            for chunk in result.iter_content(chunk_size=min(max_body, 16384) or 1):
+                body += chunk
+                if len(body) >= max_body:
+                    result.close()
+                    break
+        available = result.status_code in (status or [200])
+        if available and body_regex:
+            available = re.search(body_regex, body[:max_body].decode('utf-8', errors='replace')) is not None
+        logger.debug(f"Web request to {url} returned {result.status_code} ({len(body)} bytes read, {result.elapsed.total_seconds():.3f}s)")
+        return available
     except requests.exceptions.Timeout as e:
         logger.error(f"Failed connection to {url}. Connection Timeout Exception: {e}")
     except requests.exceptions.InvalidURL as e:
@@ -263,14 +315,16 @@ def checkService(service: dict) -> bool:
     """
 
     logger.debug(f"Checking availability of service: {service}")
+    started = monotonic()
     reachable = False
     service_type = service['type']
     if service_type == 'ping':
-        reachable = checkPing(service['host'])
+        reachable = checkPing(service['host'], service.get('count', 3), service['timeout'])
     elif service_type == 'socket':
-        reachable = checkSocket(service['host'], service['port'])
+        reachable = checkSocket(service['host'], service['port'], service['timeout'])
     elif service_type == 'web':
-        reachable = checkWeb(service['host'], service['port'], service['path'])
+        reachable = checkWeb(service['host'], service['port'], service['path'], **webCheckOptions(service))
+    service_history.record(service['name'], reachable, monotonic() - started)
 
     if reachable:
         logger.info(f"Service available: {service}")
@@ -280,60 +334,95 @@ def checkService(service: dict) -> bool:
         return False
 
 
-def waitForService(service: dict, interval: int = 2, max_attempts: int = 0) -> bool:
+class CheckSchedule:
+    """
+    Decides when a service is checked next, based on its recent results.
+    - While available, it is checked every `interval` seconds, slowing to `stable_interval` after `stable_after` checks in a row.
+    - While unavailable, the delay starts at `wait_interval` and is multiplied by `backoff` up to `max_interval`.
+    - Right after the state changes, it is re-checked after `wait_interval` seconds to confirm the change.
     """
-    Checks the service in a loop until it becomes available or max_attempts is reached.
-    Returns once the service is available or max_attempts is reached.
+
+    def __init__(self, service: dict, wait_interval: Optional[float] = None) -> None:
+        """
+        Args:
+            service (dict): Required service (see Globals.required_services)
+            wait_interval (Optional[float], optional): Overrides the service's `wait_interval`. Defaults to None.
+        """
+
+        self.interval = service.get('interval', 30)
+        self.stable_interval = service.get('stable_interval', self.interval)
+        self.stable_after = service.get('stable_after', 10)
+        self.wait_interval = wait_interval or service.get('wait_interval', 2)
+        self.max_interval = service.get('max_interval', self.interval)
+        self.backoff = service.get('backoff', 2)
+        self.available: Optional[bool] = None
+        self.streak = 0
+        self.delay: float = self.wait_interval
+
+
+    def next_delay(self, available: bool) -> float:
+        """
+        Record a check result.
+
+        Args:
+            available (bool): Whether the service was available
+
+        Returns:
+            float: Seconds until the next check
+        """
+
+        first = self.available is None
+        if available == self.available:
+            self.streak += 1
+        else:
+            self.available = available
+            self.streak = 1
+            self.delay = self.wait_interval
+            if not first:
+                return self.delay  # confirm the change quickly
+        if available:
+            return self.stable_interval if self.streak >= self.stable_after else self.interval
+        if self.streak > 1:
+            self.delay = min(self.max_interval, self.delay * self.backoff)
+        return self.delay
+
+
+def waitForService(service: dict, interval: Optional[int] = None, max_attempts: int = 0, timeout: int = 0) -> bool:
+    """
+    Checks the service in a loop until it becomes available, max_attempts is reached or the timeout passes.
+    The time between checks starts at `interval` and backs off exponentially up to the service's `max_interval` (see CheckSchedule).
+    Returns once the service is available or max_attempts/timeout is reached.
 
     Args:
         service (dict): Service dict with keys expected according to
                         the standard required_service config
-        interval (int, optional): Seconds between re-checking service. Defaults to 2.
+        interval (Optional[int], optional): Seconds before the first re-check. Defaults to the service's `wait_interval` (2).
         max_attempts (int, optional): Maximum number of times to check. Defaults to 0.
+        timeout (int, optional): Seconds to keep checking. 0 means no timeout. Defaults to 0.
 
     Returns:
         bool: Returns True is the service is available.
-              Returns False if the service is not available before max_attempts is reached.
+              Returns False if the service is not available before max_attempts or the timeout is reached.
     """
 
-    service_available = False
+    schedule = CheckSchedule(service, interval)
     attempts = 0
+    deadline = monotonic() + timeout if timeout else None
     while True:
         attempts += 1
         logger.info(f"Waiting for service to become available (attempt number {attempts}): {service}")
-        service_available = checkService(service)
-        if service_available:
-            return service_available
+        if checkService(service):
+            return True
         if max_attempts and attempts == max_attempts:
             logger.error(f"Service unavailable after max attempts ({attempts}): {service}")
             return False
-        sleep(interval)
-
-
-def checkServiceLoop(service: dict, interval: int = 30, max_checks: int = 0) -> bool:
-    """
-    Checks the availability of a service forever in a loop (or until max_checks is reached).
-
-    Args:
-        service (dict): Service dict with keys expected according to
-                        the standard required_service config
-        interval (int, optional): Seconds between re-checking service. Defaults to 30.
-        max_checks (int, optional): Maximum number of times to check. Defaults to 0.
-
-    Returns:
-        bool: Returns True only when the maximum number of checks have completed.
-    """
-
-    logger.info(f"Checking service {service} every {interval} seconds")
-    attempts = 0
-    while True:
-        attempts += 1
-        logger.info(f"Service check number {attempts} for {service}")
-        checkService(service)
-        if max_checks and attempts == max_checks:
-            logger.info(f"Reached the maximum number of service checks ({max_checks}).. Will no longer check on service {service}.")
-            return True
-        sleep(interval)
+        delay = schedule.next_delay(False)
+        if deadline is not None:
+            if monotonic() >= deadline:
+                logger.error(f"Service unavailable after {timeout} seconds: {service}")
+                return False
+            delay = min(delay, deadline - monotonic())
+        sleep(max(0, delay))
 
 
 def get_logs(service: dict) -> None:
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import atexit, json, os, queue, resource, select, struct, subprocess, threading, time
+from typing import Optional
+from app.extensions import globals, logger
+from app.scriptRunner import kill_process_group, limit_resources, run_script, trim_partial_character
+
+# Each frame is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON.
+# Request:  {"args": [...]}
+# Response: {"returncode": int, "stdout": str, "stderr": str}
+FRAME_HEADER = struct.Struct('>I')
+# Largest response frame accepted when `grading.script_output_limit` is not set
+MAX_FRAME = 64 * 1024 * 1024
+
+
+class ResidentGrader:
+    """
+    A grading script that is started once (with a `--resident` argument) and then
+    handles grading requests over stdin/stdout, so Python graders do not pay interpreter
+    startup and import cost on every grade. See custom_scripts/resident.py for the script side.
+    The script is restarted on the next request if it exits or a request times out.
+    Like run_script, the script runs in its own process group (killed when it is stopped), with the grading
+    memory limit, a CPU limit per request and a cap on the output it may return.
+    """
+
+    def __init__(self, cmd: list[str], timeout: int = 60) -> None:
+        """
+        Args:
+            cmd (list[str]): Command that runs the grading script (without grading arguments)
+            timeout (int, optional): Seconds to wait for a response to a single request. Defaults to 60.
+        """
+
+        self.cmd = cmd
+        self.timeout = timeout
+        self.process: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        self.starts = 0
+        self.requests = 0
+
+
+    def _start(self) -> None:
+        """
+        Start the grading script in resident mode.
+        """
+
+        self.process = subprocess.Popen(self.cmd + ['--resident'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        bufsize=0, start_new_session=True)
+        limit_resources(self.process.pid, memory_mb=globals.script_memory_limit)
+        self.starts += 1
+        threading.Thread(target=self._log_stderr, args=(self.process,), name="ResidentGraderStderr", daemon=True).start()
+        logger.info(f"Started resident grader {self.cmd} (pid {self.process.pid})")
+
+
+    def _log_stderr(self, process: subprocess.Popen) -> None:
+        """
+        Log anything the script writes to stderr outside of a request.
+        """
+
+        for line in process.stderr:
+            logger.debug(f"Resident grader {self.cmd[-1]}: {line.decode('utf-8', errors='replace').rstrip()}")
+
+
+    def stop(self) -> None:
+        """
+        Stop the grading script.
+        """
+
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            kill_process_group(self.process)
+            self.process.wait()
+        self.process = None
+
+
+    def _limit_cpu(self) -> None:
+        """
+        Allow the script `grading.script_cpu_limit` more seconds of CPU time for the next request.
+        The process lives across requests, so the limit is moved forward from the CPU time it has already used.
+        """
+
+        if not globals.script_cpu_limit:
+            return
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            used = (int(fields[11]) + int(fields[12])) // os.sysconf('SC_CLK_TCK')
+            resource.prlimit(self.process.pid, resource.RLIMIT_CPU, (used + globals.script_cpu_limit, resource.RLIM_INFINITY))
+        except (OSError, ValueError, IndexError) as e:
+            logger.warning(f"Could not set the CPU limit for resident grader {self.cmd}: {e!r}")
+
+
+    def _read_exact(self, size: int, deadline: float) -> bytes:
+        """
+        Read exactly `size` bytes from the script's stdout before the deadline.
+
+        Raises:
+            TimeoutError: If the deadline passes first.
+            EOFError: If the script closes stdout (usually because it exited).
+        """
+
+        fd = self.process.stdout.fileno()
+        data = bytearray()
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise TimeoutError
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return bytes(data)
+
+
+    def run(self, args: list[str]) -> subprocess.CompletedProcess:
+        """
+        Send one grading request to the script.
+        Behaves like subprocess.run(cmd + args, capture_output=True, check=True).
+
+        Args:
+            args (list[str]): Grading arguments (JSON submission, current phase)
+
+        Raises:
+            subprocess.CalledProcessError: If the script reports a non-zero exit status or exits while grading.
+            subprocess.TimeoutExpired: If the script does not respond within the timeout.
+
+        Returns:
+            subprocess.CompletedProcess: Output of the request
+        """
+
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                if self.process is not None:
+                    logger.warning(f"Resident grader {self.cmd} exited with status {self.process.returncode}. Restarting it.")
+                self._start()
+            self.requests += 1
+            self._limit_cpu()
+            payload = json.dumps({"args": args}).encode('utf-8')
+            # stdout and stderr are each capped below; JSON escaping can make the frame several times larger
+            max_frame = 8 * globals.script_output_limit + 65536 if globals.script_output_limit else MAX_FRAME
+            try:
+                self.process.stdin.write(FRAME_HEADER.pack(len(payload)) + payload)
+                self.process.stdin.flush()
+                deadline = time.monotonic() + self.timeout
+                length, = FRAME_HEADER.unpack(self._read_exact(FRAME_HEADER.size, deadline))
+                if length > max_frame:
+                    raise ValueError(f"response of {length} bytes is larger than {max_frame} bytes")
+                response = json.loads(self._read_exact(length, deadline).decode('utf-8'))
+            except TimeoutError:
+                logger.error(f"Resident grader {self.cmd} did not respond within {self.timeout} seconds. Stopping it.")
+                self.stop()
+                raise subprocess.TimeoutExpired(self.cmd + args, self.timeout)
+            except (EOFError, OSError, ValueError) as e:
+                returncode = self.process.poll()
+                logger.error(f"Resident grader {self.cmd} failed while grading (exit status {returncode}). Does the script support --resident? Exception: {e!r}")
+                self.stop()
+                raise subprocess.CalledProcessError(returncode if returncode is not None else -1, self.cmd + args, b"", b"")
+
+        output = {}
+        for stream in ('stdout', 'stderr'):
+            output[stream] = bytearray(str(response.get(stream, '')).encode('utf-8'))
+            if globals.script_output_limit and len(output[stream]) > globals.script_output_limit:
+                del output[stream][globals.script_output_limit:]
+                trim_partial_character(output[stream])
+                logger.warning(f"Output from resident grader {os.path.basename(self.cmd[-1])} was larger than {globals.script_output_limit} bytes and was truncated.")
+        completed = subprocess.CompletedProcess(
+            self.cmd + args,
+            response.get('returncode', 1),
+            stdout=bytes(output['stdout']),
+            stderr=bytes(output['stderr'])
+        )
+        completed.check_returncode()
+        return completed
+
+
+class ResidentGraderPool:
+    """
+    Up to `size` resident processes of one grading script, so grading jobs (`grading.workers`) that use
+    the same script are not run one at a time. Processes are started as they are needed.
+    """
+
+    def __init__(self, cmd: list[str], size: int = 1, timeout: int = 60) -> None:
+        """
+        Args:
+            cmd (list[str]): Command that runs the grading script (without grading arguments)
+            size (int, optional): Maximum number of resident processes. Defaults to 1.
+            timeout (int, optional): Seconds to wait for a response to a single request. Defaults to 60.
+        """
+
+        self.cmd = cmd
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.graders: list[ResidentGrader] = []
+        self.idle: queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+
+
+    def _acquire(self) -> ResidentGrader:
+        """
+        Take an idle grader, starting a new one if the pool is not full, otherwise wait for one.
+        """
+
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.graders) < self.size:
+                grader = ResidentGrader(self.cmd, self.timeout)
+                self.graders.append(grader)
+                return grader
+        return self.idle.get()
+
+
+    def run(self, args: list[str]) -> subprocess.CompletedProcess:
+        """
+        Send one grading request to an idle resident process. See ResidentGrader.run.
+        """
+
+        grader = self._acquire()
+        try:
+            return grader.run(args)
+        finally:
+            self.idle.put(grader)
+
+
+    def stop(self) -> None:
+        """
+        Stop every resident process of the script.
+        """
+
+        with self.lock:
+            for grader in self.graders:
+                grader.stop()
+
+
+resident_graders: dict[tuple, ResidentGraderPool] = {}
+resident_graders_lock = threading.Lock()
+
+
+def run_grading_script(cmd: list[str], args: Optional[list[str]] = None, timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+    """
+    Run a grading script, either as a new process or through its resident graders when `grading.resident` is enabled.
+    Each script gets up to `grading.workers` resident processes.
+    New processes are subject to the grading script timeout, resource limits and output cap.
+    Resident processes are subject to `resident_timeout` per request, the memory limit, the CPU limit per request and the output cap.
+
+    Args:
+        cmd (list[str]): Command that runs the grading script
+        args (Optional[list[str]], optional): Grading arguments. Defaults to None.
+        timeout (Optional[int], optional): Seconds before the script is killed. Defaults to `grading.script_timeout`.
+
+    Raises:
+        subprocess.CalledProcessError: If the script exits with a non-zero exit status.
+        subprocess.TimeoutExpired: If the script does not finish in time (`grading.resident_timeout` for resident graders).
+
+    Returns:
+        subprocess.CompletedProcess: Output of the script
+    """
+
+    args = args or []
+    if not globals.resident_grading:
+        return run_script(cmd + args, timeout=timeout if timeout is not None else globals.script_timeout,
+                          cpu_seconds=globals.script_cpu_limit, memory_mb=globals.script_memory_limit,
+                          max_output=globals.script_output_limit, name=os.path.basename(cmd[-1]))
+    with resident_graders_lock:
+        grader = resident_graders.get(tuple(cmd))
+        if grader is None:
+            grader = resident_graders[tuple(cmd)] = ResidentGraderPool(cmd, globals.grading_workers, globals.resident_timeout)
+    return grader.run(args)
+
+
+def stop_resident_graders() -> None:
+    """
+    Stop all resident grading scripts.
+    """
+
+    with resident_graders_lock:
+        for grader in resident_graders.values():
+            grader.stop()
+
+
+atexit.register(stop_resident_graders)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import asyncio, ipaddress, socket, threading, time
+from typing import Optional
+from app.extensions import logger
+
+
+def ip_version(host: str) -> Optional[int]:
+    """
+    Args:
+        host (str): Hostname or IP address
+
+    Returns:
+        Optional[int]: 4 or 6 if host is an IP address literal, otherwise None
+    """
+
+    try:
+        return ipaddress.ip_address(host.strip('[]').split('%', 1)[0]).version
+    except ValueError:
+        return None
+
+
+def interleave_families(addresses: list[tuple]) -> list[tuple]:
+    """
+    Order addrinfo entries so address families alternate, starting with the first family returned (RFC 8305).
+    """
+
+    first = [info for info in addresses if info[0] == addresses[0][0]]
+    other = [info for info in addresses if info[0] != addresses[0][0]]
+    ordered = []
+    for index in range(max(len(first), len(other))):
+        ordered.extend(group[index] for group in (first, other) if index < len(group))
+    return ordered
+
+
+class Resolver:
+    """
+    Caches getaddrinfo results for service checks.
+    Successful lookups are kept for `ttl` seconds and failures for `negative_ttl` seconds.
+    If a lookup fails while an expired answer is cached, the expired answer is used (and kept for another
+    `negative_ttl` seconds) so a DNS hiccup does not make every service look unavailable.
+    """
+
+    def __init__(self, ttl: int = 60, negative_ttl: int = 10, timeout: float = 5) -> None:
+        """
+        Args:
+            ttl (int, optional): Seconds a successful lookup is cached. Defaults to 60.
+            negative_ttl (int, optional): Seconds a failed lookup is cached. Defaults to 10.
+            timeout (float, optional): Seconds an asynchronous lookup may take. Defaults to 5.
+        """
+
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        # failures are kept as (exception type, args) so every lookup raises a fresh exception
+        self.entries: dict[str, tuple[float, Optional[list[tuple]], Optional[tuple[type, tuple]]]] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+
+    def _cached(self, host: str) -> Optional[list[tuple]]:
+        """
+        Return the cached addresses for a host, raise the cached failure, or return None on a miss.
+        """
+
+        with self.lock:
+            entry = self.entries.get(host)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+        if entry[2] is not None:
+            error_type, args = entry[2]
+            raise error_type(*args)
+        return entry[1]
+
+
+    def _store(self, host: str, addresses: Optional[list[tuple]], error: Optional[Exception]) -> list[tuple]:
+        """
+        Cache a lookup result. On failure, fall back to an expired answer if there is one.
+        """
+
+        with self.lock:
+            if error is None:
+                self.entries[host] = (time.monotonic() + self.ttl, addresses, None)
+                return addresses
+            previous = self.entries.get(host)
+            if previous is not None and previous[1]:
+                self.stale += 1
+                logger.warning(f"Could not resolve {host} ({error}). Using the last known addresses.")
+                self.entries[host] = (time.monotonic() + self.negative_ttl, previous[1], None)
+                return previous[1]
+            self.entries[host] = (time.monotonic() + self.negative_ttl, None, (type(error), error.args))
+        raise error
+
+
+    @staticmethod
+    def _literal(host: str) -> Optional[list[tuple]]:
+        version = ip_version(host)
+        if version is None:
+            return None
+        family = socket.AF_INET if version == 4 else socket.AF_INET6
+        address = host.strip('[]')
+        return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, 0) if version == 4 else (address, 0, 0, 0))]
+
+
+    def resolve(self, host: str) -> list[tuple]:
+        """
+        Resolve a host to addrinfo entries (family, type, proto, canonname, sockaddr) with port 0.
+
+        Args:
+            host (str): Hostname or IP address
+
+        Raises:
+            socket.gaierror: If the host cannot be resolved.
+
+        Returns:
+            list[tuple]: Addresses, with families interleaved
+        """
+
+        literal = self._literal(host)
+        if literal is not None:
+            return literal
+        cached = self._cached(host)
+        if cached is not None:
+            return cached
+        try:
+            addresses = interleave_families(socket.getaddrinfo(host, 0, type=socket.SOCK_STREAM))
+        except OSError as e:
+            return self._store(host, None, e)
+        return self._store(host, addresses, None)
+
+
+    async def resolve_async(self, host: str) -> list[tuple]:
+        """
+        Resolve a host without blocking the event loop. See resolve().
+
+        Raises:
+            socket.gaierror: If the host cannot be resolved or the lookup times out.
+        """
+
+        literal = self._literal(host)
+        if literal is not None:
+            return literal
+        cached = self._cached(host)
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        try:
+            addresses = interleave_families(await asyncio.wait_for(loop.getaddrinfo(host, 0, type=socket.SOCK_STREAM), self.timeout))
+        except asyncio.TimeoutError:
+            return self._store(host, None, socket.gaierror(socket.EAI_AGAIN, f"Lookup of {host} timed out"))
+        except OSError as e:
+            return self._store(host, None, e)
+        return self._store(host, addresses, None)
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Cache size and hit/miss/stale counters
+        """
+
+        return {
+            "entries": len(self.entries),
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale
+        }
+
+
+async def open_connection(host: str, port: int, timeout: float, delay: float = 0.25) -> bool:
+    """
+    Open (and close) a TCP connection, racing the host's addresses (Happy Eyeballs, RFC 8305).
+    A new attempt starts every `delay` seconds, or as soon as the previous one fails, alternating
+    address families. The first attempt to connect wins.
+
+    Args:
+        host (str): Hostname or IP address
+        port (int): TCP port
+        timeout (float): Seconds the whole attempt may take
+        delay (float, optional): Seconds before starting the next address. Defaults to 0.25.
+
+    Raises:
+        OSError: If the host cannot be resolved or no address accepts the connection.
+        asyncio.TimeoutError: If no address connects within the timeout.
+
+    Returns:
+        bool: True once connected
+    """
+
+    loop = asyncio.get_running_loop()
+    addresses = await resolver.resolve_async(host)
+
+    async def attempt(info: tuple) -> socket.socket:
+        family, kind, proto, _, sockaddr = info
+        sock = socket.socket(family, kind, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, (sockaddr[0], int(port), *sockaddr[2:]))
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def race() -> socket.socket:
+        pending = set()
+        errors = []
+        remaining = list(addresses)
+        try:
+            while remaining or pending:
+                if remaining:
+                    pending.add(asyncio.ensure_future(attempt(remaining.pop(0))))
+                done, pending = await asyncio.wait(pending, timeout=delay if remaining else None, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[-1] if errors else OSError(f"No addresses for {host}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    sock = await asyncio.wait_for(race(), timeout)
+    sock.close()
+    return True
+
+
+def connect(host: str, port: int, timeout: float) -> bool:
+    """
+    Open (and close) a TCP connection from a thread without an event loop.
+    The host's cached addresses are tried one at a time, alternating address families. Each attempt
+    may use an equal share of the time that is left, so one unresponsive address does not use up the timeout.
+
+    Args:
+        host (str): Hostname or IP address
+        port (int): TCP port
+        timeout (float): Seconds the whole attempt may take
+
+    Raises:
+        OSError: If the host cannot be resolved or no address accepts the connection.
+        TimeoutError: If no address connects within the timeout.
+
+    Returns:
+        bool: True once connected
+    """
+
+    deadline = time.monotonic() + timeout
+    addresses = resolver.resolve(host)
+    error: Optional[OSError] = None
+    for index, (family, kind, proto, _, sockaddr) in enumerate(addresses):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            with socket.socket(family, kind, proto) as sock:
+                sock.settimeout(remaining / (len(addresses) - index))
+                sock.connect((sockaddr[0], int(port), *sockaddr[2:]))
+            return True
+        except OSError as e:
+            error = e
+    if isinstance(error, TimeoutError) or error is None:
+        raise TimeoutError(f"Connection to {host}:{port} timed out")
+    raise error
+
+
+resolver = Resolver()
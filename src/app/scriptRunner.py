@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import os, resource, selectors, signal, subprocess, time
+from typing import Callable, Optional
+from app.extensions import logger
+
+# Result recorded for a grading part whose script timed out. Results starting with this are never cached.
+TIMEOUT_RESULT = "Failure -- Grading timed out"
+
+
+def limit_resources(pid: int, cpu_seconds: int = 0, memory_mb: int = 0) -> None:
+    """
+    Apply resource limits to a started process with prlimit.
+    A preexec_fn is not used because it is unsafe in a multi-threaded server. Limits apply from just after the process starts.
+
+    Args:
+        pid (int): Process ID
+        cpu_seconds (int, optional): RLIMIT_CPU in seconds. 0 means no limit. Defaults to 0.
+        memory_mb (int, optional): RLIMIT_AS in megabytes. 0 means no limit. Defaults to 0.
+    """
+
+    try:
+        if cpu_seconds:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+        if memory_mb:
+            limit = memory_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+    except ProcessLookupError:
+        pass  # the process already exited
+
+
+def trim_partial_character(buffer: bytearray) -> None:
+    """
+    Remove an incomplete UTF-8 character from the end of a buffer cut at a byte limit.
+
+    Args:
+        buffer (bytearray): Output buffer, trimmed in place
+    """
+
+    for back in range(1, min(4, len(buffer)) + 1):
+        byte = buffer[-back]
+        if byte & 0xC0 != 0x80:  # first byte of a character
+            if byte < 0x80:
+                length = 1
+            elif byte < 0xE0:
+                length = 2
+            elif byte < 0xF0:
+                length = 3
+            else:
+                length = 4
+            if length > back:
+                del buffer[-back:]
+            return
+
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    """
+    Kill a process started by run_script and every process it started.
+
+    Args:
+        process (subprocess.Popen): The process
+    """
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        process.kill()
+
+
+def run_script(cmd: list[str], timeout: float = 0, cpu_seconds: int = 0, memory_mb: int = 0, max_output: int = 0, env: Optional[dict] = None, log_prefix: Optional[str] = None, name: Optional[str] = None) -> subprocess.CompletedProcess:
+    """
+    Run a script with a wall-clock timeout, optional resource limits and a cap on captured output.
+    Behaves like subprocess.run(cmd, capture_output=True, check=True, timeout=timeout).
+    The script runs in its own process group, which is killed on timeout.
+    Output beyond `max_output` bytes per stream is read and discarded so the script never blocks on a full pipe.
+    Truncated output is cut back to a UTF-8 character boundary.
+
+    Args:
+        cmd (list[str]): Command to run
+        timeout (float, optional): Seconds before the script is killed. 0 means no timeout. Defaults to 0.
+        cpu_seconds (int, optional): CPU time limit (RLIMIT_CPU). 0 means no limit. Defaults to 0.
+        memory_mb (int, optional): Address space limit in MB (RLIMIT_AS). 0 means no limit. Defaults to 0.
+        max_output (int, optional): Bytes of stdout and of stderr to keep. 0 means no limit. Defaults to 0.
+        env (Optional[dict], optional): Environment for the script. Defaults to the server's environment.
+        log_prefix (Optional[str], optional): If set, each line of output is logged as it arrives, prefixed with this. Defaults to None.
+        name (Optional[str], optional): Script name used in log messages (never the arguments, which may hold submissions). Defaults to the name of `cmd[0]`.
+
+    Raises:
+        subprocess.CalledProcessError: If the script exits with a non-zero exit status.
+        subprocess.TimeoutExpired: If the script does not finish within the timeout.
+
+    Returns:
+        subprocess.CompletedProcess: The finished script with stdout and stderr as bytes
+    """
+
+    name = name or os.path.basename(cmd[0])
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               start_new_session=True, env=env)
+    limit_resources(process.pid, cpu_seconds, memory_mb)
+    deadline = time.monotonic() + timeout if timeout else None
+    output = {process.stdout: bytearray(), process.stderr: bytearray()}
+    truncated = set()
+    partial = {process.stdout: b"", process.stderr: b""}
+
+    def log_lines(stream, chunk: bytes, final: bool = False) -> None:
+        lines = (partial[stream] + chunk).split(b"\n")
+        partial[stream] = b"" if final else lines.pop()
+        name = "stdout" if stream is process.stdout else "stderr"
+        for line in lines:
+            if line:
+                logger.info(f"{log_prefix} [{name}]: {line.decode('utf-8', errors='replace').rstrip()}")
+
+    with selectors.DefaultSelector() as selector:
+        for stream in output:
+            selector.register(stream, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                kill_process_group(process)
+                process.wait()
+                logger.error(f"{name} did not finish within {timeout} seconds. Killed its process group.")
+                raise subprocess.TimeoutExpired(cmd, timeout, bytes(output[process.stdout]), bytes(output[process.stderr]))
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                if log_prefix:
+                    log_lines(key.fileobj, chunk, final=not chunk)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                buffer = output[key.fileobj]
+                if key.fileobj in truncated:
+                    continue
+                if max_output and len(buffer) + len(chunk) > max_output:
+                    buffer += chunk[:max_output - len(buffer)]
+                    trim_partial_character(buffer)
+                    truncated.add(key.fileobj)
+                else:
+                    buffer += chunk
+
+    # output is closed, but the script may still be running (e.g., it closed stdout)
+    try:
+        returncode = process.wait(timeout=(deadline - time.monotonic()) if deadline else None)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout, bytes(output[process.stdout]), bytes(output[process.stderr]))
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+
+    if truncated:
+        logger.warning(f"Output from {name} was larger than {max_output} bytes and was truncated.")
+    stdout, stderr = bytes(output[process.stdout]), bytes(output[process.stderr])
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import threading, time
+from array import array
+from typing import Optional
+
+
+def percentile(ordered: list[float], fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    Args:
+        ordered (list[float]): Sorted values
+        fraction (float): Percentile as a fraction (0.5 for the median)
+
+    Returns:
+        Optional[float]: The percentile, or None if there are no values.
+    """
+
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(fraction * len(ordered) + 0.5) - 1))]
+
+
+class ServiceHistory:
+    """
+    The last `size` check results of one service, kept in fixed-size arrays used as a ring buffer.
+    Appending overwrites the oldest result, so memory use does not grow and appends are O(1).
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        Args:
+            size (int): Number of results kept
+        """
+
+        self.size = size
+        self.timestamps = array('d', bytes(8 * size))
+        self.latencies = array('d', bytes(8 * size))
+        self.states = array('b', bytes(size))
+        self.next = 0
+        self.count = 0
+        self.up = 0
+
+
+    def append(self, timestamp: float, available: bool, latency: float) -> None:
+        """
+        Record a check result, overwriting the oldest one when full.
+
+        Args:
+            timestamp (float): Unix time of the check
+            available (bool): Whether the service was available
+            latency (float): Seconds the check took
+        """
+
+        index = self.next
+        if self.count == self.size:
+            self.up -= self.states[index]
+        else:
+            self.count += 1
+        self.timestamps[index] = timestamp
+        self.latencies[index] = latency
+        self.states[index] = available
+        self.up += available
+        self.next = (index + 1) % self.size
+
+
+    def indexes(self, limit: int = 0) -> list[int]:
+        """
+        Args:
+            limit (int, optional): Only the newest `limit` results. 0 means all. Defaults to 0.
+
+        Returns:
+            list[int]: Array indexes of the stored results, oldest first
+        """
+
+        count = min(limit, self.count) if limit else self.count
+        return [(self.next - count + offset) % self.size for offset in range(count)]
+
+
+    def summary(self, points: int = 0) -> dict:
+        """
+        Uptime and latency percentiles over the stored results. Latency percentiles only include successful checks.
+
+        Args:
+            points (int, optional): Number of the newest results to include individually. Defaults to 0.
+
+        Returns:
+            dict: Summary of the stored results
+        """
+
+        ordered = sorted(self.latencies[index] for index in self.indexes() if self.states[index])
+        return {
+            "checks": self.count,
+            "since": self.timestamps[(self.next - self.count) % self.size] if self.count else None,
+            "uptime": round(100 * self.up / self.count, 2) if self.count else None,
+            "latency": {name: round(value, 4) if value is not None else None
+                        for name, value in (("p50", percentile(ordered, 0.5)), ("p90", percentile(ordered, 0.9)), ("p99", percentile(ordered, 0.99)))},
+            "history": [[round(self.timestamps[index], 3), bool(self.states[index]), round(self.latencies[index], 4)] for index in self.indexes(points)] if points else []
+        }
+
+
+class ServiceHistoryStore:
+    """
+    Check history of every required service, from both startup waits and periodic monitoring.
+    Histories are keyed by service name, which Globals ensures is unique.
+    """
+
+    def __init__(self, size: int = 1440) -> None:
+        """
+        Args:
+            size (int, optional): Results kept per service. Defaults to 1440.
+        """
+
+        self.size = size
+        self.services: dict[str, ServiceHistory] = {}
+        self.lock = threading.Lock()
+
+
+    def record(self, name: str, available: bool, latency: float) -> None:
+        """
+        Record a check result for a service.
+
+        Args:
+            name (str): Service name
+            available (bool): Whether the service was available
+            latency (float): Seconds the check took
+        """
+
+        with self.lock:
+            history = self.services.get(name)
+            if history is None:
+                history = self.services[name] = ServiceHistory(self.size)
+            history.append(time.time(), available, latency)
+
+
+    def summary(self, name: str, points: int = 0) -> Optional[dict]:
+        """
+        Args:
+            name (str): Service name
+            points (int, optional): Number of the newest results to include individually. Defaults to 0.
+
+        Returns:
+            Optional[dict]: See ServiceHistory.summary. None if the service has not been checked.
+        """
+
+        with self.lock:
+            history = self.services.get(name)
+            return history.summary(points) if history is not None else None
+
+
+service_history = ServiceHistoryStore()
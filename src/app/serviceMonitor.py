@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import asyncio, datetime, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from app.extensions import globals, logger
+from app.icmp import AsyncPinger
+from app.portServiceChecker import CheckSchedule, checkWeb, webCheckOptions
+from app.resolver import open_connection
+from app.serviceHistory import service_history
+
+
+async def check_ping_command(host: str, timeout: float) -> bool:
+    """
+    Ping a host once with the ping command without blocking the event loop.
+    Only used when no ICMP socket can be opened.
+    """
+
+    process = await asyncio.create_subprocess_exec('ping', '-c', '1', '-W', str(max(1, int(timeout))), host,
+                                                   stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        return await asyncio.wait_for(process.wait(), timeout + 1) == 0
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return False
+
+
+async def check_socket(host: str, port: int, timeout: float) -> bool:
+    """
+    Open (and close) a TCP connection to a host without blocking the event loop.
+    Uses the cached resolver and races the host's addresses across address families.
+    """
+
+    try:
+        return await open_connection(host, int(port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+
+class ServiceMonitor:
+    """
+    Checks every required service on one asyncio event loop running on a single thread.
+    Each service is checked every `interval` seconds (timed from the previous check's start) and every
+    check is bounded by `timeout`. At most `max_concurrent` checks run at once.
+    The latest result for each service is kept in a status table.
+    """
+
+    def __init__(self, max_concurrent: int = 64, timeout: int = 5) -> None:
+        """
+        Args:
+            max_concurrent (int, optional): Maximum number of checks running at once. Defaults to 64.
+            timeout (int, optional): Default seconds a single check may take. Defaults to 5.
+        """
+
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.status: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.pinger: Optional[AsyncPinger] = None
+        self.ping_count = 3
+        self.checks = 0
+        self.timeouts = 0
+
+
+    def start(self, services: list[dict]) -> None:
+        """
+        Start checking services in a background thread.
+
+        Args:
+            services (list[dict]): Required services (see Globals.required_services)
+
+        Raises:
+            ValueError: If two services have the same name. Status is kept per name.
+        """
+
+        if self.thread is not None:
+            return
+        names = [service['name'] for service in services]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Required service names are not unique: {names}")
+        with self.lock:
+            self.status = {service['name']: {"host": service['host'], "type": service['type'], "available": None,
+                                             "checked_at": None, "latency": None, "checks": 0, "failures": 0, "next_check": None}
+                           for service in services}
+        self.thread = threading.Thread(target=asyncio.run, args=(self._run(services),), name="ServiceMonitor", daemon=True)
+        self.thread.start()
+
+
+    async def _run(self, services: list[dict]) -> None:
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        # every ping check shares one ICMP socket per address family
+        self.pinger = AsyncPinger()
+        # web checks use requests, so they run on a small thread pool bounded like the other checks
+        web_pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="ServiceMonitorWeb")
+        logger.info(f"Checking {len(services)} required services with up to {self.max_concurrent} checks at a time")
+        await asyncio.gather(*(self._monitor(service, index, len(services), semaphore, web_pool) for index, service in enumerate(services)))
+
+
+    async def _monitor(self, service: dict, index: int, count: int, semaphore: asyncio.Semaphore, web_pool: ThreadPoolExecutor) -> None:
+        """
+        Check one service forever, on the schedule set by its CheckSchedule.
+        First checks are spread across the first interval so services are not all checked at the same moment.
+        """
+
+        loop = asyncio.get_running_loop()
+        schedule = CheckSchedule(service)
+        await asyncio.sleep(service.get('interval', 30) * index / count)
+        while True:
+            started = loop.time()
+            async with semaphore:
+                available = await self._check(service, web_pool)
+            delay = schedule.next_delay(available)
+            with self.lock:
+                self.status[service['name']]['next_check'] = delay
+            await asyncio.sleep(max(0, started + delay - loop.time()))
+
+
+    async def _check(self, service: dict, web_pool: ThreadPoolExecutor) -> bool:
+        """
+        Check a service once and record the result.
+
+        Returns:
+            bool: True if the service is available.
+        """
+
+        timeout = service.get('timeout', self.timeout)
+        started = time.monotonic()
+        details = {}
+        try:
+            if service['type'] == 'ping':
+                available, details = await self._ping(service['host'], service.get('count', self.ping_count), timeout)
+            elif service['type'] == 'socket':
+                available = await check_socket(service['host'], service['port'], timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                available = await asyncio.wait_for(loop.run_in_executor(web_pool, partial(checkWeb, service['host'], service['port'], service['path'], **webCheckOptions(service))), timeout + 1)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            available = False
+        except Exception as e:
+            logger.error(f"Exception while checking service {service['name']}: {e!r}")
+            available = False
+        self._record(service, available, time.monotonic() - started, details)
+        return available
+
+
+    async def _ping(self, host: str, count: int, timeout: float) -> tuple[bool, dict]:
+        """
+        Ping a host `count` times over the shared ICMP socket.
+
+        Returns:
+            tuple[bool, dict]: Whether any reply was received, and the round trip time (seconds) and packet loss
+        """
+
+        if self.pinger is not None:
+            try:
+                result = await self.pinger.ping(host, count, timeout)
+                return result.available, {"rtt": round(result.rtt_avg, 4) if result.rtts else None, "loss": round(result.loss, 3)}
+            except PermissionError as e:
+                logger.warning(f"Could not open an ICMP socket ({e}). Falling back to the ping command for ping checks.")
+                self.pinger = None
+        return await check_ping_command(host, timeout), {}
+
+
+    def _record(self, service: dict, available: bool, latency: float, details: Optional[dict] = None) -> None:
+        """
+        Store a check result. State changes are logged at info/error; every check is logged at debug.
+        """
+
+        service_history.record(service['name'], available, latency)
+        with self.lock:
+            self.checks += 1
+            status = self.status[service['name']]
+            changed = status['available'] != available
+            status.update(available=available, checked_at=datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S"),
+                          latency=round(latency, 4), checks=status['checks'] + 1, failures=status['failures'] + (not available),
+                          **(details or {}))
+        if changed and available:
+            logger.info(f"Service available: {service}")
+        elif changed:
+            logger.error(f"Service unavailable: {service}")
+        else:
+            logger.debug(f"Service {service['name']} is still {'available' if available else 'unavailable'} ({latency:.3f}s{f', {details}' if details else ''})")
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Check counters and the latest status of each service
+        """
+
+        with self.lock:
+            return {
+                "checks": self.checks,
+                "timeouts": self.timeouts,
+                "available": sum(1 for status in self.status.values() if status['available']),
+                "unavailable": sum(1 for status in self.status.values() if status['available'] is False),
+                "services": {name: dict(status) for name, status in self.status.items()}
+            }
+
+
+service_monitor = ServiceMonitor()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+
+import os, subprocess, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.extensions import globals, logger
+from app.portServiceChecker import waitForService
+from app.scriptRunner import run_script
+
+
+class StartupGraph:
+    """
+    Runs startup scripts as a dependency graph.
+    A script starts as soon as every script it depends on (`depends_on`) has succeeded, every script it
+    is ordered after (`after`) has finished and every service it requires (`requires`, plus all services
+    with `block_startup_scripts`) is available, with up to `max_workers` scripts running at once.
+    Each script's output is logged as it is produced, and its timing is kept for /challenge/metrics.
+    """
+
+    def __init__(self) -> None:
+        self.scripts: dict[str, dict] = {}
+        self.services: dict[str, dict] = {}
+        self.started_at: float = 0.0
+        self.elapsed: float = 0.0
+        self.lock = threading.Lock()
+
+
+    def _set(self, name: str, **fields) -> None:
+        with self.lock:
+            self.scripts[name].update(fields)
+
+
+    def _wait_for_service(self, service: dict) -> bool:
+        """
+        Wait for a required service, recording how long it took.
+
+        Args:
+            service (dict): Required service
+
+        Returns:
+            bool: True if the service became available before its `wait_timeout`.
+        """
+
+        available = waitForService(service, timeout=service['wait_timeout'])
+        with self.lock:
+            self.services[service['name']] = {
+                "status": "available" if available else "unavailable",
+                "waited": round(time.monotonic() - self.started_at, 3)
+            }
+        return available
+
+
+    def _run_one(self, script: dict) -> tuple[bool, str]:
+        """
+        Run a single startup script.
+
+        Args:
+            script (dict): Startup script (see Globals.startup_scripts)
+
+        Returns:
+            tuple[bool, str]: Whether it succeeded and its output (stdout on success, stdout/stderr on failure)
+        """
+
+        name = script['name']
+        path = os.path.join(globals.custom_script_dir, script['script'])
+        started = time.monotonic()
+        self._set(name, status="running", started=round(started - self.started_at, 3))
+        logger.info(f"Starting startup script {name}")
+        try:
+            if not os.path.isfile(path):
+                logger.error(f"Startup script {script['script']} not found in 'custom_scripts' directory.")
+                return False, f"stdout: \tstderr: Starting script {script['script']} not found in 'custom_scripts' directory."
+            # run the startup script and parse output into a dict
+            ## The output variable has properties output.stdout  and  output.stderr
+            output = run_script([path], timeout=globals.startup_timeout, log_prefix=f"Startup script {name}").stdout.decode('utf-8', errors='replace').replace("\n", r"\n")
+            return True, output
+        # Something happened if there was a non-zero exit status. Log this and set fatal_error
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Startup script {name} returned with non-zero exit status {e.returncode}.\tStdout: {e.stdout}\tStderr: {e.stderr}")
+            return False, f"stdout: {e.stdout}\tstderr: {e.stderr}"
+        except subprocess.TimeoutExpired as e:
+            logger.error(f"Startup script {name} did not finish within {e.timeout} seconds.\tStdout: {e.stdout}\tStderr: {e.stderr}")
+            return False, f"stdout: {e.stdout}\tstderr: {e.stderr}"
+        finally:
+            duration = round(time.monotonic() - started, 3)
+            self._set(name, duration=duration)
+            logger.info(f"Startup script {name} finished in {duration} seconds")
+
+
+    def run(self, scripts: list[dict], max_workers: int) -> tuple[dict[str,str], dict[str,str]]:
+        """
+        Run the startup scripts.
+        Scripts whose `depends_on` scripts failed, or whose required services did not become available, are not run and are reported as errors.
+        Returns once all scripts have finished and all blocking services are available.
+
+        Args:
+            scripts (list[dict]): Startup scripts (see Globals.startup_scripts)
+            max_workers (int): Maximum number of scripts running at once
+
+        Returns:
+            tuple[dict[str,str], dict[str,str]]: dictionaries that contain stdout / stderr for successful/failed startup scripts.
+        """
+
+        successes = {}
+        errors = {}
+        pending = {script['name']: script for script in scripts}
+        running = {}
+        self.started_at = time.monotonic()
+        with self.lock:
+            self.scripts = {script['name']: {"status": "pending", "depends_on": script['depends_on'] + script['after']} for script in scripts}
+
+        # wait for every service that any script needs at the same time, and only once per service
+        services = {service['name']: service for service in (globals.required_services or [])}
+        blocking = [service['name'] for service in globals.blocking_services]
+        needed = set(blocking).union(*(script['requires'] for script in scripts))
+        with self.lock:
+            self.services = {name: {"status": "waiting"} for name in needed}
+        if needed:
+            logger.info(f"Waiting for services {sorted(needed)} to become available")
+        waits = {name: globals.blocking_threadpool.submit(self._wait_for_service, services[name]) for name in needed}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="StartupScript") as pool:
+            while pending or running:
+                for name, script in list(pending.items()):
+                    required = [waits[service] for service in blocking + script['requires']]
+                    if any(dep not in successes and dep not in errors for dep in script['depends_on'] + script['after']) or not all(future.done() for future in required):
+                        continue
+                    del pending[name]
+                    failed = [dep for dep in script['depends_on'] if dep in errors]
+                    unavailable = [service for service in blocking + script['requires'] if not waits[service].result()]
+                    if failed or unavailable:
+                        reason = f"startup script(s) {failed} failed" if failed else f"required service(s) {unavailable} are unavailable"
+                        logger.error(f"Skipping startup script {name} because {reason}.")
+                        errors[name] = f"stdout: \tstderr: Skipped because {reason}."
+                        self._set(name, status="skipped")
+                        continue
+                    running[pool.submit(self._run_one, script)] = name
+                waiting_on = list(running) + [future for future in waits.values() if not future.done()]
+                if not waiting_on:
+                    # skipped scripts may have made others ready
+                    continue
+                done, _ = wait(waiting_on, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future not in running:
+                        continue
+                    name = running.pop(future)
+                    succeeded, output = future.result()
+                    if succeeded:
+                        logger.info(f"Stdout from Startup Script {name}: {output}")
+                        successes[name] = output
+                    else:
+                        errors[name] = output
+                    self._set(name, status="success" if succeeded else "failed")
+
+        # blocking services hold back the server even when there are no scripts to run
+        wait([waits[service] for service in blocking])
+        unavailable = [service for service in blocking if not waits[service].result()]
+        if unavailable:
+            logger.error(f"Blocking services {unavailable} did not become available")
+        elif blocking:
+            logger.info(f"All blocking services are available")
+        self.elapsed = round(time.monotonic() - self.started_at, 3)
+        total = round(sum(script.get('duration', 0) for script in self.scripts.values()), 3)
+        logger.info(f"Startup scripts finished in {self.elapsed} seconds ({total} seconds of script run time)")
+        return successes, errors
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Elapsed time, the status and timing of each startup script and when each required service became available
+        """
+
+        with self.lock:
+            return {
+                "elapsed": self.elapsed,
+                "scripts": {name: dict(script) for name, script in self.scripts.items()},
+                "services": {name: dict(service) for name, service in self.services.items()}
+            }
+
+
+startup_graph = StartupGraph()
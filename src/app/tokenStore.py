@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+import os, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from app.env import get_clean_env
+from app.extensions import challenge_state, globals, logger
+
+
+def token_file_path(token_name: str) -> str:
+    """
+    Path of a `file` token. Relative names are read from app/tokens; absolute paths are used as-is.
+
+    Args:
+        token_name (str): token_name from the grading part config
+
+    Returns:
+        str: Path to the token file
+    """
+
+    return os.path.join(globals.basedir, "app", "tokens", token_name)
+
+
+def fetch_token(token_name: str, location: str) -> Optional[str]:
+    """
+    Read a token from its configured location.
+
+    Args:
+        token_name (str): token_name from the grading part config
+        location (str): Token location ('env', 'guestinfo' or 'file')
+
+    Returns:
+        Optional[str]: The token, or None if it could not be read.
+    """
+
+    # read tokens from env var
+    if location == 'env':
+        token = get_clean_env(token_name)
+        if not token:
+            logger.error(f"Environment variable for token {token_name} is empty.")
+            return None
+        return token
+
+    # read tokens from guestinfo
+    elif location == 'guestinfo':
+        try:
+            output = subprocess.run(["vmtoolsd", "--cmd", f"info-get guestinfo.{token_name}"], capture_output=True)
+            if 'no value' in output.stderr.decode('utf-8').lower():
+                logger.error(f"No value found when querying guestinfo variables for guestinfo.{token_name}")
+                return None
+            return output.stdout.decode('utf-8').strip()
+        except Exception as e:
+            logger.error(f"Error when trying to get token {token_name} from guestinfo vars. Exception: {e}")
+            return None
+
+    # read token from file
+    elif location == 'file':
+        try:
+            with open(token_file_path(token_name), 'r') as f:
+                return f.readline()
+        except Exception as e:
+            logger.error(f"Error opening file {token_name} when trying to read token. Exception: {e}")
+            return None
+
+    logger.error(f"Unknown token location {location}. Valid locations are {globals.VALID_TOKEN_LOCATIONS}")
+    return None
+
+
+class TokenStore:
+    """
+    Cache of grading part tokens.
+    Every token is read once (at startup, in parallel) and then served from memory.
+    Tokens are read again after `invalidate()` (SIGHUP or /challenge/tokens/refresh).
+    `file` tokens are also re-read when the file's modification time changes.
+    Tokens that could not be read are not cached, so they are retried on the next lookup.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.tokens: dict[str, str] = {}
+        self.mtimes: dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def _mtime(self, token_name: str) -> Optional[float]:
+        try:
+            return os.stat(token_file_path(token_name)).st_mtime
+        except OSError:
+            return None
+
+
+    def get(self, token_name: str) -> Optional[str]:
+        """
+        Get a token, reading it from its location if it is not cached.
+
+        Args:
+            token_name (str): token_name from the grading part config
+
+        Returns:
+            Optional[str]: The token, or None if it could not be read.
+        """
+
+        location = globals.token_location
+        token = self.tokens.get(token_name)
+        if token is not None:
+            if location != 'file' or self.mtimes.get(token_name) == self._mtime(token_name):
+                self.hits += 1
+                return token
+            logger.info(f"Token file {token_name} changed. Reading it again.")
+
+        self.misses += 1
+        mtime = self._mtime(token_name) if location == 'file' else None
+        token = fetch_token(token_name, location)
+        if token is not None:
+            with self.lock:
+                self.tokens[token_name] = token
+                if mtime is not None:
+                    self.mtimes[token_name] = mtime
+        return token
+
+
+    def prefetch(self, parts: Optional[dict] = None) -> None:
+        """
+        Read the tokens for all grading parts in parallel.
+
+        Args:
+            parts (Optional[dict], optional): Grading parts config. Defaults to globals.grading_parts.
+        """
+
+        parts = parts if parts is not None else (globals.grading_parts or {})
+        token_names = {part['token_name'] for part in parts.values() if isinstance(part, dict) and part.get('token_name')}
+        if not token_names:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(token_names)), thread_name_prefix="TokenPrefetch") as pool:
+            results = dict(zip(token_names, pool.map(self.get, token_names)))
+        missing = [name for name, token in results.items() if token is None]
+        if missing:
+            logger.warning(f"Could not read {len(missing)} token(s) from {globals.token_location}: {missing}. They will be retried when needed.")
+        logger.info(f"Loaded {len(token_names) - len(missing)} of {len(token_names)} token(s) from {globals.token_location}")
+
+
+    def invalidate(self) -> None:
+        """
+        Drop all cached tokens so they are read again on the next lookup.
+        """
+
+        with self.lock:
+            self.tokens.clear()
+            self.mtimes.clear()
+        challenge_state.bump()
+
+
+    def refresh(self) -> None:
+        """
+        Drop all cached tokens and read them again.
+        """
+
+        logger.info("Refreshing tokens")
+        self.invalidate()
+        self.prefetch()
+
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Number of cached tokens and cache hit/miss counters
+        """
+
+        return {
+            "location": globals.token_location,
+            "cached": len(self.tokens),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+token_store = TokenStore()
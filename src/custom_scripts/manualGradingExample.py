@@ -57,10 +57,23 @@ def grade(submission: Optional[Dict[str, str]] = None) -> Dict[str, str]:
     return results
 
 
-if __name__ == '__main__':
+def main() -> None:
+    """
+    Grade the submission passed on the command line and print the results.
+    """
+
     args = sys.argv[1:]
     submissions = json.loads(args[0]) if args else None
     results = grade(submissions)
 
     for key, value in results.items():
         print(key, ' : ', value)
+
+
+if __name__ == '__main__':
+    if '--resident' in sys.argv[1:]:
+        # Started by the server with `grading.resident: true`. Handle grading requests until the server exits.
+        from resident import serve
+        serve(main)
+    else:
+        main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# Challenge Sever
+# Copyright 2024 Carnegie Mellon University.
+# NO WARRANTY. THIS CARNEGIE MELLON UNIVERSITY AND SOFTWARE ENGINEERING INSTITUTE MATERIAL IS FURNISHED ON AN "AS-IS" BASIS. CARNEGIE MELLON UNIVERSITY MAKES NO WARRANTIES OF ANY KIND, EITHER EXPRESSED OR IMPLIED, AS TO ANY MATTER INCLUDING, BUT NOT LIMITED TO, WARRANTY OF FITNESS FOR PURPOSE OR MERCHANTABILITY, EXCLUSIVITY, OR RESULTS OBTAINED FROM USE OF THE MATERIAL. CARNEGIE MELLON UNIVERSITY DOES NOT MAKE ANY WARRANTY OF ANY KIND WITH RESPECT TO FREEDOM FROM PATENT, TRADEMARK, OR COPYRIGHT INFRINGEMENT.
+# Licensed under a MIT (SEI)-style license, please see license.txt or contact permission@sei.cmu.edu for full terms.
+# [DISTRIBUTION STATEMENT A] This material has been approved for public release and unlimited distribution.  Please see Copyright notice for non-US Government use and distribution.
+# DM24-0645
+#
+
+#####
+# Helper for running a Python grading script as a resident grader (`grading.resident: true`).
+# Please reference `grading_README.md` for usage.
+#####
+
+import contextlib
+import io
+import json
+import os
+import struct
+import sys
+import traceback
+from typing import BinaryIO, Callable, Optional
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+def read_frame(stream: BinaryIO) -> Optional[dict]:
+    """
+    Read one length-prefixed JSON frame.
+
+    Args:
+        stream (BinaryIO): Stream to read from
+
+    Returns:
+        Optional[dict]: The decoded frame, or None when the stream is closed.
+    """
+
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    length, = FRAME_HEADER.unpack(header)
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_frame(stream: BinaryIO, data: dict) -> None:
+    """
+    Write one length-prefixed JSON frame.
+
+    Args:
+        stream (BinaryIO): Stream to write to
+        data (dict): Data to send
+    """
+
+    payload = json.dumps(data).encode('utf-8')
+    stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def serve(main: Callable[[], None]) -> None:
+    """
+    Handle grading requests from the Challenge Server until it closes stdin.
+    For each request, `sys.argv` is set to the grading arguments and `main` is called.
+    Everything `main` prints is returned to the server, exactly as if the script had been run on its own.
+
+    Args:
+        main (Callable[[], None]): The script's normal entry point (reads sys.argv and prints `key : value` lines)
+    """
+
+    requests = sys.stdin.buffer
+    # keep the real stdout for responses and send any other writes to fd 1 (e.g., from child processes) to stderr
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), 'wb')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    script = sys.argv[0]
+
+    while True:
+        request = read_frame(requests)
+        if request is None:
+            return
+        sys.argv = [script] + [str(arg) for arg in request.get('args', [])]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        returncode = 0
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                main()
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+        write_frame(responses, {"returncode": returncode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()})
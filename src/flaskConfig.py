@@ -20,6 +20,14 @@ class FlaskConfig:
     SECRET_KEY = 'NOT_A_TOKEN'
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(globals.basedir,'challenge.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool shared by request threads, the grading executor, cron and scheduler jobs.
+    # SQLite pragmas (WAL, synchronous, busy_timeout, ...) are applied per connection in app.databaseHelpers.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "connect_args": {"timeout": 30, "check_same_thread": False}
+    }
     FLASK_APP = 'app.py'
     BASE_DIR = globals.basedir
     STATIC_FOLDER = f"{globals.basedir}/app/main/static"
@@ -22,7 +22,7 @@ def runShutdown() -> None:
         # 1. Shutdown challengeServer and dnsmasq service
         cmd1 = subprocess.run(f"sudo systemctl stop challengeServer.service dnsmasq.service", shell=True, capture_output=True)
         # 2. Delete dnsmasq lease file to ensure correct Static IP assignment at boot. Delete challengeServer SQL DB file to ensure it doesn't get committed in bad state.
-        cmd2 = subprocess.run(f"sudo rm /var/lib/misc/dnsmasq.leases /home/user/challengeServer/challenge.db", shell=True, capture_output=True)
+        cmd2 = subprocess.run(f"sudo rm -f /var/lib/misc/dnsmasq.leases /home/user/challengeServer/challenge.db /home/user/challengeServer/challenge.db-wal /home/user/challengeServer/challenge.db-shm", shell=True, capture_output=True)
         logOutput = {
             "services": {
                 "stdout": cmd1.stdout.decode('utf-8'),